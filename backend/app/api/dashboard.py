@@ -7,7 +7,11 @@ from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
+from app.core.http_clients import http_clients
+from app.core.rate_limiter import rate_limiters
 from app.models.models import AIAnalysis, Assignment, Manager, Ticket
+from app.services.geocoder import geocode_cache_stats
+from app.services.llm_processing import llm_cache_stats
 
 router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
@@ -72,3 +76,24 @@ async def manager_load(db: AsyncSession = Depends(get_db)):
         }
         for m in managers
     ]
+
+
+@router.get("/http")
+async def http_pool_stats():
+    """Outbound HTTP pool statistics per upstream host."""
+    return http_clients.stats()
+
+
+@router.get("/rate-limits")
+async def rate_limit_stats():
+    """Adaptive concurrency window, pauses and latency per rate-limited upstream."""
+    return rate_limiters.stats()
+
+
+@router.get("/cache")
+async def cache_stats():
+    """Hit/miss metrics of the result caches."""
+    return {
+        "geocoding": geocode_cache_stats(),
+        "llm": llm_cache_stats(),
+    }
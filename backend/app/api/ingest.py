@@ -1,8 +1,10 @@
 """
 API routes for CSV data ingestion (T2).
   POST /api/ingest/tickets        — upload tickets CSV
+  POST /api/ingest/tickets/stream — upload a large tickets CSV, parsed and inserted in chunks
   POST /api/ingest/managers       — upload managers CSV
   POST /api/ingest/business-units — upload business_units CSV
+Manager and business unit uploads mark the online router's roster stale.
 """
 
 import logging
@@ -20,8 +22,9 @@ from app.models.schemas import (
     IngestTicketsResponse, IngestManagersResponse, IngestBusinessUnitsResponse,
 )
 from app.services.csv_parser import (
-    ingest_tickets_csv, ingest_managers_csv, ingest_business_units_csv,
+    ingest_tickets_csv, ingest_tickets_stream, ingest_managers_csv, ingest_business_units_csv,
 )
+from app.services.routing_engine import routing_engine
 
 router = APIRouter(prefix="/api/ingest", tags=["Ingestion"])
 settings = get_settings()
@@ -73,6 +76,37 @@ async def upload_tickets_csv(
     )
 
 
+@router.post("/tickets/stream", response_model=IngestTicketsResponse)
+async def upload_tickets_csv_stream(
+    file: UploadFile = File(..., description="Tickets CSV file"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Upload a large tickets CSV. The upload is spooled to disk and read back in chunks,
+    so memory does not grow with file size; progress is sent as "ingestion" SSE events.
+    """
+    _validate_csv(file)
+    max_bytes = settings.MAX_STREAM_UPLOAD_SIZE_MB * 1024 * 1024
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(413, f"File too large. Max {settings.MAX_STREAM_UPLOAD_SIZE_MB}MB.")
+
+    try:
+        result = await ingest_tickets_stream(db, file.file, file.filename or "tickets.csv")
+    except Exception as e:
+        log.exception("Streaming ingest of tickets failed")
+        raise HTTPException(500, detail=f"Upload failed: {str(e)}") from e
+
+    return IngestTicketsResponse(
+        batch_id=_uuid.UUID(result["batch_id"]),
+        total_rows=result["total_rows"],
+        processed_rows=result["processed_rows"],
+        failed_rows=result["failed_rows"],
+        message=f"Ingested {result['processed_rows']}/{result['total_rows']} tickets "
+                f"({result['failed_rows']} failed)",
+        errors=result["errors"],
+    )
+
+
 @router.post("/managers", response_model=IngestManagersResponse)
 async def upload_managers_csv(
     file: UploadFile = File(..., description="Managers CSV file"),
@@ -86,6 +120,8 @@ async def upload_managers_csv(
         raise HTTPException(413, f"File too large. Max {settings.MAX_UPLOAD_SIZE_MB}MB.")
 
     result = await ingest_managers_csv(db, contents, file.filename)
+    await db.commit()  # the router reloads from committed rows
+    routing_engine.invalidate()
 
     return IngestManagersResponse(
         total_imported=result["total_imported"],
@@ -107,6 +143,8 @@ async def upload_business_units_csv(
         raise HTTPException(413, f"File too large. Max {settings.MAX_UPLOAD_SIZE_MB}MB.")
 
     result = await ingest_business_units_csv(db, contents, file.filename)
+    await db.commit()  # the router reloads from committed rows
+    routing_engine.invalidate()
 
     return IngestBusinessUnitsResponse(
         total_imported=result["total_imported"],
@@ -0,0 +1,76 @@
+"""
+API routes for online routing of single tickets.
+  POST /api/routing/ticket — route one ticket with the warm in-memory router
+  POST /api/routing/reload — re-read managers, offices and loads from the database
+  GET  /api/routing/stats  — roster size, routing counters, write-back queue
+"""
+
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.models.models import Assignment, Ticket
+from app.models.schemas import RouteTicketRequest, RouteTicketResponse
+from app.services.routing_engine import routing_engine
+
+log = logging.getLogger("app.api.routing")
+router = APIRouter(prefix="/api/routing", tags=["Routing"])
+
+
+@router.post("/ticket", response_model=RouteTicketResponse)
+async def route_ticket(body: RouteTicketRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Assign one ticket to the least-loaded eligible manager. With ticket_id the
+    load is booked and the Assignment row is stored asynchronously, shortly after the
+    response; a ticket is assigned once (409 afterwards). Without ticket_id it is a
+    preview that books nothing.
+    """
+    if body.ticket_id is not None:
+        found = await db.scalar(select(Ticket.id).where(Ticket.id == body.ticket_id))
+        if found is None:
+            raise HTTPException(404, "Ticket not found")
+        assigned = await db.scalar(select(Assignment.id).where(Assignment.ticket_id == body.ticket_id).limit(1))
+        if assigned is not None or routing_engine.is_unsaved(body.ticket_id):
+            raise HTTPException(409, "Ticket already assigned")
+    ticket = {
+        "type": body.ticket_type,
+        "segment": body.segment,
+        "language_label": body.language_label,
+        "latitude": body.latitude,
+        "longitude": body.longitude,
+        "priority": {"final": body.priority},
+    }
+    try:
+        assignment = await routing_engine.route(ticket, ticket_id=body.ticket_id)
+    except Exception as e:
+        log.exception("Online routing failed")
+        raise HTTPException(503, detail=f"Routing unavailable: {e}") from e
+    if assignment is None:  # a concurrent request routed it first
+        raise HTTPException(409, "Ticket already assigned")
+
+    return RouteTicketResponse(
+        ticket_id=body.ticket_id,
+        manager_id=assignment.get("manager_id"),
+        manager_name=assignment.get("manager_name"),
+        office=assignment.get("office"),
+        difficulty=assignment.get("difficulty"),
+        manager_load_after=assignment.get("manager_load_after"),
+        explanation=assignment["explanation"],
+        skipped=assignment.get("skipped", False),
+        geo_note=ticket.get("_geo_filter_note"),
+        skill_relaxation=ticket.get("_skill_relaxation"),
+    )
+
+
+@router.post("/reload")
+async def reload_routing():
+    await routing_engine.reload()
+    return routing_engine.stats()
+
+
+@router.get("/stats")
+async def routing_stats():
+    return routing_engine.stats()
@@ -0,0 +1,183 @@
+"""
+Cache building blocks shared by services:
+- LRUCache: in-memory LRU with per-entry TTL and hit/miss counters
+- WriteBehindQueue: collects rows and persists them in batches from a background task
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+log = logging.getLogger("fire.cache")
+
+# Returned by LRUCache.get on a miss, so that None can be cached as a value.
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded LRU; entries expire `ttl_s` seconds after they were set."""
+
+    def __init__(self, maxsize: int, ttl_s: float | None = None):
+        self.maxsize = max(1, maxsize)
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not MISSING
+
+    def peek(self, key: Hashable) -> Any:
+        """Like get, but without touching recency or counters."""
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            return MISSING
+        return value
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_s: float | None = None):
+        ttl = self.ttl_s if ttl_s is None else ttl_s
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable | None = None):
+        """Drop one key, or everything when key is None."""
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+class WriteBehindQueue:
+    """
+    Buffers rows in memory and hands them to `flush_fn` in batches of up to `batch_size`,
+    at least every `interval_s` seconds. A failed batch goes back to the head of the
+    queue and is tried again on the next flush, up to `retries` times; after that its
+    rows are dropped (and counted). The default of no retries suits data that can
+    always be recomputed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[list], Awaitable[None]],
+        batch_size: int = 200,
+        interval_s: float = 2.0,
+        retries: int = 0,
+    ):
+        self.name = name
+        self._flush_fn = flush_fn
+        self.batch_size = max(1, batch_size)
+        self.interval_s = interval_s
+        self.retries = max(0, retries)
+        self._attempts = 0  # failed attempts of the batch at the head of the queue
+        self._pending: list = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._lock = asyncio.Lock()
+        self.flushed = 0
+        self.failed = 0
+        self.retried = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def put(self, row: Any):
+        self._pending.append(row)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    await self._flush_fn(batch)
+                    self.flushed += len(batch)
+                except Exception as e:
+                    if self._attempts < self.retries:
+                        self._attempts += 1
+                        self._pending[:0] = batch
+                        self.retried += len(batch)
+                        log.warning(
+                            "[CACHE] %s: failed to persist %d rows (attempt %d, will retry): %s",
+                            self.name, len(batch), self._attempts, e,
+                        )
+                        return
+                    self.failed += len(batch)
+                    log.warning("[CACHE] %s: failed to persist %d rows: %s", self.name, len(batch), e)
+                self._attempts = 0
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if not self.running:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name=f"write-behind:{self.name}")
+
+    async def stop(self):
+        """Let the background task finish its current batch, then persist whatever is left."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        # Each failing flush uses up one retry, so this ends once the rows are stored or dropped.
+        while self._pending:
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "running": self.running,
+        }
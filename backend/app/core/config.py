@@ -20,12 +20,46 @@ class Settings(BaseSettings):
     OPENROUTER_API_KEY: str = ""
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     OPENROUTER_MODEL: str = "google/gemini-2.0-flash-001"
+    # Short text-only tickets packed into one classification request (1 = one request per ticket)
+    LLM_BATCH_SIZE: int = 5
+    LLM_BATCH_MAX_CHARS: int = 1500
+
+    # ── OpenRouter rate control (AIMD window shared by every LLM caller) ──
+    OPENROUTER_INITIAL_CONCURRENCY: int = 5
+    OPENROUTER_MIN_CONCURRENCY: int = 1
+    OPENROUTER_MAX_CONCURRENCY: int = 64
+    OPENROUTER_MAX_RPS: float = 0.0  # token bucket on top of the window; 0 = no fixed cap
+    # Shrink the window when latency exceeds this multiple of the best observed
+    OPENROUTER_LATENCY_TOLERANCE: float = 2.0
+
+    # ── LLM result cache (memory LRU + llm_result_cache table) ──
+    LLM_CACHE_SIZE: int = 50_000
+    LLM_CACHE_TTL_S: int = 30 * 24 * 3600
+    LLM_CACHE_FLUSH_SIZE: int = 200
+    LLM_CACHE_FLUSH_INTERVAL_S: float = 2.0
 
     # ── 2GIS Geocoding ──
     TWOGIS_API_KEY: str = ""
 
+    # ── Geocoding cache (memory LRU + geocoding_cache table) ──
+    GEOCODE_CACHE_SIZE: int = 100_000
+    GEOCODE_CACHE_TTL_S: int = 30 * 24 * 3600
+    GEOCODE_NEGATIVE_TTL_S: int = 6 * 3600
+    GEOCODE_CACHE_FLUSH_SIZE: int = 200
+    GEOCODE_CACHE_FLUSH_INTERVAL_S: float = 2.0
+    # Concurrent "<city>, <country>" lookups when the country is missing; Nominatim calls
+    # among them still queue on the nominatim rate limiter
+    GEOCODE_CIS_FANOUT: int = 3
+    # Nominatim usage policy: one request at a time, at most 1 per second
+    NOMINATIM_MAX_RPS: float = 1.0
+
     # ── Spam filter ──
     SPAM_THRESHOLD: float = 0.95
+    # A trained local classifier decides alone below LOW (not spam) and from HIGH up (spam);
+    # tickets in between go to the LLM
+    SPAM_LOCAL_LOW: float = 0.10
+    SPAM_LOCAL_HIGH: float = 0.90
+    SPAM_MODEL_PATH: str = ""  # trained weights; empty = app/data/spam_model.json if present
 
     # ── App ──
     APP_ENV: str = "development"
@@ -34,9 +68,42 @@ class Settings(BaseSettings):
     APP_PORT: int = 8000
     SECRET_KEY: str = "change-me-in-production"
 
+    # ── Outbound HTTP (shared pools per host) ──
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_MAX_KEEPALIVE_PER_HOST: int = 10
+    HTTP_KEEPALIVE_EXPIRY_S: float = 30.0
+    HTTP2_ENABLED: bool = False  # needs the optional 'h2' package
+
+    # ── Pipeline (DB mode) ──
+    # Tickets in flight at once; each holds its own DB session, so keep below the pool size.
+    PIPELINE_CONCURRENCY: int = 8
+    PIPELINE_SPAM_CONCURRENCY: int = 8
+    PIPELINE_LLM_CONCURRENCY: int = 5
+    PIPELINE_GEO_CONCURRENCY: int = 10
+    PIPELINE_ROUTING_CONCURRENCY: int = 4
+    # Finished tickets are written in bulk: every N tickets or every interval, whichever first
+    PIPELINE_FLUSH_TICKETS: int = 200
+    PIPELINE_FLUSH_INTERVAL_S: float = 2.0
+
+    # ── CPU-bound stages (priority scoring, routing) ──
+    CPU_WORKERS: int = 0  # process pool size; 0 = one per core, 1 = no pool (a thread instead)
+    # Smaller batches are routed in one piece; larger ones are sharded by office cluster
+    ROUTING_PARALLEL_MIN_TICKETS: int = 5000
+
+    # ── Online routing (RoutingEngine, /api/routing) ──
+    ROUTING_FLUSH_SIZE: int = 200
+    ROUTING_FLUSH_INTERVAL_S: float = 1.0
+    # Flushes a failed batch of assignments gets (one per interval) before it is dropped
+    ROUTING_FLUSH_RETRIES: int = 5
+
     # ── Upload ──
     UPLOAD_DIR: str = "/app/uploads"
     MAX_UPLOAD_SIZE_MB: int = 50
+    # Tickets per multi-row INSERT (each chunk in its own savepoint)
+    INGEST_CHUNK_ROWS: int = 2000
+    # Streaming upload (/api/ingest/tickets/stream): rows parsed per chunk and size cap
+    INGEST_STREAM_CHUNK_ROWS: int = 20_000
+    MAX_STREAM_UPLOAD_SIZE_MB: int = 2048
 
     # ── Business rules ──
     EXPANSION_COUNTRIES: list[str] = [
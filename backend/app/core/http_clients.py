@@ -0,0 +1,161 @@
+"""
+Application-scoped pooled HTTP clients.
+One keep-alive httpx.AsyncClient per upstream host (OpenRouter, 2GIS, Nominatim),
+created in main.lifespan and shared by every service that talks to that host.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+from app.core.config import get_settings
+
+log = logging.getLogger("fire.http")
+
+
+@dataclass
+class _HostSpec:
+    base_url: str
+    timeout: float
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _HostStats:
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    total_latency_ms: float = 0.0
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that counts requests, errors and latency for one host."""
+
+    def __init__(self, stats: _HostStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.requests += 1
+        self._stats.in_flight += 1
+        start = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self._stats.errors += 1
+            raise
+        finally:
+            self._stats.in_flight -= 1
+            self._stats.total_latency_ms += (time.perf_counter() - start) * 1000
+        if response.status_code >= 500 or response.status_code == 429:
+            self._stats.errors += 1
+        return response
+
+    def pool_stats(self) -> dict:
+        connections = list(getattr(self._pool, "connections", []) or [])
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+        }
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HTTPClientRegistry:
+    """Named, lazily created AsyncClients with per-host connection limits."""
+
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._transports: dict[str, _InstrumentedTransport] = {}
+        self._stats: dict[str, _HostStats] = {}
+
+    @staticmethod
+    def _specs() -> dict[str, _HostSpec]:
+        settings = get_settings()
+        return {
+            "openrouter": _HostSpec(settings.OPENROUTER_BASE_URL, timeout=45.0),
+            "2gis": _HostSpec("https://catalog.api.2gis.com", timeout=10.0),
+            "nominatim": _HostSpec(
+                "https://nominatim.openstreetmap.org",
+                timeout=10.0,
+                headers={"User-Agent": "FIRE-Geocoder/1.0"},
+            ),
+        }
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        specs = self._specs()
+        if name not in specs:
+            raise KeyError(f"Unknown HTTP host: {name}")
+        spec = specs[name]
+        settings = get_settings()
+
+        http2 = settings.HTTP2_ENABLED
+        if http2 and not _http2_available():
+            log.warning("[HTTP] HTTP2_ENABLED but 'h2' is not installed — using HTTP/1.1 for %s", name)
+            http2 = False
+
+        stats = self._stats.setdefault(name, _HostStats())
+        transport = _InstrumentedTransport(
+            stats,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_S,
+            ),
+        )
+        client = httpx.AsyncClient(
+            base_url=spec.base_url,
+            timeout=spec.timeout,
+            headers=spec.headers,
+            transport=transport,
+        )
+        self._transports[name] = transport
+        self._clients[name] = client
+        log.info("[HTTP] client %s ready (http2=%s)", name, http2)
+        return client
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Return the shared client for `name`, creating it on first use (e.g. outside the API)."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+        return client
+
+    async def startup(self):
+        for name in self._specs():
+            self.get(name)
+
+    async def shutdown(self):
+        for name, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                log.warning("[HTTP] failed to close client %s: %s", name, e)
+        self._clients.clear()
+        self._transports.clear()
+
+    def stats(self) -> dict:
+        out = {}
+        for name, s in self._stats.items():
+            transport = self._transports.get(name)
+            out[name] = {
+                "requests": s.requests,
+                "errors": s.errors,
+                "in_flight": s.in_flight,
+                "avg_latency_ms": round(s.total_latency_ms / s.requests, 1) if s.requests else None,
+                "pool": transport.pool_stats() if transport else None,
+            }
+        return out
+
+
+# Singleton
+http_clients = HTTPClientRegistry()
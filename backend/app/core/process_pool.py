@@ -0,0 +1,52 @@
+"""
+Application-scoped process pool for CPU-bound pipeline stages (priority scoring,
+routing shards). Created on first use, shut down in main.lifespan. With a single
+worker there is no pool and the work runs in a thread instead, which still keeps
+the event loop free between GIL switches.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+
+from app.core.config import get_settings
+
+log = logging.getLogger("fire.process_pool")
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def cpu_workers() -> int:
+    return get_settings().CPU_WORKERS or os.cpu_count() or 1
+
+
+def get_process_pool() -> ProcessPoolExecutor | None:
+    global _pool
+    if _pool is None and cpu_workers() > 1:
+        # spawn, not fork: the parent runs an event loop and DB/HTTP pools that must not be copied.
+        _pool = ProcessPoolExecutor(max_workers=cpu_workers(), mp_context=multiprocessing.get_context("spawn"))
+        log.info("process pool started with %d workers", cpu_workers())
+    return _pool
+
+
+async def run_cpu(fn: Callable[..., Any], *args) -> Any:
+    """Run fn(*args) in the process pool (arguments and result are pickled), else in a thread."""
+    pool = get_process_pool()
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+async def run_cpu_many(fn: Callable[..., Any], arg_lists: list[tuple]) -> list[Any]:
+    """fn over several argument tuples at once, results in input order."""
+    return list(await asyncio.gather(*(run_cpu(fn, *args) for args in arg_lists)))
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,266 @@
+"""
+Adaptive client-side rate control for upstream APIs.
+
+AdaptiveLimiter combines
+- an AIMD concurrency window: +1/limit per healthy response, x0.5 on 429,
+  x0.75 on 5xx/timeouts, x0.9 when latency drifts well above the best of the
+  recent responses;
+- a pause honouring Retry-After (or an exponential pause when the header is absent);
+- an optional token bucket capping requests per second.
+
+One instance per upstream account is shared by every service calling it, so the
+window converges on what the provider actually accepts.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from app.core.config import get_settings
+
+log = logging.getLogger("fire.ratelimit")
+
+_MAX_PAUSE_S = 60.0
+# Latency baseline = fastest of this many recent responses, so one lucky response
+# does not keep the window shrinking once the provider settles at a slower pace.
+_BASELINE_SAMPLES = 50
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After as seconds; accepts both delta-seconds and an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class _Slot:
+    """Outcome of one request, filled in by the caller via observe()."""
+
+    def __init__(self):
+        self.status: int | None = None
+        self.retry_after: float | None = None
+
+    def observe(self, response: httpx.Response):
+        self.status = response.status_code
+        if response.status_code == 429 or response.status_code >= 500:
+            self.retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial: int = 5,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        max_rps: float = 0.0,
+        latency_tolerance: float = 2.0,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.max_rps = max_rps
+        self._tokens = max(1.0, max_rps)
+        self._refilled_at = time.monotonic()
+
+        self.in_flight = 0
+        self.waiting = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_throttles = 0
+        # Per request kind: short spam checks and full analyses have very different latencies.
+        self._ewma_ms: dict[str, float] = {}
+        self._recent_ms: dict[str, deque[float]] = {}
+        self._cond = asyncio.Condition()
+
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+
+    # ── admission ──
+
+    def _refill(self, now: float):
+        if self.max_rps > 0:
+            self._tokens = min(max(1.0, self.max_rps), self._tokens + (now - self._refilled_at) * self.max_rps)
+        self._refilled_at = now
+
+    def _wait_time(self, now: float) -> float | None:
+        """None when a request may start now, else seconds to wait (0 = until notified)."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.in_flight >= int(self.limit):
+            return 0.0
+        if self.max_rps > 0:
+            self._refill(now)
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self.max_rps
+        return None
+
+    async def acquire(self):
+        async with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    wait = self._wait_time(time.monotonic())
+                    if wait is None:
+                        break
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=wait or None)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.waiting -= 1
+            if self.max_rps > 0:
+                self._tokens -= 1.0
+            self.in_flight += 1
+
+    async def release(self, kind: str, latency_s: float, slot: _Slot, failed: bool, completed: bool = True):
+        """Free the slot; `completed=False` (no response, no transport failure) leaves the window alone."""
+        async with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if slot.status == 429:
+                self._on_throttle(now, slot.retry_after)
+            elif failed or (slot.status is not None and slot.status >= 500):
+                self._on_error(now, slot.retry_after)
+            elif completed or slot.status is not None:
+                self._on_success(now, kind, latency_s * 1000)
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, kind: str = "default"):
+        """
+        Hold one in-flight slot around a request:
+
+            async with limiter.slot("analysis") as slot:
+                response = await client.post(...)
+                slot.observe(response)
+        """
+        await self.acquire()
+        slot = _Slot()
+        start = time.monotonic()
+        failed = False
+        completed = True
+        try:
+            yield slot
+        except (httpx.TimeoutException, httpx.TransportError):
+            failed = True
+            raise
+        except BaseException:
+            # Cancelled, or the caller's own code raised: that says nothing about the
+            # upstream unless a response was observed first.
+            completed = False
+            raise
+        finally:
+            await self.release(kind, time.monotonic() - start, slot, failed, completed)
+
+    # ── AIMD ──
+
+    def _decrease(self, now: float, factor: float) -> bool:
+        # At most one decrease per round trip, so one burst of failures halves once.
+        window_s = max(self._ewma_ms.values(), default=1000.0) / 1000
+        if now - self._last_decrease < window_s:
+            return False
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self._last_decrease = now
+        return True
+
+    def _on_success(self, now: float, kind: str, latency_ms: float):
+        self.successes += 1
+        self._consecutive_throttles = 0
+        ewma = self._ewma_ms.get(kind)
+        ewma = latency_ms if ewma is None else 0.8 * ewma + 0.2 * latency_ms
+        self._ewma_ms[kind] = ewma
+        recent = self._recent_ms.setdefault(kind, deque(maxlen=_BASELINE_SAMPLES))
+        recent.append(latency_ms)
+        if ewma > self.latency_tolerance * min(recent):
+            self._decrease(now, 0.9)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def _on_throttle(self, now: float, retry_after: float | None):
+        self.throttled += 1
+        self._consecutive_throttles += 1
+        self._decrease(now, 0.5)
+        pause = retry_after if retry_after is not None else 0.5 * 2 ** min(self._consecutive_throttles, 7)
+        pause = min(pause, _MAX_PAUSE_S)
+        if now + pause > self._paused_until:
+            self._paused_until = now + pause
+            log.warning("[RATE] %s throttled — pausing %.1fs, window %.1f", self.name, pause, self.limit)
+
+    def _on_error(self, now: float, retry_after: float | None):
+        self.errors += 1
+        self._decrease(now, 0.75)
+        if retry_after is not None:
+            self._paused_until = max(self._paused_until, now + min(retry_after, _MAX_PAUSE_S))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "paused_for_s": round(max(0.0, self._paused_until - now), 1),
+            "max_rps": self.max_rps or None,
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "latency_ms": {
+                kind: {"ewma": round(ewma, 1), "best": round(min(self._recent_ms[kind]), 1)}
+                for kind, ewma in self._ewma_ms.items()
+            },
+        }
+
+
+class RateLimiterRegistry:
+    """Named limiters, created on first use from settings."""
+
+    def __init__(self):
+        self._limiters: dict[str, AdaptiveLimiter] = {}
+
+    def get(self, name: str) -> AdaptiveLimiter:
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            settings = get_settings()
+            if name == "openrouter":
+                limiter = AdaptiveLimiter(
+                    name,
+                    initial=settings.OPENROUTER_INITIAL_CONCURRENCY,
+                    min_limit=settings.OPENROUTER_MIN_CONCURRENCY,
+                    max_limit=settings.OPENROUTER_MAX_CONCURRENCY,
+                    max_rps=settings.OPENROUTER_MAX_RPS,
+                    latency_tolerance=settings.OPENROUTER_LATENCY_TOLERANCE,
+                )
+            elif name == "nominatim":
+                # A fixed policy rather than a capacity to discover: the window stays at 1.
+                limiter = AdaptiveLimiter(name, initial=1, max_limit=1, max_rps=settings.NOMINATIM_MAX_RPS)
+            else:
+                raise KeyError(f"Unknown rate-limited upstream: {name}")
+            self._limiters[name] = limiter
+        return limiter
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+# Singleton
+rate_limiters = RateLimiterRegistry()
@@ -10,7 +10,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import get_settings
-from app.api import ingest, tickets, processing, dashboard
+from app.core.http_clients import http_clients
+from app.core.process_pool import shutdown_process_pool
+from app.services.geo_filtering import start_geo_backfill
+from app.services.geocoder import start_geocode_cache, stop_geocode_cache
+from app.services.llm_processing import start_llm_cache, stop_llm_cache
+from app.services.routing_engine import start_routing_engine, stop_routing_engine
+from app.api import ingest, tickets, processing, dashboard, routing
 
 settings = get_settings()
 
@@ -27,8 +33,18 @@ logging.getLogger("pipeline").setLevel(logging.DEBUG)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("F.I.R.E. Engine starting up...")
+    await http_clients.startup()
+    await start_geocode_cache()
+    await start_llm_cache()
+    await start_geo_backfill()
+    await start_routing_engine()
     yield
     print("F.I.R.E. Engine shutting down...")
+    await stop_routing_engine()
+    await stop_llm_cache()
+    await stop_geocode_cache()
+    await http_clients.shutdown()
+    shutdown_process_pool()
 
 
 app = FastAPI(
@@ -50,6 +66,7 @@ app.include_router(ingest.router)
 app.include_router(tickets.router)
 app.include_router(processing.router)
 app.include_router(dashboard.router)
+app.include_router(routing.router)
 
 
 @app.get("/health", tags=["System"])
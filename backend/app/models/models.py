@@ -197,6 +197,7 @@ class Ticket(Base):
     text_length_times_age = Column(Double)
     id_count_of_user = Column(Integer, default=0)
     assigned_manager_id = Column(UUID(as_uuid=True), ForeignKey("managers.id"))
+    batch_id = Column(UUID(as_uuid=True), index=True)  # the BatchUpload that ingested the row
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -253,7 +254,7 @@ class Assignment(Base):
     __tablename__ = "assignments"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    ticket_id = Column(UUID(as_uuid=True), ForeignKey("tickets.id", ondelete="CASCADE"), nullable=False)
+    ticket_id = Column(UUID(as_uuid=True), ForeignKey("tickets.id", ondelete="CASCADE"), nullable=False, unique=True)
     manager_id = Column(UUID(as_uuid=True), ForeignKey("managers.id"), nullable=False)
     business_unit_id = Column(UUID(as_uuid=True), ForeignKey("business_units.id"))
     explanation = Column(Text)
@@ -300,6 +301,17 @@ class GeocodingCache(Base):
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
 
 
+class LLMResultCache(Base):
+    __tablename__ = "llm_result_cache"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    cache_key = Column(String(64), nullable=False, unique=True)
+    model = Column(String(200))
+    prompt_version = Column(String(32), nullable=False)
+    result = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+
 class BatchUpload(Base):
     __tablename__ = "batch_uploads"
 
@@ -310,6 +322,8 @@ class BatchUpload(Base):
     failed_rows = Column(Integer, default=0)
     status = Column(String(50), default="pending")
     error_log = Column(JSONB, default=[])
+    # Pipeline progress, written in the same transaction as the tickets it counts
+    checkpoint = Column(JSONB)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     completed_at = Column(DateTime(timezone=True))
 
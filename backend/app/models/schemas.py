@@ -158,6 +158,30 @@ class AssignmentResponse(BaseModel):
         from_attributes = True
 
 
+class RouteTicketRequest(BaseModel):
+    """A single ticket for the online router; ticket_id makes the assignment persistent."""
+    ticket_id: Optional[uuid.UUID] = None
+    ticket_type: str = "Консультация"
+    segment: str = "Mass"
+    language_label: str = "RU"
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    priority: float = 0.0
+
+
+class RouteTicketResponse(BaseModel):
+    ticket_id: Optional[uuid.UUID] = None
+    manager_id: Optional[uuid.UUID] = None
+    manager_name: Optional[str] = None
+    office: Optional[str] = None
+    difficulty: Optional[float] = None
+    manager_load_after: Optional[float] = None
+    explanation: str
+    skipped: bool = False
+    geo_note: Optional[str] = None
+    skill_relaxation: Optional[str] = None
+
+
 class ManagerCandidateResponse(BaseModel):
     """Manager with distance to ticket (for routing candidates)."""
     manager: ManagerResponse
@@ -195,6 +219,7 @@ class BatchUploadResponse(BaseModel):
     failed_rows: int = 0
     status: str = "pending"
     error_log: list = Field(default_factory=list)
+    checkpoint: Optional[dict] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
 
@@ -2,6 +2,8 @@
 Step 1: 3 csv parsing - managers.csv, business_units.csv, and tickets.csv.
 Async ingest_* functions for API: parse from bytes and insert into DB.
 """
+import asyncio
+import codecs
 import io
 import re
 import csv
@@ -10,13 +12,17 @@ import time
 import uuid
 from datetime import datetime, date
 from collections import Counter
-from typing import Any
+from typing import Any, BinaryIO
 
 import chardet
+import numpy as np
 import pandas as pd
-from sqlalchemy import select
+from sqlalchemy import bindparam, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import get_settings
+from app.core.sse_manager import sse_manager
+from app.services.geo_filtering import geo_point, office_location
 from app.models.models import (
     BatchUpload,
     BusinessUnit,
@@ -43,30 +49,56 @@ COUNTRY_NORMALIZE = {
 }
 
 
+_SNIFF_BYTES = 64 * 1024
+_MIN_SNIFF_CONFIDENCE = 0.8
+
+
+def _detect_encoding(data: bytes, complete: bool = True) -> tuple[str, str]:
+    """
+    Encoding of a CSV buffer plus the path that decided it, cheapest first:
+    BOM -> strict UTF-8 over the buffer -> chardet on a bounded prefix -> chardet
+    on everything. `complete=False` means `data` is only the start of a stream,
+    so it may end mid-character and there is nothing more to scan.
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig", "bom"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(data, final=complete)
+        return "utf-8", "utf8-strict"
+    except UnicodeDecodeError:
+        pass
+
+    guess = chardet.detect(data[:_SNIFF_BYTES])
+    enc = guess.get("encoding")
+    if enc and (not complete or guess.get("confidence", 0) >= _MIN_SNIFF_CONFIDENCE):
+        if not complete or len(data) <= _SNIFF_BYTES:
+            return enc, "prefix"
+        try:
+            data.decode(enc)
+            return enc, "prefix"
+        except (UnicodeDecodeError, LookupError):
+            pass
+    if not complete:
+        return enc or "utf-8", "prefix"
+    return chardet.detect(data).get("encoding") or "utf-8", "full-scan"
+
+
 def _read_csv(path: str) -> pd.DataFrame:
     with open(path, "rb") as f:
         raw = f.read()
-    enc = chardet.detect(raw).get("encoding") or "utf-8"
-    text = raw.decode(enc, errors="replace")
-    df = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
-    df.columns = [c.strip() for c in df.columns]
-    return df
+    return _read_csv_from_bytes(raw)
 
 
 def _read_csv_from_bytes(contents: bytes) -> pd.DataFrame:
     t0 = time.perf_counter()
-    log.info("[CSV] _read_csv_from_bytes: %d bytes, detecting encoding...", len(contents))
-    enc = chardet.detect(contents).get("encoding") or "utf-8"
+    enc, how = _detect_encoding(contents)
     t1 = time.perf_counter()
-    log.info("[CSV] _read_csv_from_bytes: encoding=%s (%.2fs), decoding...", enc, t1 - t0)
     text = contents.decode(enc, errors="replace")
-    t2 = time.perf_counter()
-    log.info("[CSV] _read_csv_from_bytes: decoded %d chars (%.2fs), pandas read_csv...", len(text), t2 - t1)
     df = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
-    t3 = time.perf_counter()
-    log.info("[CSV] _read_csv_from_bytes: pandas done, %d rows x %d cols (%.2fs)", len(df), len(df.columns), t3 - t2)
     df.columns = [c.strip() for c in df.columns]
-    log.info("[CSV] _read_csv_from_bytes: total %.2fs", t3 - t0)
+    t2 = time.perf_counter()
+    log.info("[CSV] read %d bytes: encoding=%s via %s (%.3fs), %d rows x %d cols (%.2fs)",
+             len(contents), enc, how, t1 - t0, len(df), len(df.columns), t2 - t1)
     return df
 
 
@@ -232,18 +264,23 @@ def parse_managers(path: str | None = None, data: bytes | None = None) -> list[d
     return managers
 
 
-def parse_tickets(path: str | None = None, data: bytes | None = None) -> list[dict]:
-    t0 = time.perf_counter()
-    log.info("[CSV] parse_tickets: start")
-    if data is not None:
-        df = _read_csv_from_bytes(data)
-    elif path:
-        df = _read_csv(path)
-    else:
-        raise ValueError("Either path or data must be provided")
+_TICKET_TEXT_COLUMNS = (
+    "guid", "gender", "description", "attachments", "segment",
+    "country", "region", "city", "street", "house",
+)
 
-    t1 = time.perf_counter()
-    log.info("[CSV] parse_tickets: df loaded (%.2fs), building col_map...", t1 - t0)
+# Ticket keys parse_tickets leaves as None for the pipeline stages to fill.
+_LATER_STAGE_KEYS = (
+    "is_spam", "spam_probability", "spam_reason", "type", "language_label", "sentiment",
+    "sentiment_confidence", "summary", "latitude", "longitude", "priority", "priority_breakdown",
+    "assigned_manager_id", "assigned_manager_name", "assigned_office", "routing_explanation",
+)
+
+_DATE_FORMATS = ["%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d",
+                 "%d.%m.%Y", "%m/%d/%Y %H:%M", "%m/%d/%Y"]
+
+
+def _rename_ticket_columns(df: pd.DataFrame) -> pd.DataFrame:
     col_map = {}
     for col in df.columns:
         c = col.lower()
@@ -269,68 +306,136 @@ def parse_tickets(path: str | None = None, data: bytes | None = None) -> list[di
             col_map[col] = "street"
         elif "дом" in c or "house" in c:
             col_map[col] = "house"
-    df = df.rename(columns=col_map)
+    return df.rename(columns=col_map)
+
+
+def _clean_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Column-wise _clean: stripped strings, None for blanks and missing columns."""
+    if name not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    col = df[name]
+    if isinstance(col, pd.DataFrame):  # several source columns mapped to one name: first wins
+        col = col.iloc[:, 0]
+    # Strip each distinct value once: most ticket columns repeat a handful of values.
+    codes, uniques = pd.factorize(col.astype(str))
+    stripped = pd.Series(uniques, dtype=object).str.strip()
+    cleaned = stripped.where(stripped != "", None).to_numpy(dtype=object)
+    return pd.Series(cleaned[codes], index=df.index, dtype=object)
+
+
+def _birth_columns(values: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """
+    Column-wise _parse_date + _compute_age, worked out once per distinct value. Each
+    known format is tried on the still unparsed values, then one coerced free-form pass
+    (the scalar fallback). Values neither handles (years out of the datetime64 range)
+    go through _parse_date itself, so edge cases behave exactly as before.
+    """
+    today = date.today()
+    codes, uniques = pd.factorize(values)  # None -> -1
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+    text = uniques.astype(str)
+    for fmt in _DATE_FORMATS:
+        # fmt[2] is the date separator; values without it cannot match, so skip them.
+        pending = parsed.isna() & text.str.contains(fmt[2], regex=False)
+        if pending.any():
+            parsed[pending] = pd.to_datetime(uniques[pending], format=fmt, errors="coerce")
+    # A future year becomes this year, unless that date does not exist this year
+    # (29 Feb): _parse_date then falls through to the free-form pass.
+    future = parsed.dt.year > today.year
+    leap = today.year % 4 == 0 and (today.year % 100 != 0 or today.year % 400 == 0)
+    feb29 = future & (parsed.dt.month == 2) & (parsed.dt.day == 29)
+    if not leap:
+        parsed[feb29] = pd.NaT
+        future &= ~feb29
+    parsed[future] = parsed[future].apply(lambda d: d.replace(year=today.year))
+
+    free = parsed.isna()
+    if free.any():
+        loose = pd.to_datetime(uniques[free], format="mixed", errors="coerce")
+        loose[loose.dt.year > today.year] = pd.Timestamp(today.year, 1, 1)
+        parsed[free] = loose
+
+    births = [d.date() if not pd.isna(d) else None for d in parsed.tolist()]
+    for pos in parsed.isna().to_numpy().nonzero()[0].tolist():
+        births[pos] = _parse_date(uniques[pos])
+    ages = [_compute_age(b) for b in births]
+
+    # Broadcast back to the rows; code -1 (blank) picks the trailing None.
+    births.append(None)
+    ages.append(None)
+    births = pd.Series(np.array(births, dtype=object)[codes], index=values.index, dtype=object)
+    ages = pd.Series(np.array(ages, dtype=object)[codes], index=values.index, dtype=object)
+    return births, ages
+
+
+def _ticket_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalized ticket columns computed on whole columns at once: cleaned text fields,
+    birth_date (date or None), age, normalized country, default segment and guid_count.
+    Shared by parse_tickets and the bulk ingest path.
+    """
+    df = _rename_ticket_columns(df)
+    frame = pd.DataFrame(index=df.index)
+    for name in _TICKET_TEXT_COLUMNS:
+        frame[name] = _clean_column(df, name)
+
+    frame["birth_date"], frame["age"] = _birth_columns(_clean_column(df, "birth_date"))
+
+    lowered = frame["country"].str.lower()
+    normalized = lowered.map(COUNTRY_NORMALIZE)
+    frame["country"] = normalized.where(normalized.notna(), frame["country"]).astype(object)
+    frame["segment"] = frame["segment"].where(frame["segment"].notna(), "Mass")
+
+    if "guid" in df.columns:
+        raw_guid = df["guid"].astype(str).str.strip()
+        counts = raw_guid.map(raw_guid.value_counts())
+        frame["guid_count"] = counts.where(frame["guid"].notna(), 0).astype(int)
+    else:
+        frame["guid_count"] = 0
+    return frame
 
-    guid_series = df.get("guid")
-    guid_counts = {}
-    if guid_series is not None:
-        guid_counts = dict(Counter(guid_series.str.strip()))
+
+def parse_tickets(path: str | None = None, data: bytes | None = None) -> list[dict]:
+    t0 = time.perf_counter()
+    if data is not None:
+        df = _read_csv_from_bytes(data)
+    elif path:
+        df = _read_csv(path)
+    else:
+        raise ValueError("Either path or data must be provided")
+
+    t1 = time.perf_counter()
+    frame = _ticket_frame(df)
+    n = len(frame)
+    text = {name: frame[name].tolist() for name in _TICKET_TEXT_COLUMNS}
+    columns = {
+        "ticket_id": range(1, n + 1),
+        "csv_row_index": range(n),
+        "guid": text["guid"],
+        "gender": text["gender"],
+        "birth_date": [str(d) if d is not None else None for d in frame["birth_date"].tolist()],
+        "age": frame["age"].tolist(),
+        "description": text["description"],
+        "attachments": text["attachments"],
+        "segment": text["segment"],
+        "country": text["country"],
+        "region": text["region"],
+        "city": text["city"],
+        "street": text["street"],
+        "house": text["house"],
+        "guid_count": frame["guid_count"].tolist(),
+    }
+    # Filled by later stages (None = not yet processed)
+    pending = dict.fromkeys(_LATER_STAGE_KEYS)
+    # zip over column lists: DataFrame.to_dict("records") boxes every object cell and is ~3x slower.
+    keys = list(columns)
+    tickets = [dict(zip(keys, values), **pending) for values in zip(*columns.values())]
 
     t2 = time.perf_counter()
-    log.info("[CSV] parse_tickets: col_map done, iterating %d rows...", len(df))
-    tickets = []
-    for idx, row in df.iterrows():
-        guid = _clean(row.get("guid"))
-        birth_date = _parse_date(row.get("birth_date"))
-        age = _compute_age(birth_date)
-        description = _clean(row.get("description"))
-        attachments = _parse_attachments(row.get("attachments"))
-        country = _normalize_country(row.get("country"))
-        segment = _clean(row.get("segment")) or "Mass"
-
-        tickets.append({
-            "ticket_id": idx + 1,
-            "csv_row_index": idx,
-            "guid": guid,
-            "gender": _clean(row.get("gender")),
-            "birth_date": str(birth_date) if birth_date else None,
-            "age": age,
-            "description": description,
-            "attachments": attachments,
-            "segment": segment,
-            "country": country,
-            "region": _clean(row.get("region")),
-            "city": _clean(row.get("city")),
-            "street": _clean(row.get("street")),
-            "house": _clean(row.get("house")),
-            "guid_count": guid_counts.get(guid, 0) if guid else 0,
-
-            # Filled by later stages (None = not yet processed)
-            "is_spam": None,
-            "spam_probability": None,
-            "spam_reason": None,
-            "type": None,
-            "language_label": None,
-            "sentiment": None,
-            "sentiment_confidence": None,
-            "summary": None,
-            "latitude": None,
-            "longitude": None,
-            "priority": None,
-            "priority_breakdown": None,
-            "assigned_manager_id": None,
-            "assigned_manager_name": None,
-            "assigned_office": None,
-            "routing_explanation": None,
-        })
-        if (idx + 1) % 10 == 0 or idx == 0:
-            log.info("[CSV] parse_tickets: row %d/%d", idx + 1, len(df))
-
-    t3 = time.perf_counter()
-    elapsed = t3 - t2
-    rate = len(df) / elapsed if elapsed > 0 and len(df) > 0 else 0
-    log.info("[CSV] parse_tickets: iterrows loop done in %.2fs (%.0f rows/s)", elapsed, rate)
-    log.info("[CSV] parse_tickets: total %.2fs, parsed %d tickets", t3 - t0, len(tickets))
+    rate = len(tickets) / (t2 - t1) if t2 > t1 and tickets else 0
+    log.info("[CSV] parse_tickets: %d tickets in %.2fs (read=%.2fs, columnar=%.2fs, %.0f rows/s)",
+             len(tickets), t2 - t0, t1 - t0, t2 - t1, rate)
     return tickets
 
 
@@ -355,7 +460,15 @@ async def ingest_business_units_csv(
             existing = await db.execute(select(BusinessUnit).where(BusinessUnit.name == name))
             if existing.scalar_one_or_none():
                 continue
-            bu = BusinessUnit(name=name, address=_clean(u.get("address")))
+            coords = office_location(name)
+            lat, lon = coords if coords else (None, None)
+            bu = BusinessUnit(
+                name=name,
+                address=_clean(u.get("address")),
+                latitude=lat,
+                longitude=lon,
+                geo_point=geo_point(lat, lon),
+            )
             db.add(bu)
             total += 1
         except Exception as e:
@@ -409,6 +522,73 @@ def _segment_to_enum(segment: Any) -> SegmentEnum:
     return MODEL_SEGMENT_MAP.get(key, MODEL_SEGMENT_MAP.get("mass", SegmentEnum.Mass))
 
 
+def _ticket_rows(frame: pd.DataFrame, batch_id: uuid.UUID, row_offset: int = 0) -> list[dict]:
+    """Insert parameters for the tickets table, one dict per frame row."""
+    cols = {name: frame[name].tolist() for name in _TICKET_TEXT_COLUMNS}
+    births = frame["birth_date"].tolist()
+    ages = frame["age"].tolist()
+    guid_counts = frame["guid_count"].tolist()
+    segments = {s: _segment_to_enum(s) for s in set(cols["segment"])}
+
+    rows = []
+    for i in range(len(frame)):
+        attachments = cols["attachments"][i]
+        rows.append({
+            "id": uuid.uuid4(),
+            "csv_row_index": row_offset + i,
+            "guid": cols["guid"][i],
+            "gender": cols["gender"][i],
+            "birth_date": births[i],
+            "age": ages[i],
+            "description": cols["description"][i],
+            "attachments": [a.strip() for a in attachments.split(",") if a.strip()] if attachments else [],
+            "segment": segments[cols["segment"][i]],
+            "country": cols["country"][i],
+            "region": cols["region"][i],
+            "city": cols["city"][i],
+            "street": cols["street"][i],
+            "house": cols["house"][i],
+            "status": TicketStatusEnum.ingested,
+            "id_count_of_user": guid_counts[i],
+            "batch_id": batch_id,
+        })
+    return rows
+
+
+async def _bulk_insert_tickets(
+    db: AsyncSession,
+    rows: list[dict],
+    errors: list[str],
+    chunk_size: int | None = None,
+) -> tuple[int, int]:
+    """
+    Multi-row INSERTs of `chunk_size` tickets, each chunk in its own savepoint.
+    A failing chunk is retried row by row so only the bad rows are lost and counted.
+    Returns (inserted, failed).
+    """
+    chunk_size = chunk_size or get_settings().INGEST_CHUNK_ROWS
+    stmt = insert(Ticket)
+    inserted = failed = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            async with db.begin_nested():
+                await db.execute(stmt, chunk)
+            inserted += len(chunk)
+            continue
+        except Exception as e:
+            log.warning("[INGEST] chunk at row %d failed (%s), retrying row by row", chunk[0]["csv_row_index"], e)
+        for row in chunk:
+            try:
+                async with db.begin_nested():
+                    await db.execute(stmt, [row])
+                inserted += 1
+            except Exception as e:
+                failed += 1
+                errors.append(f"Row {row['csv_row_index']}: {e}")
+    return inserted, failed
+
+
 async def ingest_tickets_csv(
     db: AsyncSession,
     contents: bytes,
@@ -418,12 +598,18 @@ async def ingest_tickets_csv(
     t0 = time.perf_counter()
     log.info("[INGEST] ingest_tickets_csv: start, %d bytes", len(contents))
     errors: list[str] = []
-    tickets_data = parse_tickets(data=contents)
+    batch_id = uuid.uuid4()
+
+    def _parse() -> list[dict]:
+        return _ticket_rows(_ticket_frame(_read_csv_from_bytes(contents)), batch_id)
+
+    rows = await asyncio.to_thread(_parse)
     t1 = time.perf_counter()
-    log.info("[INGEST] ingest_tickets_csv: parse_tickets done in %.2fs (%d rows)", t1 - t0, len(tickets_data))
+    log.info("[INGEST] ingest_tickets_csv: parsed %d rows in %.2fs", len(rows), t1 - t0)
     batch = BatchUpload(
+        id=batch_id,
         filename=filename,
-        total_rows=len(tickets_data),
+        total_rows=len(rows),
         processed_rows=0,
         failed_rows=0,
         status="pending",
@@ -431,57 +617,137 @@ async def ingest_tickets_csv(
     )
     db.add(batch)
     await db.flush()
+
+    processed, failed = await _bulk_insert_tickets(db, rows, errors)
     t2 = time.perf_counter()
-    log.info("[INGEST] ingest_tickets_csv: batch created, inserting %d tickets...", len(tickets_data))
-    processed = 0
-    failed = 0
-    for row in tickets_data:
-        try:
-            birth_date = None
-            if row.get("birth_date"):
-                birth_date = _parse_date(row["birth_date"])
-            segment = _segment_to_enum(row.get("segment"))
-            attachments = row.get("attachments")
-            if isinstance(attachments, str) and attachments:
-                attachments = [a.strip() for a in attachments.split(",") if a.strip()]
-            else:
-                attachments = attachments or []
-            ticket = Ticket(
-                csv_row_index=row.get("csv_row_index"),
-                guid=_clean(row.get("guid")),
-                gender=_clean(row.get("gender")),
-                birth_date=birth_date,
-                age=_safe_int(row.get("age")) if row.get("age") is not None else None,
-                description=_clean(row.get("description")),
-                attachments=attachments,
-                segment=segment,
-                country=_clean(row.get("country")),
-                region=_clean(row.get("region")),
-                city=_clean(row.get("city")),
-                street=_clean(row.get("street")),
-                house=_clean(row.get("house")),
-                status=TicketStatusEnum.ingested,
-                id_count_of_user=row.get("guid_count") or 0,
-            )
-            db.add(ticket)
-            processed += 1
-            if processed % 10 == 0:
-                log.info("[INGEST] ingest_tickets_csv: inserted %d/%d tickets", processed, len(tickets_data))
-        except Exception as e:
-            failed += 1
-            errors.append(f"Row {row.get('csv_row_index', '?')}: {e}")
-    t3 = time.perf_counter()
-    log.info("[INGEST] ingest_tickets_csv: DB insert loop done in %.2fs (%d processed, %d failed)", t3 - t2, processed, failed)
+    rate = processed / (t2 - t1) if t2 > t1 else 0
+    log.info("[INGEST] ingest_tickets_csv: inserted %d tickets in %.2fs (%.0f rows/s, %d failed)",
+             processed, t2 - t1, rate, failed)
     batch.processed_rows = processed
     batch.failed_rows = failed
     batch.status = "completed"
     batch.error_log = errors
     await db.flush()
-    t4 = time.perf_counter()
-    log.info("[INGEST] ingest_tickets_csv: total %.2fs (parse=%.2fs, insert=%.2fs)", t4 - t0, t1 - t0, t3 - t2)
+    log.info("[INGEST] ingest_tickets_csv: total %.2fs (parse=%.2fs, insert=%.2fs)", time.perf_counter() - t0, t1 - t0, t2 - t1)
+    return {
+        "batch_id": str(batch.id),
+        "total_rows": len(rows),
+        "processed_rows": processed,
+        "failed_rows": failed,
+        "errors": errors,
+    }
+
+
+async def ingest_tickets_stream(
+    db: AsyncSession,
+    fileobj: BinaryIO,
+    filename: str,
+    chunk_rows: int | None = None,
+) -> dict:
+    """
+    Streaming variant of ingest_tickets_csv for large uploads. The file is decoded
+    incrementally and parsed `chunk_rows` rows at a time (pandas in a worker thread);
+    each chunk is bulk-inserted before the next one is read, so memory stays flat
+    regardless of file size. Progress goes out as "ingestion" SSE events.
+
+    guid counts are global: rows whose guid reappears in a later chunk get their
+    id_count_of_user corrected once the whole file has been read.
+    """
+    settings = get_settings()
+    chunk_rows = chunk_rows or settings.INGEST_STREAM_CHUNK_ROWS
+    t0 = time.perf_counter()
+
+    prefix = fileobj.read(_SNIFF_BYTES)
+    fileobj.seek(0)
+    enc, how = _detect_encoding(prefix, complete=False)
+    log.info("[INGEST] ingest_tickets_stream: %s, encoding=%s (%s), %d rows per chunk",
+             filename, enc, how, chunk_rows)
+
+    text = io.TextIOWrapper(fileobj, encoding=enc, errors="replace", newline="")
+    reader = pd.read_csv(text, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+
+    batch = BatchUpload(
+        filename=filename,
+        total_rows=0,
+        processed_rows=0,
+        failed_rows=0,
+        status="ingesting",
+        error_log=[],
+    )
+    db.add(batch)
+    await db.flush()
+
+    def _next_chunk(offset: int) -> list[dict] | None:
+        df = next(reader, None)
+        if df is None:
+            return None
+        df.columns = [c.strip() for c in df.columns]
+        return _ticket_rows(_ticket_frame(df), batch.id, row_offset=offset)
+
+    errors: list[str] = []
+    guid_counts: Counter = Counter()
+    first_chunk: dict[str, int] = {}
+    spanning: set[str] = set()
+    total = processed = failed = 0
+    chunk_no = 0
+    try:
+        while True:
+            rows = await asyncio.to_thread(_next_chunk, total)
+            if rows is None:
+                break
+            for row in rows:
+                guid = row["guid"]
+                if guid is None:
+                    continue
+                guid_counts[guid] += 1
+                if first_chunk.setdefault(guid, chunk_no) != chunk_no:
+                    spanning.add(guid)
+            total += len(rows)
+            inserted, bad = await _bulk_insert_tickets(db, rows, errors)
+            processed += inserted
+            failed += bad
+            chunk_no += 1
+
+            batch.total_rows, batch.processed_rows, batch.failed_rows = total, processed, failed
+            await db.flush()
+            await sse_manager.send_update(
+                ticket_id=uuid.UUID(int=0),
+                batch_id=batch.id,
+                stage="ingestion",
+                status="in_progress",
+                message=f"Загружено {processed} обращений",
+                data={"chunk": chunk_no, "rows": total, "processed": processed, "failed": failed,
+                      "bytes_read": fileobj.tell()},
+            )
+    finally:
+        text.detach()
+
+    if spanning:
+        tickets = Ticket.__table__
+        await db.execute(
+            update(tickets)
+            .where(tickets.c.batch_id == batch.id, tickets.c.guid == bindparam("g"))
+            .values(id_count_of_user=bindparam("n")),
+            [{"g": g, "n": guid_counts[g]} for g in spanning],
+        )
+
+    batch.status = "completed"
+    batch.error_log = errors
+    await db.flush()
+    elapsed = time.perf_counter() - t0
+    log.info("[INGEST] ingest_tickets_stream: %d rows in %d chunks, %.2fs (%.0f rows/s), %d failed, %d guids fixed up",
+             total, chunk_no, elapsed, total / elapsed if elapsed else 0, failed, len(spanning))
+    await sse_manager.send_update(
+        ticket_id=uuid.UUID(int=0),
+        batch_id=batch.id,
+        stage="ingestion",
+        status="completed",
+        message=f"Загружено {processed} из {total}",
+        data={"chunk": chunk_no, "rows": total, "processed": processed, "failed": failed},
+    )
     return {
         "batch_id": str(batch.id),
-        "total_rows": len(tickets_data),
+        "total_rows": total,
         "processed_rows": processed,
         "failed_rows": failed,
         "errors": errors,
@@ -0,0 +1,215 @@
+"""
+Offline gazetteer: city name -> city-centre coordinates without any network call.
+
+Loads the bundled app/data/settlements.csv (Kazakhstan cities and towns, CIS capitals
+and large cities) into an in-memory index keyed by a transliteration-neutral "skeleton"
+of every name and alternative name, so that "Актау", "Aktau", "Ақтау" and "Aqtau" all
+hit the same entry. Misspellings within one edit are resolved through a
+symmetric-delete index (SymSpell-style), which keeps lookups to a few dict probes.
+"""
+
+import csv
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+log = logging.getLogger("fire.gazetteer")
+
+DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "settlements.csv"
+
+# Fuzzy matching is only attempted for keys at least this long — short names
+# ("Ош", "Шу", "Абай") are too close to each other to guess safely.
+_FUZZY_MIN_LEN = 5
+
+_PREFIX_RE = re.compile(
+    r"^(?:г|гор|город|с|село|п|пос|посёлок|поселок|пгт|ст|станция|аул|a|c)\.?\s+",
+    re.IGNORECASE,
+)
+_SEPARATORS_RE = re.compile(r"[\s\-‐–—_.,'’`ʼ\"]+")
+
+# Cyrillic (Russian and Kazakh letters) -> Latin; Latin input passes through unchanged.
+_CYR_TO_LAT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya", "ә": "a", "ғ": "g", "қ": "k", "ң": "n", "ө": "o", "ұ": "u", "ү": "u",
+    "һ": "h", "і": "i",
+}
+
+# Applied after transliteration to fold the spelling variants of the various
+# romanisation schemes (Kazakh Latin, BGN, passport) onto one form. Order matters.
+_LATIN_FOLDS = (
+    ("shch", "sh"), ("kh", "h"), ("gh", "g"), ("zh", "j"), ("dzh", "j"), ("dj", "j"),
+    ("ts", "c"), ("x", "h"), ("q", "k"), ("w", "v"), ("yo", "e"), ("ye", "e"),
+    ("ş", "sh"), ("ı", "i"), ("ă", "a"), ("ș", "s"), ("ț", "t"), ("ğ", "g"),
+    ("ç", "ch"), ("ö", "o"), ("ü", "u"), ("ä", "a"),
+    ("y", "i"), ("ii", "i"),
+)
+
+
+@dataclass(frozen=True)
+class Settlement:
+    name: str
+    country: str
+    region: str
+    lat: float
+    lon: float
+    rank: int  # row order in the dataset: lower wins when a name is ambiguous
+
+    @property
+    def coords(self) -> tuple[float, float]:
+        return (self.lat, self.lon)
+
+
+@lru_cache(maxsize=8192)
+def skeleton(name: str) -> str:
+    """Normalise a place name into the key used by the index."""
+    s = (name or "").strip().lower()
+    s = _PREFIX_RE.sub("", s)
+    s = "".join(_CYR_TO_LAT.get(ch, ch) for ch in s)
+    for src, dst in _LATIN_FOLDS:
+        s = s.replace(src, dst)
+    s = _SEPARATORS_RE.sub("", s)
+    # Doubled letters are the most common transliteration difference ("Kassym" / "Kasym").
+    return re.sub(r"(.)\1+", r"\1", s)
+
+
+def _deletes(key: str) -> set[str]:
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+class Gazetteer:
+    """In-memory name index over the settlements dataset."""
+
+    def __init__(self, settlements: list[Settlement], keys: list[list[str]]):
+        self.settlements = settlements
+        self._exact: dict[str, list[int]] = {}
+        self._fuzzy: dict[str, set[str]] = {}
+        for idx, names in enumerate(keys):
+            for key in names:
+                if not key:
+                    continue
+                bucket = self._exact.setdefault(key, [])
+                if idx not in bucket:
+                    bucket.append(idx)
+                if len(key) >= _FUZZY_MIN_LEN:
+                    for d in _deletes(key) | {key}:
+                        self._fuzzy.setdefault(d, set()).add(key)
+
+    @classmethod
+    def from_csv(cls, path: Path = DATA_PATH) -> "Gazetteer":
+        settlements: list[Settlement] = []
+        keys: list[list[str]] = []
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                names = [row["name"], *(n for n in (row.get("alt_names") or "").split("|") if n)]
+                settlements.append(Settlement(
+                    name=row["name"].strip(),
+                    country=row["country"].strip(),
+                    region=(row.get("region") or "").strip(),
+                    lat=float(row["lat"]),
+                    lon=float(row["lon"]),
+                    rank=len(settlements),
+                ))
+                keys.append([skeleton(n) for n in names])
+        log.info("[GAZETTEER] loaded %d settlements from %s", len(settlements), path.name)
+        return cls(settlements, keys)
+
+    def _candidates(self, key: str) -> list[int]:
+        exact = self._exact.get(key)
+        if exact:
+            return exact
+        if len(key) < _FUZZY_MIN_LEN:
+            return []
+        matched: set[str] = set()
+        for d in _deletes(key) | {key}:
+            matched |= self._fuzzy.get(d, set())
+        out: list[int] = []
+        for candidate in matched:
+            if _within_one_edit(key, candidate):
+                out.extend(self._exact[candidate])
+        return sorted(set(out))
+
+    def lookup(
+        self,
+        city: str,
+        country: str | None = None,
+        region: str | None = None,
+        countries: set[str] | None = None,
+    ) -> Settlement | None:
+        """
+        Best settlement for `city`. `country` / `countries` restrict the match;
+        `region` only breaks ties between same-named settlements.
+        """
+        key = skeleton(city)
+        if not key:
+            return None
+        hits = [self.settlements[i] for i in self._candidates(key)]
+        if country:
+            wanted = _country_key(country)
+            hits = [s for s in hits if _country_key(s.country) == wanted]
+        if countries is not None:
+            hits = [s for s in hits if s.country in countries]
+        if not hits:
+            return None
+        if region and len(hits) > 1:
+            region_key = skeleton(region)[:5]
+            same_region = [s for s in hits if region_key and skeleton(s.region).startswith(region_key)]
+            hits = same_region or hits
+        return min(hits, key=lambda s: s.rank)
+
+    def __len__(self) -> int:
+        return len(self.settlements)
+
+
+_COUNTRY_ALIASES = {
+    "kz": "казахстан", "кз": "казахстан", "рк": "казахстан", "kazakhstan": "казахстан",
+    "рф": "россия", "russia": "россия", "russian federation": "россия",
+    "uzbekistan": "узбекистан", "kyrgyzstan": "кыргызстан", "киргизия": "кыргызстан",
+    "tajikistan": "таджикистан", "turkmenistan": "туркменистан", "belarus": "беларусь",
+    "белоруссия": "беларусь", "ukraine": "украина", "moldova": "молдова",
+    "georgia": "грузия", "armenia": "армения", "azerbaijan": "азербайджан",
+}
+
+
+def _country_key(country: str) -> str:
+    c = country.strip().lower()
+    return skeleton(_COUNTRY_ALIASES.get(c, c))
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    """Loaded once per process; a missing or broken dataset just disables the gazetteer."""
+    try:
+        return Gazetteer.from_csv()
+    except (OSError, ValueError, KeyError) as e:
+        log.warning("[GAZETTEER] dataset unavailable (%s) — falling back to network geocoding", e)
+        return Gazetteer([], [])
+
+
+def lookup_city(
+    city: str,
+    country: str | None = None,
+    region: str | None = None,
+    countries: set[str] | None = None,
+) -> Settlement | None:
+    return get_gazetteer().lookup(city, country=country, region=region, countries=countries)
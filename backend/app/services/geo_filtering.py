@@ -2,14 +2,21 @@ import math
 import csv
 import os
 import logging
+import uuid
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Optional
 
-from sqlalchemy import select
+import numpy as np
+from geoalchemy2 import Geography
+from geoalchemy2.elements import WKTElement
+from sqlalchemy import cast, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import contains_eager
 
+from app.core.database import async_session_factory
 from app.models.models import Assignment, BusinessUnit, Manager, ManagerPositionEnum, Ticket
+from app.services.gazetteer import lookup_city
+from app.services.skills import can_serve, capability_mask, manager_caps, presence, requirement_mask
 
 log = logging.getLogger("pipeline.geo_filter")
 
@@ -20,6 +27,8 @@ _POSITION_DISPLAY = {
     ManagerPositionEnum.специалист: "Специалист",
 }
 
+_DB_RELAXATION_LABELS = {"language": "язык (KZ/ENG)", "position": "должность", "vip": "VIP"}
+
 OFFICE_COORDS: dict[str, tuple[float, float]] = {}
 
 KNOWN_CITY_COORDS = {
@@ -51,6 +60,23 @@ def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(a))
 
 
+def haversine_matrix(
+    lat1, lon1, lat2, lon2, dtype: type = np.float64,
+) -> np.ndarray:
+    """
+    Great-circle distances (km) between every point of (lat1, lon1) and every point of
+    (lat2, lon2), as a len(lat1) x len(lat2) matrix. Same formula as _haversine;
+    dtype=np.float32 halves the memory of the result (computation stays float64).
+    """
+    la1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    lo1 = np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    la2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    lo2 = np.radians(np.asarray(lon2, dtype=np.float64))[None, :]
+    a = np.sin((la2 - la1) / 2) ** 2 + np.cos(la1) * np.cos(la2) * np.sin((lo2 - lo1) / 2) ** 2
+    out = EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return out.astype(dtype, copy=False)
+
+
 def load_office_coords(business_units_csv_path: str | None = None):
     global OFFICE_COORDS
     OFFICE_COORDS = dict(KNOWN_CITY_COORDS)
@@ -79,53 +105,260 @@ def get_office_coords(office_name: str) -> tuple[float, float] | None:
     return OFFICE_COORDS.get(office_name.strip())
 
 
-def filter_by_geo(ticket: dict, managers: list[dict]) -> list[dict]:
-    ticket_lat = ticket.get("latitude")
-    ticket_lon = ticket.get("longitude")
+def _unit_vector(lat: float, lon: float) -> tuple[float, float, float]:
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
 
-    if ticket_lat is None or ticket_lon is None:
-        ticket["_geo_filter_note"] = "Координаты тикета отсутствуют — гео-фильтрация пропущена"
-        return managers
-
-    distances = []
-    for m in managers:
-        office = m.get("office", "").strip()
-        coords = get_office_coords(office)
-        if coords is None:
-            continue
-        dist = _haversine(ticket_lat, ticket_lon, coords[0], coords[1])
-        distances.append((m, dist))
-
-    if not distances:
-        ticket["_geo_filter_note"] = "Координаты офисов не найдены — гео-фильтрация пропущена"
-        return managers
 
-    distances.sort(key=lambda x: x[1])
-    min_dist = distances[0][1]
-    max_allowed = min_dist * 1.5
+def _chord(distance_km: float) -> float:
+    """Straight-line distance between unit vectors for a great-circle distance."""
+    return 2 * math.sin(min(distance_km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+class _KDTree:
+    """Static 3-d tree over office unit vectors; chord order equals great-circle order."""
+
+    def __init__(self, points: list[tuple[float, float, float]]):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, ids: list[int], depth: int):
+        if not ids:
+            return None
+        axis = depth % 3
+        ids.sort(key=lambda i: self.points[i][axis])
+        mid = len(ids) // 2
+        return (ids[mid], axis, self._build(ids[:mid], depth + 1), self._build(ids[mid + 1:], depth + 1))
+
+    def _dist2(self, i: int, q: tuple[float, float, float]) -> float:
+        p = self.points[i]
+        return (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+
+    def nearest(self, q: tuple[float, float, float]) -> int:
+        best = [-1, math.inf]
+
+        def visit(node):
+            if node is None:
+                return
+            i, axis, left, right = node
+            d2 = self._dist2(i, q)
+            if d2 < best[1]:
+                best[0], best[1] = i, d2
+            diff = q[axis] - self.points[i][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if diff * diff < best[1]:
+                visit(far)
+
+        visit(self.root)
+        return best[0]
+
+    def within(self, q: tuple[float, float, float], radius: float) -> list[int]:
+        r2 = radius * radius
+        out: list[int] = []
+
+        def visit(node):
+            if node is None:
+                return
+            i, axis, left, right = node
+            if self._dist2(i, q) <= r2:
+                out.append(i)
+            diff = q[axis] - self.points[i][axis]
+            if diff <= radius:
+                visit(left)
+            if diff >= -radius:
+                visit(right)
+
+        visit(self.root)
+        return out
+
 
-    if max_allowed < 50:
-        max_allowed = 50
+class OfficeIndex:
+    """
+    Managers grouped by office plus a spatial index over the offices, built once per
+    routing run. Geo queries then cost O(log offices) plus the size of the answer
+    instead of one haversine per manager. `locate` maps an office name to its
+    coordinates (default: get_office_coords).
+    """
 
-    eligible = [m for m, d in distances if d <= max_allowed]
+    def __init__(
+        self,
+        managers: list[dict],
+        locate: Callable[[str], tuple[float, float] | None] | None = None,
+    ):
+        locate = locate or get_office_coords
+        groups: dict[str, list[tuple[int, dict]]] = {}
+        coords: dict[str, tuple[float, float]] = {}
+        for pos, m in enumerate(managers):
+            office = (m.get("office") or "").strip()
+            c = locate(office)
+            if c is None:
+                continue
+            groups.setdefault(office, []).append((pos, m))
+            coords[office] = c
+        self.offices = list(groups)
+        self.groups = [groups[o] for o in self.offices]
+        self.coords = [coords[o] for o in self.offices]
+        self.manager_count = sum(len(g) for g in self.groups)
+        # Per office: which skill capability masks its managers cover (see skills.presence)
+        self.presence = [presence(manager_caps(m) for _, m in g) for g in self.groups]
+        self._tree = _KDTree([_unit_vector(*c) for c in self.coords])
+
+    def __len__(self) -> int:
+        return len(self.offices)
+
+    def distance_matrix(self, lats, lons, dtype: type = np.float64) -> np.ndarray:
+        """tickets x offices distances (km), columns in self.offices order."""
+        office_lat = [c[0] for c in self.coords]
+        office_lon = [c[1] for c in self.coords]
+        return haversine_matrix(lats, lons, office_lat, office_lon, dtype=dtype)
+
+    def eligible_mask(
+        self,
+        distances: np.ndarray,
+        slack: float = 1.5,
+        floor_km: float = 50.0,
+    ) -> np.ndarray:
+        """
+        distances_within for every row of a distance_matrix at once: tickets x offices
+        booleans. Rows without coordinates (NaN) come out all False.
+        """
+        with np.errstate(invalid="ignore"):
+            max_allowed = np.maximum(floor_km, distances.min(axis=1) * slack)
+            return distances <= max_allowed[:, None]
+
+    def distances_within(
+        self,
+        lat: float,
+        lon: float,
+        slack: float = 1.5,
+        floor_km: float = 50.0,
+        row: np.ndarray | None = None,
+    ):
+        """
+        Offices no farther than max(floor_km, slack x nearest-office distance).
+        Returns (nearest_km, max_allowed_km, [(office_idx, km)]), with no offices for a
+        non-finite point. `row` is this point's precomputed distance_matrix row; without
+        it the KD-tree prunes the offices.
+        """
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return math.nan, math.nan, []
+        if row is not None:
+            min_dist = float(row.min())
+            max_allowed = max(floor_km, min_dist * slack)
+            hits = np.flatnonzero(row <= max_allowed)
+            return min_dist, max_allowed, list(zip(hits.tolist(), row[hits].tolist()))
+        q = _unit_vector(lat, lon)
+        nearest = self._tree.nearest(q)
+        approx_min = _haversine(lat, lon, *self.coords[nearest])
+        reach = max(floor_km, approx_min * slack)
+        # A little headroom: the chord radius is only used to prune, exact distances decide.
+        hits = [(i, _haversine(lat, lon, *self.coords[i])) for i in self._tree.within(q, _chord(reach) + 1e-9)]
+        min_dist = min(d for _, d in hits)
+        max_allowed = max(floor_km, min_dist * slack)
+        return min_dist, max_allowed, [(i, d) for i, d in hits if d <= max_allowed]
+
+
+def office_location(office_name: str) -> tuple[float, float] | None:
+    """Office coordinates: the known office list first, then the offline gazetteer."""
+    coords = get_office_coords(office_name)
+    if coords is None:
+        settlement = lookup_city(office_name, country="Казахстан")
+        coords = settlement.coords if settlement else None
+    return coords
+
+
+def _finite_point(lat, lon) -> bool:
+    return lat is not None and lon is not None and math.isfinite(lat) and math.isfinite(lon)
+
+
+def geo_point(lat: float | None, lon: float | None) -> WKTElement | None:
+    """Value for a Geography(POINT, 4326) column; None when coordinates are missing."""
+    if not _finite_point(lat, lon):
+        return None
+    return WKTElement(f"POINT({float(lon)} {float(lat)})", srid=4326)
+
+
+def _point_sql(lat_expr, lon_expr):
+    return cast(func.ST_SetSRID(func.ST_MakePoint(lon_expr, lat_expr), 4326), Geography("POINT", srid=4326))
+
+
+async def backfill_geo_points(db: AsyncSession) -> dict:
+    """
+    Fill geo_point for rows that only have latitude/longitude (and locate business
+    units that have neither) so the PostGIS candidate search sees every office.
+    """
+    result = await db.execute(select(BusinessUnit).where(BusinessUnit.latitude.is_(None)))
+    located = 0
+    for bu in result.scalars().all():
+        coords = office_location(bu.name)
+        if coords:
+            bu.latitude, bu.longitude = coords
+            located += 1
+    await db.flush()
+
+    counts = {"business_units_located": located}
+    for model in (BusinessUnit, Ticket):
+        res = await db.execute(
+            update(model)
+            .where(model.geo_point.is_(None), model.latitude.is_not(None), model.longitude.is_not(None))
+            .values(geo_point=_point_sql(model.latitude, model.longitude))
+            .execution_options(synchronize_session=False)
+        )
+        counts[model.__tablename__] = res.rowcount
+    return counts
+
+
+async def start_geo_backfill():
+    """App startup: one backfill pass; a database without PostGIS just logs a warning."""
+    try:
+        async with async_session_factory() as session:
+            counts = await backfill_geo_points(session)
+            await session.commit()
+    except Exception as e:
+        log.warning("geo_point backfill skipped (%s)", e)
+        return
+    log.info("geo_point backfill: %s", counts)
+
+
+def geo_scope(
+    ticket: dict,
+    index: OfficeIndex,
+    distances: np.ndarray | None = None,
+) -> list[tuple[int, float]] | None:
+    """
+    Offices within 1.5x the nearest office distance (at least 50 km) as
+    [(office_idx, km)], or None when geo filtering does not apply and every manager
+    stays eligible. Records the explanation in ticket["_geo_filter_note"].
+    """
+    ticket_lat = ticket.get("latitude")
+    ticket_lon = ticket.get("longitude")
 
-    for m, d in distances:
-        m["_geo_distance_km"] = round(d, 1)
+    # NaN / inf (e.g. from an API client) count as missing: they match no office.
+    if not _finite_point(ticket_lat, ticket_lon):
+        ticket["_geo_filter_note"] = "Координаты тикета отсутствуют — гео-фильтрация пропущена"
+        return None
+    if not len(index):
+        ticket["_geo_filter_note"] = "Координаты офисов не найдены — гео-фильтрация пропущена"
+        return None
 
+    min_dist, max_allowed, offices = index.distances_within(ticket_lat, ticket_lon, row=distances)
+    # The nearest manager: closest office, then earliest in the manager list.
+    _, _, nearest = min((d, index.groups[i][0][0], index.groups[i][0][1]) for i, d in offices)
+    passed = sum(len(index.groups[i]) for i, _ in offices)
     ticket["_geo_filter_note"] = (
-        f"Ближайший офис: {distances[0][0].get('office')} ({min_dist:.0f} км). "
+        f"Ближайший офис: {nearest.get('office')} ({min_dist:.0f} км). "
         f"Порог: {max_allowed:.0f} км. "
-        f"Прошли: {len(eligible)}/{len(distances)} менеджеров."
+        f"Прошли: {passed}/{index.manager_count} менеджеров."
     )
-
-    return eligible
+    return offices
 
 
 @dataclass
 class ManagerCandidate:
     """Single candidate for routing: manager, their office, and distance to ticket."""
-    manager: Manager
-    business_unit: Optional[BusinessUnit]
+    manager: "Manager | ManagerSnapshot"
+    business_unit: "Optional[BusinessUnit | OfficeSnapshot]"
     distance_km: float
     office_name: Optional[str]
 
@@ -136,38 +369,65 @@ async def get_candidate_managers(
     max_km: float = 500.0,
 ) -> list[ManagerCandidate]:
     """
-    Load active managers with business units, compute distance from ticket coords,
-    filter by max_km, return sorted by distance (nearest first).
+    Active managers whose business unit lies within max_km of the ticket, nearest first.
+    Filtering and ordering run in PostGIS (ST_DWithin / ST_Distance on the GiST-indexed
+    business_units.geo_point), on the sphere like the in-memory haversine.
     """
-    if ticket.latitude is None or ticket.longitude is None:
+    if not _finite_point(ticket.latitude, ticket.longitude):
         return []
 
+    ticket_point = _point_sql(float(ticket.latitude), float(ticket.longitude))
+    distance_m = func.ST_Distance(BusinessUnit.geo_point, ticket_point, False)
     result = await db.execute(
-        select(Manager)
-        .where(Manager.is_active == True)
-        .options(selectinload(Manager.business_unit))
+        select(Manager, distance_m.label("distance_m"))
+        .join(Manager.business_unit)
+        .options(contains_eager(Manager.business_unit))
+        .where(
+            Manager.is_active == True,
+            func.ST_DWithin(BusinessUnit.geo_point, ticket_point, max_km * 1000.0, False),
+        )
+        .order_by(distance_m, Manager.id)
     )
-    managers = list(result.scalars().all())
-    candidates: list[ManagerCandidate] = []
-
-    for m in managers:
-        bu = m.business_unit
-        if bu is None or bu.latitude is None or bu.longitude is None:
-            continue
-        dist = _haversine(
-            float(ticket.latitude), float(ticket.longitude),
-            float(bu.latitude), float(bu.longitude),
+    return [
+        ManagerCandidate(
+            manager=m,
+            business_unit=m.business_unit,
+            distance_km=round(dist / 1000.0, 1),
+            office_name=m.business_unit.name,
         )
-        if dist <= max_km:
-            candidates.append(ManagerCandidate(
-                manager=m,
-                business_unit=bu,
-                distance_km=round(dist, 1),
-                office_name=bu.name,
-            ))
+        for m, dist in result.all()
+    ]
+
+
+@dataclass(frozen=True)
+class ManagerSnapshot:
+    """The Manager columns routing reads, copied out of the session."""
+    id: uuid.UUID
+    skills: tuple[str, ...]
+    position: Optional[ManagerPositionEnum]
+
 
-    candidates.sort(key=lambda c: c.distance_km)
-    return candidates
+@dataclass(frozen=True)
+class OfficeSnapshot:
+    """The BusinessUnit columns routing reads, copied out of the session."""
+    id: uuid.UUID
+    name: Optional[str]
+
+
+def snapshot_candidates(candidates: list[ManagerCandidate]) -> list[ManagerCandidate]:
+    """
+    Candidates without ORM instances. Those stay bound to the session that loaded them
+    (a rollback there expires them), so only snapshots may be shared between sessions.
+    """
+    return [
+        ManagerCandidate(
+            manager=ManagerSnapshot(c.manager.id, tuple(c.manager.skills or ()), c.manager.position),
+            business_unit=OfficeSnapshot(c.business_unit.id, c.business_unit.name) if c.business_unit else None,
+            distance_km=c.distance_km,
+            office_name=c.office_name,
+        )
+        for c in candidates
+    ]
 
 
 def filter_candidates_by_skills(
@@ -193,47 +453,22 @@ def filter_candidates_by_skills(
     if language_label in ("KZ", "ENG"):
         requirements.append("language")
 
-    eligible = []
-    for c in candidates:
-        m = c.manager
-        skills = list(m.skills or [])
-        pos = _POSITION_DISPLAY.get(m.position, "Специалист")
-        m_dict = {"skills": skills, "position": pos}
-        ok = True
-        if "vip" in requirements and "VIP" not in skills:
-            ok = False
-        if "position" in requirements and pos != "Главный специалист":
-            ok = False
-        if "language" in requirements and language_label not in skills:
-            ok = False
-        if ok:
-            eligible.append(c)
-
-    if eligible:
-        return eligible, None
-
-    # Relaxation: try dropping one requirement
-    for drop in ["language", "position", "vip"]:
-        if drop not in requirements:
-            continue
-        reduced = [r for r in requirements if r != drop]
-        eligible = []
-        for c in candidates:
-            m = c.manager
-            skills = list(m.skills or [])
-            pos = _POSITION_DISPLAY.get(m.position, "Специалист")
-            ok = True
-            if "vip" in reduced and "VIP" not in skills:
-                ok = False
-            if "position" in reduced and pos != "Главный специалист":
-                ok = False
-            if "language" in reduced and language_label not in skills:
-                ok = False
-            if ok:
-                eligible.append(c)
-        if eligible:
-            label = {"language": "язык (KZ/ENG)", "position": "должность", "vip": "VIP"}.get(drop, drop)
-            return eligible, f"Снято: {label}"
+    caps = [
+        capability_mask(c.manager.skills, _POSITION_DISPLAY.get(c.manager.position, "Специалист"))
+        for c in candidates
+    ]
+    present = presence(caps)
+
+    # Full requirements first, then relaxation: try dropping one requirement
+    ladder = [(requirements, None)] + [
+        ([r for r in requirements if r != drop], f"Снято: {_DB_RELAXATION_LABELS[drop]}")
+        for drop in ["language", "position", "vip"]
+        if drop in requirements
+    ]
+    for reduced, note in ladder:
+        required = requirement_mask(reduced, language_label)
+        if can_serve(present, required):
+            return [c for c, cap in zip(candidates, caps) if cap & required == required], note
     return candidates, "Все требования сняты"
 
 
@@ -244,15 +479,25 @@ async def assign_ticket_to_nearest(
     segment: Optional[str] = None,
     ticket_type: Optional[str] = None,
     language_label: Optional[str] = None,
+    sink=None,
+    candidate_cache: dict | None = None,
 ) -> tuple[Optional[Assignment], dict, dict]:
     """
     Find nearest manager: geo filter -> skills filter -> pick nearest.
-    Returns (assignment, geo_info, skills_info).
+    Returns (assignment, geo_info, skills_info). The Assignment is added to `sink`
+    (default: db). `candidate_cache` reuses candidate lists for repeated ticket
+    coordinates (geocoded city centres) within one batch; it holds snapshots, so
+    workers with their own sessions can share it.
     """
     geo_info = {"candidates": 0, "distance_km": None, "office_name": None, "note": "—"}
     skills_info = {"before": 0, "after": 0, "relaxation": None}
 
-    candidates = await get_candidate_managers(ticket, db, max_km=500.0)
+    key = (ticket.latitude, ticket.longitude)
+    candidates = candidate_cache.get(key) if candidate_cache is not None else None
+    if candidates is None:
+        candidates = await get_candidate_managers(ticket, db, max_km=500.0)
+        if candidate_cache is not None:
+            candidates = candidate_cache[key] = snapshot_candidates(candidates)
     geo_info["candidates"] = len(candidates)
     if not candidates:
         geo_info["note"] = "Нет офисов в радиусе 500 км"
@@ -281,6 +526,6 @@ async def assign_ticket_to_nearest(
             "office_name": geo_info["office_name"],
         },
     )
-    db.add(assignment)
+    (sink if sink is not None else db).add(assignment)
     ticket.assigned_manager_id = nearest.manager.id
     return assignment, geo_info, skills_info
\ No newline at end of file
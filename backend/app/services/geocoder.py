@@ -7,14 +7,24 @@ Processes the potentially "dirty" data for addresses to either:
 
 """
 
+import asyncio
 import logging
 
-import random
 import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
 
-import httpx
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from app.core.cache import MISSING, LRUCache, WriteBehindQueue
 from app.core.config import get_settings
+from app.core.database import async_session_factory
+from app.core.http_clients import http_clients
+from app.core.rate_limiter import rate_limiters
+from app.models.models import GeocodingCache
+from app.services.gazetteer import get_gazetteer, lookup_city
 
 log = logging.getLogger("fire.geocoder")
 
@@ -51,13 +61,150 @@ CIS_COUNTRIES = [
     "Грузия", "Армения", "Азербайджан", "Туркменистан",
 ]
 
+_CIS_SET = set(CIS_COUNTRIES)
+
 ASTANA_COORDS = (51.1694, 71.4491)
 ALMATY_COORDS = (43.2220, 76.8512)
 
 _KZ_NAMES = {"казахстан", "kazakhstan", "кз", "kz"}
 
-_cache: dict[str, tuple[float, float]] = {}
 _unknown_counter = 0
+_inflight: dict[str, asyncio.Future] = {}
+_inflight_waiters: Counter[asyncio.Future] = Counter()
+_cis_match_counts: Counter[str] = Counter()
+
+
+# ── Two-tier geocoding cache: in-memory LRU in front of the geocoding_cache table ──
+# Failed lookups are cached too (coords=None) so that re-runs do not hit the providers
+# again, but with a shorter TTL in case the failure was transient.
+
+_FAILED_PROVIDER = "failed"
+
+
+async def _persist_geocodes(rows: list[dict]):
+    # Last write wins within a batch: ON CONFLICT cannot touch the same row twice.
+    by_query = {r["address_query"]: r for r in rows}
+    stmt = pg_insert(GeocodingCache).values(list(by_query.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[GeocodingCache.address_query],
+        set_={
+            "latitude": stmt.excluded.latitude,
+            "longitude": stmt.excluded.longitude,
+            "provider": stmt.excluded.provider,
+            "created_at": stmt.excluded.created_at,
+        },
+    )
+    async with async_session_factory() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+_settings = get_settings()
+_cache = LRUCache(maxsize=_settings.GEOCODE_CACHE_SIZE, ttl_s=_settings.GEOCODE_CACHE_TTL_S)
+_cache_writer = WriteBehindQueue(
+    "geocoding_cache",
+    _persist_geocodes,
+    batch_size=_settings.GEOCODE_CACHE_FLUSH_SIZE,
+    interval_s=_settings.GEOCODE_CACHE_FLUSH_INTERVAL_S,
+)
+_db_tier = {"enabled": False, "loaded": 0, "hits": 0, "misses": 0}
+
+
+def _ttl_for(coords: tuple[float, float] | None) -> float:
+    settings = get_settings()
+    return settings.GEOCODE_CACHE_TTL_S if coords else settings.GEOCODE_NEGATIVE_TTL_S
+
+
+def _remaining_ttl(coords: tuple[float, float] | None, created_at: datetime | None) -> float:
+    ttl = _ttl_for(coords)
+    if created_at is None:
+        return ttl
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    age = (datetime.now(timezone.utc) - created_at).total_seconds()
+    return ttl - age
+
+
+def _row_coords(row: GeocodingCache) -> tuple[float, float] | None:
+    if row.latitude is None or row.longitude is None:
+        return None
+    return (float(row.latitude), float(row.longitude))
+
+
+async def start_geocode_cache():
+    """Bulk-load the persistent tier into memory and start the write-back task (app startup)."""
+    get_gazetteer()
+    try:
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(GeocodingCache).order_by(GeocodingCache.created_at.desc()).limit(_cache.maxsize)
+            )
+            rows = list(result.scalars().all())
+    except Exception as e:
+        log.warning("Geocoding cache: DB tier unavailable, memory only (%s)", e)
+        return
+    loaded = 0
+    for row in reversed(rows):
+        coords = _row_coords(row)
+        ttl = _remaining_ttl(coords, row.created_at)
+        if ttl > 0:
+            _cache.set(row.address_query, coords, ttl_s=ttl)
+            loaded += 1
+        if coords:
+            _count_cis_match(row.address_query)
+    _db_tier["enabled"] = True
+    _db_tier["loaded"] = loaded
+    _cache_writer.start()
+    log.info("Geocoding cache: loaded %d/%d persisted entries", loaded, len(rows))
+
+
+async def stop_geocode_cache():
+    await _cache_writer.stop()
+
+
+async def _lookup_db(query: str):
+    """Second tier: entries written by other workers since startup. Returns MISSING on a miss."""
+    if not _db_tier["enabled"]:
+        return MISSING
+    try:
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(GeocodingCache).where(GeocodingCache.address_query == query)
+            )
+            row = result.scalar_one_or_none()
+    except Exception as e:
+        log.warning("Geocoding cache: DB lookup failed for %r: %s", query, e)
+        return MISSING
+    if row is not None:
+        coords = _row_coords(row)
+        ttl = _remaining_ttl(coords, row.created_at)
+        if ttl > 0:
+            _db_tier["hits"] += 1
+            _cache.set(query, coords, ttl_s=ttl)
+            return coords
+    _db_tier["misses"] += 1
+    return MISSING
+
+
+def _remember(query: str, coords: tuple[float, float] | None, provider: str):
+    _cache.set(query, coords, ttl_s=_ttl_for(coords))
+    if _db_tier["enabled"]:
+        _cache_writer.put({
+            "id": uuid.uuid4(),
+            "address_query": query,
+            "latitude": coords[0] if coords else None,
+            "longitude": coords[1] if coords else None,
+            "provider": provider,
+            "created_at": datetime.now(timezone.utc),
+        })
+
+
+def geocode_cache_stats() -> dict:
+    return {
+        "memory": _cache.stats(),
+        "db": dict(_db_tier),
+        "write_back": _cache_writer.stats(),
+    }
 
 
 def _is_kazakhstan(country: str) -> bool:
@@ -82,13 +229,13 @@ async def _geocode_2gis(address: str) -> tuple[float, float] | None:
     if not settings.TWOGIS_API_KEY:
         return None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://catalog.api.2gis.com/3.0/items/geocode",
-                params={"q": address, "fields": "items.point", "key": settings.TWOGIS_API_KEY},
-            )
-            response.raise_for_status()
-            data = response.json()
+        client = http_clients.get("2gis")
+        response = await client.get(
+            "/3.0/items/geocode",
+            params={"q": address, "fields": "items.point", "key": settings.TWOGIS_API_KEY},
+        )
+        response.raise_for_status()
+        data = response.json()
         items = data.get("result", {}).get("items", [])
         if items:
             point = items[0].get("point")
@@ -101,14 +248,15 @@ async def _geocode_2gis(address: str) -> tuple[float, float] | None:
 
 async def _geocode_nominatim(address: str) -> tuple[float, float] | None:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        client = http_clients.get("nominatim")
+        async with rate_limiters.get("nominatim").slot("geocode") as slot:
             response = await client.get(
-                "https://nominatim.openstreetmap.org/search",
+                "/search",
                 params={"q": address, "format": "json", "limit": 1},
-                headers={"User-Agent": "FIRE-Geocoder/1.0"},
             )
-            response.raise_for_status()
-            data = response.json()
+            slot.observe(response)
+        response.raise_for_status()
+        data = response.json()
         if data:
             return (float(data[0]["lat"]), float(data[0]["lon"]))
     except Exception:
@@ -117,24 +265,58 @@ async def _geocode_nominatim(address: str) -> tuple[float, float] | None:
 
 
 async def _geocode(query: str) -> tuple[tuple[float, float] | None, str]:
-    if query in _cache:
-        return _cache[query], "cache"
+    cached = _cache.get(query)
+    if cached is MISSING:
+        cached = await _lookup_db(query)
+    if cached is not MISSING:
+        return cached, ("cache" if cached else _FAILED_PROVIDER)
+
+    # Single-flight: concurrent tickets asking for the same query share one provider lookup.
+    # The lookup is shielded from any one waiter being cancelled, but is cancelled itself
+    # once nobody waits for it any more (e.g. the losing countries of _search_city_in_cis).
+    task = _inflight.get(query)
+    if task is None:
+        task = asyncio.ensure_future(_geocode_providers(query))
+        _inflight[query] = task
+        task.add_done_callback(lambda t: _forget_inflight(query, t))
+    _inflight_waiters[task] += 1
+    try:
+        return await asyncio.shield(task)
+    finally:
+        _inflight_waiters[task] -= 1
+        if _inflight_waiters[task] <= 0:
+            del _inflight_waiters[task]
+            if not task.done():
+                _forget_inflight(query, task)  # a new caller must not join a cancelled lookup
+                task.cancel()
+
 
+def _forget_inflight(query: str, task: asyncio.Future):
+    if _inflight.get(query) is task:
+        del _inflight[query]
+
+
+async def _geocode_providers(query: str) -> tuple[tuple[float, float] | None, str]:
     coords = await _geocode_2gis(query)
     if coords:
-        _cache[query] = coords
+        _remember(query, coords, "2gis")
         return coords, "2gis"
 
     coords = await _geocode_nominatim(query)
     if coords:
-        _cache[query] = coords
+        _remember(query, coords, "nominatim")
         return coords, "nominatim"
 
-    return None, "failed"
+    _remember(query, None, _FAILED_PROVIDER)
+    return None, _FAILED_PROVIDER
 
 
 async def _geocode_city_center(country: str, region: str | None, city: str) -> tuple[tuple[float, float] | None, str, str]:
     clean = _clean_city(city)
+    hit = lookup_city(clean, country=country, region=region)
+    if hit:
+        return hit.coords, "gazetteer_city", f"Использован центр города {clean}"
+
     query = _build_query(country, region, clean)
     coords, provider = await _geocode(query)
     if coords:
@@ -152,16 +334,63 @@ async def _geocode_city_center(country: str, region: str | None, city: str) -> t
     return fallback, "city_fallback", f"Город {clean} не найден — назначен офис {city_name}"
 
 
+def _count_cis_match(query: str):
+    """
+    Count a resolved "<city>, <country>" query of _search_city_in_cis. Startup replays the
+    persisted cache through this, so the search order survives restarts.
+    """
+    _, sep, country = query.rpartition(", ")
+    if sep and country in _CIS_SET:
+        _cis_match_counts[country] += 1
+
+
+def _cis_search_order() -> list[str]:
+    """Most frequent historical match country first; ties keep CIS_COUNTRIES order."""
+    return sorted(CIS_COUNTRIES, key=lambda c: -_cis_match_counts[c])
+
+
 async def _search_city_in_cis(city: str) -> tuple[tuple[float, float] | None, str, str]:
+    """
+    Country is unknown: try the offline gazetteer, then query "<city>, <country>" for the
+    CIS countries concurrently (at most GEOCODE_CIS_FANOUT in flight), take the first hit
+    and cancel the rest.
+    """
     clean = _clean_city(city)
-    shuffled = CIS_COUNTRIES.copy()
-    random.shuffle(shuffled)
+    hit = lookup_city(clean, countries=_CIS_SET)
+    if hit:
+        _cis_match_counts[hit.country] += 1
+        return hit.coords, "gazetteer_cis", f"Страна не указана — город {clean} найден в {hit.country}"
+
+    order = _cis_search_order()
+    rank = {c: i for i, c in enumerate(order)}
+    remaining = iter(order)
+    pending: dict[asyncio.Future, str] = {}
+
+    def _launch_next() -> bool:
+        cis_country = next(remaining, None)
+        if cis_country is None:
+            return False
+        pending[asyncio.ensure_future(_geocode(f"{clean}, {cis_country}"))] = cis_country
+        return True
+
+    for _ in range(max(1, get_settings().GEOCODE_CIS_FANOUT)):
+        if not _launch_next():
+            break
 
-    for cis_country in shuffled:
-        query = f"{clean}, {cis_country}"
-        coords, provider = await _geocode(query)
-        if coords:
-            return coords, f"{provider}_cis", f"Страна не указана — город {clean} найден в {cis_country}"
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Several may finish together: prefer the better-ranked country.
+            for task in sorted(done, key=lambda t: rank[pending[t]]):
+                cis_country = pending.pop(task)
+                coords, provider = task.result() if not task.exception() else (None, _FAILED_PROVIDER)
+                if coords:
+                    _cis_match_counts[cis_country] += 1
+                    return coords, f"{provider}_cis", f"Страна не указана — город {clean} найден в {cis_country}"
+                _launch_next()
+    finally:
+        for task in pending:
+            task.cancel()
 
     return None, "cis_failed", f"Город {clean} не найден в странах СНГ"
 
@@ -221,19 +450,86 @@ async def geocode_ticket(ticket: dict) -> dict:
     return ticket
 
 
+# Providers whose result alternates per ticket (50/50 Astana/Almaty) — never fanned out.
+_PER_TICKET_PROVIDERS = {"international_5050", "city_fallback"}
+
+
+def _norm(value: str | None) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def _address_key(ticket: dict) -> tuple[str, ...]:
+    """
+    Canonical address key: same key => geocode_ticket takes the same branch and sends the
+    same provider queries. Fields stay positional so that a missing part never collides
+    with a present one.
+    """
+    country = (ticket.get("country") or "").strip()
+    city = (ticket.get("city") or "").strip()
+    return (
+        "kz" if country and _is_kazakhstan(country) else _norm(country),
+        _norm(ticket.get("region")),
+        _norm(_clean_city(city)) if city else "",
+        _norm(ticket.get("street")),
+        _norm(ticket.get("house")),
+    )
+
+
+def _copy_geo(source: dict, target: dict):
+    target["latitude"] = source.get("latitude")
+    target["longitude"] = source.get("longitude")
+    target["geo_provider"] = source.get("geo_provider")
+    target["geo_explanation"] = source.get("geo_explanation")
+    target["geo_latency_ms"] = 0
+
+
+def _fill_geo_error(ticket: dict, error: Exception):
+    ticket["latitude"] = None
+    ticket["longitude"] = None
+    ticket["geo_provider"] = "error"
+    ticket["geo_explanation"] = f"Ошибка: {error}"
+    ticket["geo_latency_ms"] = 0
+
+
 async def geocode_batch(tickets: list[dict], concurrency: int = 10) -> list[dict]:
-    import asyncio
+    """
+    Geocode a batch with address dedup: tickets are grouped by _address_key, one ticket per
+    group is geocoded and its result is copied to the rest of the group. External calls
+    therefore scale with the number of distinct addresses, not with the number of tickets.
+    """
     sem = asyncio.Semaphore(concurrency)
+    groups: dict[tuple[str, ...], list[dict]] = {}
 
-    async def _process(t: dict) -> dict:
+    for t in tickets:
         if t.get("is_spam"):
             t["latitude"] = None
             t["longitude"] = None
             t["geo_provider"] = "skipped"
             t["geo_explanation"] = "Спам — геокодирование пропущено"
             t["geo_latency_ms"] = 0
-            return t
-        async with sem:
-            return await geocode_ticket(t)
-
-    return list(await asyncio.gather(*[_process(t) for t in tickets]))
\ No newline at end of file
+            continue
+        groups.setdefault(_address_key(t), []).append(t)
+
+    async def _resolve(members: list[dict]):
+        first = members[0]
+        try:
+            async with sem:
+                await geocode_ticket(first)
+        except Exception as e:
+            log.error("row=%s GEO failed: %s", first.get("csv_row_index"), e)
+            for t in members:
+                _fill_geo_error(t, e)
+            return
+        for t in members[1:]:
+            if first.get("geo_provider") in _PER_TICKET_PROVIDERS:
+                # Provider queries are cached by now; this only redoes the office alternation.
+                try:
+                    await geocode_ticket(t)
+                except Exception as e:
+                    _fill_geo_error(t, e)
+            else:
+                _copy_geo(first, t)
+
+    await asyncio.gather(*[_resolve(members) for members in groups.values()])
+    log.info("Geocoded %d tickets via %d distinct addresses", sum(len(m) for m in groups.values()), len(groups))
+    return tickets
@@ -13,14 +13,26 @@ Processes the non-spam tickets to get:
 
 import asyncio
 import base64
+import contextlib
+import hashlib
 import json
 import logging
+import textwrap
 import time
+import uuid
+from datetime import datetime, timezone
 from pathlib import Path
 
 import httpx
+from sqlalchemy import delete, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from app.core.cache import MISSING, LRUCache, WriteBehindQueue
 from app.core.config import get_settings
+from app.core.database import async_session_factory
+from app.core.http_clients import http_clients
+from app.core.rate_limiter import rate_limiters
+from app.models.models import LLMResultCache
 
 log = logging.getLogger("fire.llm_analysis")
 
@@ -69,18 +81,8 @@ _IMAGE_EXTENSIONS = {
     ".webp": "image/webp",
 }
 
-ANALYSIS_PROMPT = """You are a ticket classification system for Freedom Finance (a financial broker in Kazakhstan).
-Analyze the following support ticket and return a JSON response.
-
-TICKET TEXT:
-{ticket_text}
-
-{attachment_context}
-
-CLIENT AGE: {age}
-CLIENT SEGMENT: {segment}
-
-INSTRUCTIONS:
+# Classification rules shared by the single-ticket and the packed multi-ticket prompts.
+_INSTRUCTIONS = """INSTRUCTIONS:
 
 1. **type** — classify into EXACTLY one of:
    - "Жалоба" (complaint — client unhappy about service quality, delays, errors)
@@ -115,9 +117,10 @@ INSTRUCTIONS:
 
 7. **needs_data_change** — 0 or 1. Set 1 if client needs personal data change (phone, email, password, documents). Example: "хотела изменить номер телефона" → 1.
 
-Respond with ONLY valid JSON:
-{{
-  "type": "...",
+"""
+
+# Fields of one result object, as shown to the model in the expected-output examples.
+_RESULT_FIELDS = """  "type": "...",
   "sentiment": "...",
   "sentiment_confidence": 0.85,
   "language_label": "...",
@@ -127,18 +130,67 @@ Respond with ONLY valid JSON:
   "summary": "...",
   "explanation": "...",
   "attachment_analysis": null,
-  "needs_data_change": 0
+  "needs_data_change": 0"""
+
+ANALYSIS_PROMPT = """You are a ticket classification system for Freedom Finance (a financial broker in Kazakhstan).
+Analyze the following support ticket and return a JSON response.
+
+TICKET TEXT:
+{ticket_text}
+
+{attachment_context}
+
+CLIENT AGE: {age}
+CLIENT SEGMENT: {segment}
+
+""" + _INSTRUCTIONS + """Respond with ONLY valid JSON:
+{{
+""" + _RESULT_FIELDS + """
+}}"""
+
+BATCH_ANALYSIS_PROMPT = """You are a ticket classification system for Freedom Finance (a financial broker in Kazakhstan).
+Analyze EACH of the following {count} support tickets independently and return a JSON response.
+Tickets do not influence each other: classify every ticket only by its own text, age and segment.
+
+{tickets_block}
+
+""" + _INSTRUCTIONS + """Respond with ONLY valid JSON: an object with a "results" array that holds exactly one
+object per ticket, each carrying the ticket "id" it answers:
+{{
+  "results": [
+    {{
+      "id": "t0",
+""" + textwrap.indent(_RESULT_FIELDS, "    ") + """
+    }}
+  ]
 }}"""
 
+# Part of every LLM cache key: any edit to the prompts changes it and orphans old entries.
+PROMPT_VERSION = hashlib.sha256((ANALYSIS_PROMPT + BATCH_ANALYSIS_PROMPT).encode()).hexdigest()[:16]
 
-async def _call_openrouter(messages: list[dict], model: str | None = None) -> dict:
+BATCH_TICKET_TEMPLATE = """### TICKET {id}
+CLIENT AGE: {age}
+CLIENT SEGMENT: {segment}
+{attachment_context}TICKET TEXT:
+{ticket_text}
+"""
+
+
+async def _call_openrouter(
+    messages: list[dict],
+    model: str | None = None,
+    max_tokens: int = 1000,
+    kind: str = "analysis",
+) -> dict:
     settings = get_settings()
     llm_model = model or settings.OPENROUTER_MODEL
     last_error = None
+    client = http_clients.get("openrouter")
+    limiter = rate_limiters.get("openrouter")
 
     for attempt in range(MAX_RETRIES):
         try:
-            async with httpx.AsyncClient(timeout=45.0) as client:
+            async with limiter.slot(kind) as slot:
                 response = await client.post(
                     f"{settings.OPENROUTER_BASE_URL}/chat/completions",
                     headers={
@@ -149,25 +201,32 @@ async def _call_openrouter(messages: list[dict], model: str | None = None) -> di
                         "model": llm_model,
                         "messages": messages,
                         "temperature": 0.1,
-                        "max_tokens": 1000,
+                        "max_tokens": max_tokens,
                         "response_format": {"type": "json_object"},
                     },
                 )
+                slot.observe(response)
 
-                if response.status_code in (401, 400):
-                    response.raise_for_status()
+            if response.status_code in (401, 400):
+                response.raise_for_status()
 
-                if response.status_code in (429, 500, 502, 503, 504):
-                    delay = RETRY_BASE_DELAY * (2 ** attempt)
-                    last_error = f"HTTP {response.status_code}"
-                    log.warning("OpenRouter HTTP %d — retry %d in %.1fs", response.status_code, attempt + 1, delay)
-                    await asyncio.sleep(delay)
-                    continue
+            if response.status_code == 429:
+                # The limiter pauses every caller (Retry-After or its own backoff) — just retry.
+                last_error = "HTTP 429"
+                log.warning("OpenRouter HTTP 429 — retry %d after limiter pause", attempt + 1)
+                continue
 
-                response.raise_for_status()
-                data = response.json()
-                content = data["choices"][0]["message"]["content"]
-                return json.loads(content)
+            if response.status_code in (500, 502, 503, 504):
+                delay = slot.retry_after or RETRY_BASE_DELAY * (2 ** attempt)
+                last_error = f"HTTP {response.status_code}"
+                log.warning("OpenRouter HTTP %d — retry %d in %.1fs", response.status_code, attempt + 1, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            data = response.json()
+            content = data["choices"][0]["message"]["content"]
+            return json.loads(content)
 
         except (httpx.TimeoutException, httpx.ConnectError) as e:
             last_error = str(e)
@@ -211,20 +270,20 @@ def _load_image_base64(filename: str, uploads_dir: str = "/app/uploads") -> tupl
     return None
 
 
-async def analyze_ticket(ticket: dict, uploads_dir: str = "/app/uploads") -> dict:
-    start = time.time()
-
-    text = ticket.get("description_anonymized") or ticket.get("description") or ""
-    age = ticket.get("age")
-    segment = ticket.get("segment", "Mass")
+def _attachment_names(ticket: dict) -> list[str]:
     attachments_raw = ticket.get("attachments")
-    attachments = []
-    if attachments_raw:
-        if isinstance(attachments_raw, list):
-            attachments = attachments_raw
-        elif isinstance(attachments_raw, str):
-            attachments = [a.strip() for a in attachments_raw.split(",") if a.strip()]
-
+    if not attachments_raw:
+        return []
+    if isinstance(attachments_raw, list):
+        return attachments_raw
+    if isinstance(attachments_raw, str):
+        return [a.strip() for a in attachments_raw.split(",") if a.strip()]
+    return []
+
+
+def _prepare_attachments(ticket: dict, uploads_dir: str) -> tuple[str, list[dict]]:
+    """Attachment line for the prompt plus image parts for the ones found on disk."""
+    attachments = _attachment_names(ticket)
     attachment_context = ""
     image_parts: list[dict] = []
 
@@ -239,42 +298,33 @@ async def analyze_ticket(ticket: dict, uploads_dir: str = "/app/uploads") -> dic
                     "image_url": {"url": f"data:{mime};base64,{b64}"},
                 })
                 attachment_context += f"\n[Image '{fname}' attached — analyze its content]"
+    return attachment_context, image_parts
 
-    prompt = ANALYSIS_PROMPT.format(
-        ticket_text=text or "(empty ticket body)",
-        attachment_context=attachment_context,
-        age=age if age is not None else "unknown",
-        segment=segment,
-    )
 
-    system_msg = {"role": "system", "content": "You are a precise ticket classification system. Return only valid JSON."}
+def _ticket_text(ticket: dict) -> str:
+    return ticket.get("description_anonymized") or ticket.get("description") or ""
 
-    if image_parts:
-        user_content = [{"type": "text", "text": prompt}] + image_parts
-        user_msg = {"role": "user", "content": user_content}
-    else:
-        user_msg = {"role": "user", "content": prompt}
 
-    try:
-        result = await _call_openrouter([system_msg, user_msg])
-    except Exception as e:
-        elapsed = time.time() - start
-        ticket["type"] = ticket.get("type") or "Консультация"
-        ticket["sentiment"] = "Нейтральный"
-        ticket["sentiment_confidence"] = 0.0
-        ticket["language_label"] = "RU"
-        ticket["language_actual"] = "russian"
-        ticket["language_is_mixed"] = False
-        ticket["language_note"] = f"LLM failed: {e}"
-        ticket["summary"] = "Ошибка LLM — требуется ручная обработка."
-        ticket["explanation"] = f"Ошибка при обращении к LLM: {e}. Установлены значения по умолчанию."
-        ticket["attachment_analysis"] = None
-        ticket["needs_data_change"] = False
-        ticket["llm_latency_ms"] = int(elapsed * 1000)
-        return ticket
+_SYSTEM_MSG = {"role": "system", "content": "You are a precise ticket classification system. Return only valid JSON."}
 
-    elapsed = time.time() - start
 
+def _apply_error(ticket: dict, error: Exception, elapsed: float) -> dict:
+    ticket["type"] = ticket.get("type") or "Консультация"
+    ticket["sentiment"] = "Нейтральный"
+    ticket["sentiment_confidence"] = 0.0
+    ticket["language_label"] = "RU"
+    ticket["language_actual"] = "russian"
+    ticket["language_is_mixed"] = False
+    ticket["language_note"] = f"LLM failed: {error}"
+    ticket["summary"] = "Ошибка LLM — требуется ручная обработка."
+    ticket["explanation"] = f"Ошибка при обращении к LLM: {error}. Установлены значения по умолчанию."
+    ticket["attachment_analysis"] = None
+    ticket["needs_data_change"] = False
+    ticket["llm_latency_ms"] = int(elapsed * 1000)
+    return ticket
+
+
+def _apply_result(ticket: dict, result: dict, elapsed: float) -> dict:
     detected_type = _normalize_type(result.get("type", "Консультация"))
 
     if ticket.get("is_spam"):
@@ -300,13 +350,383 @@ async def analyze_ticket(ticket: dict, uploads_dir: str = "/app/uploads") -> dic
     return ticket
 
 
-async def analyze_batch(tickets: list[dict], concurrency: int = 5, uploads_dir: str = "/app/uploads") -> list[dict]:
-    sem = asyncio.Semaphore(concurrency)
+# ── Content-addressed result cache: in-memory LRU in front of the llm_result_cache table ──
+# Key = sha256(model, PROMPT_VERSION, anonymized text, attachment digests, age bucket, segment),
+# value = the normalized fields analyze_ticket writes. Error fallbacks are never cached.
+
+_CACHED_FIELDS = (
+    "type", "sentiment", "sentiment_confidence", "language_label", "language_actual",
+    "language_is_mixed", "language_note", "summary", "explanation", "attachment_analysis",
+    "needs_data_change",
+)
+
+
+def _age_bucket(age) -> str:
+    # The prompt only distinguishes clients above and below 45 (language rule).
+    try:
+        return "gt45" if int(age) > 45 else "le45"
+    except (TypeError, ValueError):
+        return "unknown"
+
+
+def _attachment_digest(fname: str, uploads_dir: str) -> str:
+    for path in [Path(uploads_dir) / fname, Path(fname)]:
+        if path.is_file():
+            try:
+                return hashlib.sha256(path.read_bytes()).hexdigest()
+            except OSError:
+                break
+    return f"name:{fname}"
+
+
+def _cache_key(ticket: dict, uploads_dir: str) -> str:
+    payload = json.dumps([
+        get_settings().OPENROUTER_MODEL,
+        PROMPT_VERSION,
+        _ticket_text(ticket),
+        sorted(_attachment_digest(f, uploads_dir) for f in _attachment_names(ticket)),
+        _age_bucket(ticket.get("age")),
+        ticket.get("segment", "Mass"),
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def _persist_analyses(rows: list[dict]):
+    by_key = {r["cache_key"]: r for r in rows}
+    stmt = pg_insert(LLMResultCache).values(list(by_key.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LLMResultCache.cache_key],
+        set_={"result": stmt.excluded.result, "created_at": stmt.excluded.created_at},
+    )
+    async with async_session_factory() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+_settings = get_settings()
+_cache = LRUCache(maxsize=_settings.LLM_CACHE_SIZE, ttl_s=_settings.LLM_CACHE_TTL_S)
+_cache_writer = WriteBehindQueue(
+    "llm_result_cache",
+    _persist_analyses,
+    batch_size=_settings.LLM_CACHE_FLUSH_SIZE,
+    interval_s=_settings.LLM_CACHE_FLUSH_INTERVAL_S,
+)
+_db_tier = {"enabled": False, "loaded": 0, "purged": 0, "hits": 0, "misses": 0}
+_calls_saved = {"cache": 0, "duplicate": 0}
+
+
+def _remaining_ttl(created_at: datetime | None) -> float:
+    ttl = get_settings().LLM_CACHE_TTL_S
+    if created_at is None:
+        return ttl
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return ttl - (datetime.now(timezone.utc) - created_at).total_seconds()
+
+
+async def start_llm_cache():
+    """
+    Drop entries written under another prompt version or past their TTL, bulk-load the
+    rest into memory and start the write-back task (app startup).
+    """
+    cutoff = datetime.now(timezone.utc).timestamp() - get_settings().LLM_CACHE_TTL_S
+    try:
+        async with async_session_factory() as session:
+            purged = await session.execute(
+                delete(LLMResultCache).where(or_(
+                    LLMResultCache.prompt_version != PROMPT_VERSION,
+                    LLMResultCache.created_at < datetime.fromtimestamp(cutoff, timezone.utc),
+                ))
+            )
+            await session.commit()
+            result = await session.execute(
+                select(LLMResultCache).order_by(LLMResultCache.created_at.desc()).limit(_cache.maxsize)
+            )
+            rows = list(result.scalars().all())
+    except Exception as e:
+        log.warning("LLM cache: DB tier unavailable, memory only (%s)", e)
+        return
+    loaded = 0
+    for row in reversed(rows):
+        ttl = _remaining_ttl(row.created_at)
+        if ttl > 0:
+            _cache.set(row.cache_key, row.result, ttl_s=ttl)
+            loaded += 1
+    _db_tier["enabled"] = True
+    _db_tier["loaded"] = loaded
+    _db_tier["purged"] = purged.rowcount or 0
+    _cache_writer.start()
+    log.info("LLM cache: loaded %d entries, purged %d stale (prompt %s)", loaded, _db_tier["purged"], PROMPT_VERSION)
+
+
+async def stop_llm_cache():
+    await _cache_writer.stop()
+
+
+def invalidate_llm_cache():
+    """Forget the in-memory tier; persisted rows of other prompt versions go on next startup."""
+    _cache.invalidate()
+
+
+async def _cached_analyses(keys: list[str]) -> dict[str, dict]:
+    """Memory first, then one query for the keys the memory tier does not have."""
+    found: dict[str, dict] = {}
+    missing: list[str] = []
+    for key in dict.fromkeys(keys):
+        value = _cache.get(key)
+        if value is MISSING:
+            missing.append(key)
+        else:
+            found[key] = value
+    if not missing or not _db_tier["enabled"]:
+        return found
+    try:
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(LLMResultCache).where(
+                    LLMResultCache.cache_key.in_(missing),
+                    LLMResultCache.prompt_version == PROMPT_VERSION,
+                )
+            )
+            rows = list(result.scalars().all())
+    except Exception as e:
+        log.warning("LLM cache: DB lookup failed for %d keys: %s", len(missing), e)
+        return found
+    for row in rows:
+        ttl = _remaining_ttl(row.created_at)
+        if ttl > 0:
+            _cache.set(row.cache_key, row.result, ttl_s=ttl)
+            found[row.cache_key] = row.result
+    _db_tier["hits"] += sum(1 for k in missing if k in found)
+    _db_tier["misses"] += sum(1 for k in missing if k not in found)
+    return found
+
+
+def _remember_analysis(key: str, ticket: dict):
+    output = {f: ticket.get(f) for f in _CACHED_FIELDS}
+    _cache.set(key, output)
+    if _db_tier["enabled"]:
+        _cache_writer.put({
+            "id": uuid.uuid4(),
+            "cache_key": key,
+            "model": get_settings().OPENROUTER_MODEL,
+            "prompt_version": PROMPT_VERSION,
+            "result": output,
+            "created_at": datetime.now(timezone.utc),
+        })
+
+
+def _apply_cached(ticket: dict, output: dict, elapsed: float) -> dict:
+    ticket.update({f: output.get(f) for f in _CACHED_FIELDS})
+    if ticket.get("is_spam"):
+        ticket["type"] = "Спам"
+    ticket["llm_latency_ms"] = int(elapsed * 1000)
+    ticket["llm_cache_hit"] = True
+    return ticket
+
+
+def llm_cache_stats() -> dict:
+    return {
+        "prompt_version": PROMPT_VERSION,
+        "memory": _cache.stats(),
+        "db": dict(_db_tier),
+        "write_back": _cache_writer.stats(),
+        "llm_calls_saved": dict(_calls_saved),
+    }
+
+
+async def _analyze_uncached(ticket: dict, uploads_dir: str, key: str | None) -> dict:
+    start = time.time()
+
+    text = _ticket_text(ticket)
+    age = ticket.get("age")
+    segment = ticket.get("segment", "Mass")
+    attachment_context, image_parts = _prepare_attachments(ticket, uploads_dir)
+
+    prompt = ANALYSIS_PROMPT.format(
+        ticket_text=text or "(empty ticket body)",
+        attachment_context=attachment_context,
+        age=age if age is not None else "unknown",
+        segment=segment,
+    )
+
+    if image_parts:
+        user_content = [{"type": "text", "text": prompt}] + image_parts
+        user_msg = {"role": "user", "content": user_content}
+    else:
+        user_msg = {"role": "user", "content": prompt}
+
+    try:
+        result = await _call_openrouter([_SYSTEM_MSG, user_msg])
+    except Exception as e:
+        return _apply_error(ticket, e, time.time() - start)
+
+    _apply_result(ticket, result, time.time() - start)
+    if key is not None:
+        _remember_analysis(key, ticket)
+    return ticket
+
+
+async def analyze_ticket(ticket: dict, uploads_dir: str = "/app/uploads") -> dict:
+    start = time.time()
+    # Spam tickets get their type forced afterwards, so their output is not cached.
+    key = None if ticket.get("is_spam") else _cache_key(ticket, uploads_dir)
+    if key is not None:
+        cached = (await _cached_analyses([key])).get(key)
+        if cached is not None:
+            _calls_saved["cache"] += 1
+            return _apply_cached(ticket, cached, time.time() - start)
+    return await _analyze_uncached(ticket, uploads_dir, key)
+
+
+# ── Packed mode: several short tickets per chat completion ──
+# The instructions dominate the prompt, so sending them once for K tickets cuts both
+# requests and input tokens roughly K-fold. Items the model drops or mangles are
+# re-run on the single-ticket path, so packing never loses a result a single call would give.
+
+_RESULT_TOKENS_PER_TICKET = 350
+
+
+def _is_packable(ticket: dict, uploads_dir: str, max_chars: int) -> bool:
+    """Images need their own multimodal message; long texts would crowd out their neighbours."""
+    if len(_ticket_text(ticket)) > max_chars:
+        return False
+    for fname in _attachment_names(ticket):
+        if Path(fname).suffix.lower() in _IMAGE_EXTENSIONS and (
+            (Path(uploads_dir) / fname).is_file() or Path(fname).is_file()
+        ):
+            return False
+    return True
+
+
+def _valid_item(item) -> bool:
+    return (
+        isinstance(item, dict)
+        and isinstance(item.get("id"), str)
+        and isinstance(item.get("type"), str) and item["type"].strip() != ""
+        and isinstance(item.get("sentiment"), str) and item["sentiment"].strip() != ""
+        and isinstance(item.get("sentiment_confidence", 0.5), (int, float, str))
+    )
+
 
-    async def _process(t: dict) -> dict:
-        if t.get("is_spam"):
-            return t
+async def _analyze_packed(group: list[tuple[str, dict]], uploads_dir: str) -> list[tuple[str, dict]]:
+    """One request for the whole group of (cache key, ticket); returns the pairs that still need a single call."""
+    start = time.time()
+    blocks = []
+    for i, (_, t) in enumerate(group):
+        attachment_context, _ = _prepare_attachments(t, uploads_dir)
+        age = t.get("age")
+        blocks.append(BATCH_TICKET_TEMPLATE.format(
+            id=f"t{i}",
+            age=age if age is not None else "unknown",
+            segment=t.get("segment", "Mass"),
+            attachment_context=f"{attachment_context}\n" if attachment_context else "",
+            ticket_text=_ticket_text(t) or "(empty ticket body)",
+        ))
+    prompt = BATCH_ANALYSIS_PROMPT.format(count=len(group), tickets_block="\n".join(blocks))
+
+    try:
+        response = await _call_openrouter(
+            [_SYSTEM_MSG, {"role": "user", "content": prompt}],
+            max_tokens=_RESULT_TOKENS_PER_TICKET * len(group),
+            kind="analysis_packed",
+        )
+    except Exception as e:
+        log.warning("Packed LLM call for %d tickets failed (%s) — falling back to single calls", len(group), e)
+        return group
+
+    items = response.get("results") if isinstance(response, dict) else None
+    by_id: dict[str, dict] = {}
+    for item in items if isinstance(items, list) else []:
+        if _valid_item(item):
+            by_id.setdefault(item["id"].strip(), item)
+
+    elapsed = time.time() - start
+    leftovers = []
+    for i, (key, t) in enumerate(group):
+        item = by_id.get(f"t{i}")
+        if item is None:
+            leftovers.append((key, t))
+            continue
+        try:
+            _apply_result(t, item, elapsed)
+        except (TypeError, ValueError):
+            leftovers.append((key, t))
+            continue
+        _remember_analysis(key, t)
+    if leftovers:
+        log.warning("Packed LLM call: %d/%d items missing or invalid — re-running singly", len(leftovers), len(group))
+    return leftovers
+
+
+async def analyze_batch(
+    tickets: list[dict],
+    concurrency: int | None = None,
+    uploads_dir: str = "/app/uploads",
+    batch_size: int | None = None,
+) -> list[dict]:
+    """
+    Analyze many tickets. Cached and duplicate bodies cost no request; the rest are packed
+    up to `batch_size` (LLM_BATCH_SIZE) short text-only tickets per request.
+    batch_size <= 1 gives one request per ticket. In-flight requests are governed by the
+    shared OpenRouter limiter; `concurrency` only adds a hard cap on top of it.
+    """
+    settings = get_settings()
+    size = settings.LLM_BATCH_SIZE if batch_size is None else batch_size
+    sem = asyncio.Semaphore(concurrency) if concurrency else contextlib.nullcontext()
+    start = time.time()
+
+    todo = [t for t in tickets if not t.get("is_spam")]
+    by_key: dict[str, list[dict]] = {}
+    for t in todo:
+        by_key.setdefault(_cache_key(t, uploads_dir), []).append(t)
+
+    cached = await _cached_analyses(list(by_key))
+    elapsed = time.time() - start
+    for key, output in cached.items():
+        for t in by_key.pop(key):
+            _apply_cached(t, output, elapsed)
+            _calls_saved["cache"] += 1
+
+    packable: list[tuple[str, dict]] = []
+    single: list[tuple[str, dict]] = []
+    for key, members in by_key.items():
+        representative = members[0]
+        if size > 1 and _is_packable(representative, uploads_dir, settings.LLM_BATCH_MAX_CHARS):
+            packable.append((key, representative))
+        else:
+            single.append((key, representative))
+    groups = [packable[i:i + size] for i in range(0, len(packable), size)]
+    if len(groups) and len(groups[-1]) == 1:
+        single.extend(groups.pop())
+
+    async def _single(key: str, t: dict) -> dict:
+        start = time.time()
         async with sem:
-            return await analyze_ticket(t, uploads_dir)
+            try:
+                return await _analyze_uncached(t, uploads_dir, key)
+            except Exception as e:
+                log.error("row=%s LLM failed: %s", t.get("csv_row_index"), e)
+                return _apply_error(t, e, time.time() - start)
 
-    return list(await asyncio.gather(*[_process(t) for t in tickets]))
\ No newline at end of file
+    async def _packed(group: list[tuple[str, dict]]):
+        async with sem:
+            leftovers = await _analyze_packed(group, uploads_dir)
+        await asyncio.gather(*[_single(key, t) for key, t in leftovers])
+
+    await asyncio.gather(*[_packed(g) for g in groups], *[_single(key, t) for key, t in single])
+
+    # Identical bodies: copy the representative's answer instead of asking again.
+    for members in by_key.values():
+        representative = members[0]
+        for t in members[1:]:
+            t.update({f: representative.get(f) for f in (*_CACHED_FIELDS, "llm_latency_ms")})
+            _calls_saved["duplicate"] += 1
+
+    log.info(
+        "LLM analysis: %d tickets — %d from cache, %d duplicates, %d packed into %d requests, %d single",
+        len(todo), len(todo) - sum(len(m) for m in by_key.values()),
+        sum(len(m) - 1 for m in by_key.values()),
+        sum(len(g) for g in groups), len(groups), len(single),
+    )
+    return tickets
@@ -100,6 +100,17 @@ def anonymize_text(text: str) -> AnonymizationResult:
     )
 
 
+def anonymize_ticket_dict(ticket: dict) -> dict:
+    """
+    In-place counterpart of anonymize_ticket for the file-based pipeline: sets
+    description_anonymized and _pii_detections (consumed by rehydrate_ticket).
+    """
+    result = anonymize_text(ticket.get("description") or "")
+    ticket["description_anonymized"] = result.anonymized_text
+    ticket["_pii_detections"] = [{"token": d.token, "original": d.original} for d in result.detections]
+    return ticket
+
+
 def rehydrate_text(text: str, mappings: list[dict]) -> str:
     if not text or not mappings:
         return text or ""
@@ -134,6 +145,10 @@ async def anonymize_ticket(
     ticket: Ticket,
     batch_id: uuid.UUID | None = None,
 ) -> AnonymizationResult:
+    """
+    Mask the ticket's description and add its ProcessingState and PIIMapping rows to
+    `db` without flushing: a session, or the pipeline's TicketWrites buffer.
+    """
     proc = ProcessingState(
         ticket_id=ticket.id,
         batch_id=batch_id,
@@ -142,7 +157,6 @@ async def anonymize_ticket(
         started_at=datetime.utcnow(),
     )
     db.add(proc)
-    await db.flush()
 
     text = ticket.description or ""
     result = anonymize_text(text)
@@ -163,7 +177,6 @@ async def anonymize_ticket(
     proc.completed_at = datetime.utcnow()
     proc.progress_pct = 100.0
     proc.message = f"Anonymized {len(result.detections)} PII entities"
-    await db.flush()
 
     await sse_manager.send_update(
         ticket_id=ticket.id,
@@ -2,6 +2,8 @@ import asyncio
 import logging
 import time
 import uuid
+from collections import Counter
+from dataclasses import dataclass, field
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -15,14 +17,18 @@ from app.models.models import (
     TicketStatusEnum,
 )
 from app.services.csv_parser import parse_tickets, parse_managers, parse_business_units
-from app.services.personal_data_masking import anonymize_ticket, rehydrate_ticket
-from app.services.spam_prefiltering import check_spam_ticket, check_spam
+from app.services.personal_data_masking import anonymize_ticket, anonymize_ticket_dict, rehydrate_ticket
+from app.services.spam_prefiltering import check_spam_ticket, check_spam_batch, check_spam
 from app.services.llm_processing import analyze_ticket as llm_analyze, analyze_batch as llm_batch
 from app.services.geocoder import geocode_ticket, geocode_batch
-from app.services.priority import score_batch, compute_priority
-from collections import Counter
-from app.services.routing import route_batch
-from app.services.geo_filtering import assign_ticket_to_nearest
+from app.services.priority import score_batch, scoring_input, compute_priority
+from app.services.sharded_routing import route_batch_parallel
+from app.services.ticket_store import TicketStore
+from app.services.geo_filtering import assign_ticket_to_nearest, geo_point
+from app.services.pipeline_writer import PipelineWriter, TicketWrites
+from app.core.config import get_settings
+from app.core.process_pool import run_cpu
+from app.core.database import async_session_factory
 from app.core.sse_manager import sse_manager
 from app.core.progress_store import set_progress, add_result
 
@@ -44,15 +50,71 @@ _SENTIMENT_TO_ENUM = {
     "позитивный": SentimentEnum.позитивный,
 }
 
+# Stage result key -> ticket key, for TicketStore.apply in run_pipeline
+_PRIORITY_FIELDS = {"priority": "priority"}
+_ROUTING_FIELDS = {
+    "manager_id": "assigned_manager_id",
+    "manager_name": "assigned_manager_name",
+    "office": "assigned_office",
+    "explanation": "routing_explanation",
+    "skipped": "routing_skipped",
+}
+
+
+@dataclass
+class _StageLimits:
+    """Per-stage concurrency caps for the DB-mode executor."""
+    spam: asyncio.Semaphore
+    llm: asyncio.Semaphore
+    geo: asyncio.Semaphore
+    routing: asyncio.Semaphore
+
+    @classmethod
+    def from_settings(cls) -> "_StageLimits":
+        settings = get_settings()
+        return cls(
+            spam=asyncio.Semaphore(max(1, settings.PIPELINE_SPAM_CONCURRENCY)),
+            llm=asyncio.Semaphore(max(1, settings.PIPELINE_LLM_CONCURRENCY)),
+            geo=asyncio.Semaphore(max(1, settings.PIPELINE_GEO_CONCURRENCY)),
+            routing=asyncio.Semaphore(max(1, settings.PIPELINE_ROUTING_CONCURRENCY)),
+        )
+
+
+@dataclass
+class _BatchContext:
+    """Shared state for every worker of one process_batch run."""
+    batch_id: uuid.UUID
+    total: int
+    guid_counts: dict[str, int]
+    limits: _StageLimits
+    writer: PipelineWriter
+    # (latitude, longitude) -> routing candidate snapshots, see assign_ticket_to_nearest
+    candidate_cache: dict = field(default_factory=dict)
+
+    @property
+    def batch_id_str(self) -> str:
+        return str(self.batch_id)
+
+
+async def _guarded(sem: asyncio.Semaphore, coro):
+    async with sem:
+        return await coro
+
 
-async def process_batch(db: AsyncSession, batch_id: uuid.UUID) -> dict:
+async def process_batch(db: AsyncSession, batch_id: uuid.UUID, concurrency: int | None = None) -> dict:
     """
     Run the enrichment pipeline for all tickets in a batch (DB mode).
-    Loads batch and tickets (heuristic: most recent ingested up to batch.total_rows), then
-    for each ticket: spam check -> PII anonymize -> LLM + geocode -> routing.
+    Loads batch and tickets in one query (heuristic: most recent ingested up to
+    batch.total_rows), then keeps up to `concurrency` tickets in flight:
+    spam check -> PII anonymize -> LLM + geocode -> routing.
+    Every stage is additionally bounded by its own semaphore (see PIPELINE_* settings).
+    Finished tickets go to a PipelineWriter, which stores them in bulk together with
+    the batch checkpoint.
     """
     t0 = time.perf_counter()
-    log.info("[PIPELINE] process_batch start: batch_id=%s", batch_id)
+    settings = get_settings()
+    concurrency = max(1, concurrency or settings.PIPELINE_CONCURRENCY)
+    log.info("[PIPELINE] process_batch start: batch_id=%s, concurrency=%d", batch_id, concurrency)
 
     result = await db.execute(select(BatchUpload).where(BatchUpload.id == batch_id))
     batch = result.scalar_one_or_none()
@@ -66,229 +128,295 @@ async def process_batch(db: AsyncSession, batch_id: uuid.UUID) -> dict:
         .order_by(Ticket.created_at.desc())
         .limit(max(1, batch.total_rows or 0))
     )
-    tickets = list(result.scalars().all())
-    if not tickets:
+    rows = list(result.scalars().all())
+    # Workers change these objects detached; the writer persists their columns.
+    for ticket in rows:
+        db.expunge(ticket)
+    if not rows:
         log.warning("[PIPELINE] no ingested tickets for batch %s", batch_id)
         return {"message": "No ingested tickets to process", "processed": 0}
 
-    log.info("[PIPELINE] loaded %d tickets, sending pipeline in_progress", len(tickets))
-    batch_id_str = str(batch_id)
-    set_progress(batch_id_str, len(tickets), 0, 0, 1, "processing")
+    total = len(rows)
+    ctx = _BatchContext(
+        batch_id=batch_id,
+        total=total,
+        guid_counts=dict(Counter(t.guid for t in rows if t.guid)),
+        limits=_StageLimits.from_settings(),
+        writer=PipelineWriter(batch_id),
+    )
+
+    log.info("[PIPELINE] loaded %d tickets, sending pipeline in_progress", total)
+    set_progress(ctx.batch_id_str, total, 0, 0, 1, "processing")
     await sse_manager.send_update(
         ticket_id=uuid.UUID(int=0),
         batch_id=batch_id,
         stage="pipeline",
         status="in_progress",
-        message=f"Обработка {len(tickets)} обращений",
-        data={"total": len(tickets), "processed": 0, "spam": 0, "current": 1},
+        message=f"Обработка {total} обращений",
+        data={"total": total, "processed": 0, "spam": 0, "current": 1},
     )
 
+    started = 0
     processed = 0
     spam_count = 0
-    guids = [t.guid for t in tickets if t.guid]
-    guid_counts = dict(Counter(guids))
-    for idx, ticket in enumerate(tickets):
-        current = idx + 1
-        log.info("[PIPELINE] ticket %d/%d: %s", current, len(tickets), ticket.id)
-        set_progress(batch_id_str, len(tickets), processed, spam_count, current, "processing")
-        await sse_manager.send_update(
-            ticket_id=uuid.UUID(int=0),
-            batch_id=batch_id,
-            stage="pipeline",
-            status="in_progress",
-            message=f"Обработка {current}/{len(tickets)}",
-            data={"total": len(tickets), "processed": processed, "spam": spam_count, "current": current},
-        )
+    queue = iter(enumerate(rows))
+
+    async def _worker():
+        nonlocal started, processed, spam_count
+        # One session per worker, only read from (routing candidates); writes are buffered.
+        session = async_session_factory()
         try:
-            spam_result = await check_spam(db, ticket, str(batch_id))
-            if spam_result.is_spam:
-                spam_count += 1
-                ticket.status = TicketStatusEnum.enriched
-                await db.flush()
+            # All workers share one iterator; the event loop never switches inside next().
+            for idx, ticket in queue:
+                started += 1
+                current = started
+                log.info("[PIPELINE] ticket %d/%d: %s", current, total, ticket.id)
+                set_progress(ctx.batch_id_str, total, processed, spam_count, current, "processing")
                 await sse_manager.send_update(
-                    ticket_id=ticket.id,
+                    ticket_id=uuid.UUID(int=0),
                     batch_id=batch_id,
-                    stage="spam_filter",
-                    status="completed",
-                    message="Спам обнаружен",
-                    data={
-                        "is_spam": True,
-                        "reason": getattr(spam_result, "reason", None),
-                        "csv_row_index": getattr(ticket, "csv_row_index", None),
-                    },
-                )
-                await sse_manager.send_update(
-                    ticket_id=ticket.id,
-                    batch_id=batch_id,
-                    stage="enrichment",
-                    status="completed",
-                    message="Пропущен (спам)",
-                    data={"skipped": True, "is_spam": True},
-                )
-                add_result(
-                    batch_id_str,
-                    str(ticket.id),
-                    getattr(ticket, "csv_row_index", None),
-                    None,
-                    None,
-                    None,
-                    None,
-                    None,
-                    is_spam=True,
+                    stage="pipeline",
+                    status="in_progress",
+                    message=f"Обработка {current}/{total}",
+                    data={"total": total, "processed": processed, "spam": spam_count, "current": current},
                 )
+                writes = TicketWrites(ticket)
+                try:
+                    is_spam = await _process_ticket_db(session, writes, idx, ctx)
+                except Exception as e:
+                    log.exception("Pipeline failed for ticket %s: %s", ticket.id, e)
+                    # Nothing to roll back in a read-only session: start the next ticket on a fresh one.
+                    await session.close()
+                    session = async_session_factory()
+                    continue
+                ctx.writer.put(writes)
                 processed += 1
-                set_progress(batch_id_str, len(tickets), processed, spam_count, current, "processing")
-                continue
-
-            await anonymize_ticket(db, ticket, batch_id)
-            await db.flush()
-
-            t_dict = {
-                "description": ticket.description,
-                "description_anonymized": ticket.description_anonymized,
-                "age": ticket.age,
-                "segment": getattr(ticket.segment, "name", None) if ticket.segment else None,
-                "attachments": ticket.attachments or [],
-                "country": ticket.country,
-                "region": ticket.region,
-                "city": ticket.city,
-                "street": ticket.street,
-                "house": ticket.house,
-            }
-            llm_result, geo_result = await asyncio.gather(
-                llm_analyze(t_dict),
-                geocode_ticket(dict(t_dict)),
-                return_exceptions=True,
-            )
-            llm_data = {}
-            if isinstance(llm_result, Exception):
-                log.warning("LLM failed for ticket %s: %s", ticket.id, llm_result)
-                llm_data = {"error": str(llm_result), "type": "Консультация", "sentiment": "Нейтральный"}
-            else:
-                type_str = (llm_result.get("type") or "Консультация").strip().lower()
-                sentiment_str = (llm_result.get("sentiment") or "Нейтральный").strip().lower()
-                llm_data = {
-                    "type": llm_result.get("type") or "Консультация",
-                    "sentiment": llm_result.get("sentiment") or "Нейтральный",
-                    "summary": llm_result.get("summary"),
-                    "sentiment_confidence": float(llm_result.get("sentiment_confidence", 0.5)),
-                }
-                ai = AIAnalysis(
-                    ticket_id=ticket.id,
-                    detected_type=_LLM_TYPE_TO_ENUM.get(type_str, TicketTypeEnum.консультация),
-                    summary=llm_result.get("summary"),
-                    sentiment=_SENTIMENT_TO_ENUM.get(sentiment_str, SentimentEnum.нейтральный),
-                    sentiment_confidence=float(llm_result.get("sentiment_confidence", 0.5)),
-                    language_label=llm_result.get("language_label", "RU"),
-                )
-                db.add(ai)
-            await sse_manager.send_update(
-                ticket_id=ticket.id,
-                batch_id=batch_id,
-                stage="llm_analysis",
-                status="completed",
-                message="Анализ выполнен",
-                data=llm_data,
-            )
+                if is_spam:
+                    spam_count += 1
+                set_progress(ctx.batch_id_str, total, processed, spam_count, started, "processing")
+        finally:
+            await session.close()
+
+    ctx.writer.start()
+    try:
+        await asyncio.gather(*(_worker() for _ in range(min(concurrency, total))))
+    finally:
+        checkpoint = await ctx.writer.finish()
 
-            geo_data = {}
-            if isinstance(geo_result, Exception):
-                log.warning("Geocode failed for ticket %s: %s", ticket.id, geo_result)
-                geo_data = {"error": str(geo_result)}
-            else:
-                ticket.latitude = geo_result.get("latitude")
-                ticket.longitude = geo_result.get("longitude")
-                ticket.geo_explanation = geo_result.get("geo_explanation")
-                geo_data = {
-                    "latitude": geo_result.get("latitude"),
-                    "longitude": geo_result.get("longitude"),
-                    "geo_explanation": geo_result.get("geo_explanation"),
-                }
-            await sse_manager.send_update(
-                ticket_id=ticket.id,
-                batch_id=batch_id,
-                stage="geocoding",
-                status="completed",
-                message="Геокодирование выполнено" if not isinstance(geo_result, Exception) else "Ошибка геокодирования",
-                data=geo_data,
-            )
+    elapsed = time.perf_counter() - t0
+    log.info(
+        "[PIPELINE] done in %.1fs: processed=%d, spam=%d, committed=%d in %d flushes, %d failed writes",
+        elapsed, processed, spam_count, checkpoint["committed"], ctx.writer.flushes, checkpoint["failed"],
+    )
+    set_progress(ctx.batch_id_str, total, processed, spam_count, total, "completed")
+    await sse_manager.send_update(
+        ticket_id=uuid.UUID(int=0),
+        batch_id=batch_id,
+        stage="pipeline",
+        status="completed",
+        message=f"Обработано {processed} из {total}",
+        data={
+            "total": total, "processed": processed, "spam": spam_count,
+            # Only stored tickets count as enriched; the rest are retried by the next run.
+            "enriched": checkpoint["committed"] - checkpoint["spam"],
+            "failed_writes": checkpoint["failed"],
+        },
+    )
+    return {"processed": processed, "total": total, "committed": checkpoint["committed"], "failed_writes": checkpoint["failed"]}
 
-            ticket.status = TicketStatusEnum.enriched
-            segment_name = getattr(ticket.segment, "name", None) or "Mass"
-            ticket_type_str = llm_data.get("type") or "Консультация"
-            language_label = llm_result.get("language_label", "RU") if not isinstance(llm_result, Exception) else "RU"
-            _, geo_info, skills_info = await assign_ticket_to_nearest(
-                ticket, db, str(batch_id),
-                segment=segment_name,
-                ticket_type=ticket_type_str,
-                language_label=language_label,
-            )
-            priority_breakdown = compute_priority(
-                segment=segment_name,
-                ticket_type=ticket_type_str,
-                sentiment=llm_data.get("sentiment") or "Нейтральный",
-                age=ticket.age,
-                country=ticket.country,
-                csv_row_index=ticket.csv_row_index or idx,
-                total_rows=len(tickets),
-                guid_counts=guid_counts,
-                guid=ticket.guid or "",
-            )
-            await db.flush()
+
+async def _process_ticket_db(db: AsyncSession, writes: TicketWrites, idx: int, ctx: _BatchContext) -> bool:
+    """
+    Enrich a single ticket. Returns True if it was spam. New rows and the ticket's own
+    changes are collected in `writes`, as is the final "enrichment" event, which the
+    writer sends after commit; `db` is only read from. The caller hands `writes` to the
+    batch writer on success and drops it on error.
+    """
+    batch_id = ctx.batch_id
+    batch_id_str = ctx.batch_id_str
+    limits = ctx.limits
+    ticket = writes.ticket
+
+    spam_result = await _guarded(limits.spam, check_spam(db, ticket, batch_id_str))
+    if spam_result.is_spam:
+        ticket.status = TicketStatusEnum.enriched
+        await sse_manager.send_update(
+            ticket_id=ticket.id,
+            batch_id=batch_id,
+            stage="spam_filter",
+            status="completed",
+            message="Спам обнаружен",
+            data={
+                "is_spam": True,
+                "reason": getattr(spam_result, "reason", None),
+                "csv_row_index": getattr(ticket, "csv_row_index", None),
+            },
+        )
+
+        async def _announce_spam():
             await sse_manager.send_update(
                 ticket_id=ticket.id,
                 batch_id=batch_id,
                 stage="enrichment",
                 status="completed",
-                message="Обогащение завершено",
-                data={
-                    "type": llm_data.get("type"),
-                    "sentiment": llm_data.get("sentiment"),
-                    "summary": llm_data.get("summary"),
-                    "latitude": geo_data.get("latitude"),
-                    "longitude": geo_data.get("longitude"),
-                },
+                message="Пропущен (спам)",
+                data={"skipped": True, "is_spam": True},
             )
             add_result(
                 batch_id_str,
                 str(ticket.id),
                 getattr(ticket, "csv_row_index", None),
-                llm_data.get("type"),
-                llm_data.get("sentiment"),
-                llm_data.get("summary"),
-                geo_data.get("latitude"),
-                geo_data.get("longitude"),
-                is_spam=False,
-                geo_filter=geo_info,
-                skills_filter=skills_info,
-                priority=priority_breakdown,
+                None,
+                None,
+                None,
+                None,
+                None,
+                is_spam=True,
             )
-            processed += 1
-            set_progress(batch_id_str, len(tickets), processed, spam_count, current, "processing")
-        except Exception as e:
-            log.exception("Pipeline failed for ticket %s: %s", ticket.id, e)
 
-    elapsed = time.perf_counter() - t0
-    log.info("[PIPELINE] done in %.1fs: processed=%d, spam=%d", elapsed, processed, spam_count)
-    set_progress(batch_id_str, len(tickets), processed, spam_count, len(tickets), "completed")
+        writes.on_commit(_announce_spam)
+        return True
+
+    await anonymize_ticket(writes, ticket, batch_id)
+
+    t_dict = {
+        "description": ticket.description,
+        "description_anonymized": ticket.description_anonymized,
+        "age": ticket.age,
+        "segment": getattr(ticket.segment, "name", None) if ticket.segment else None,
+        "attachments": ticket.attachments or [],
+        "country": ticket.country,
+        "region": ticket.region,
+        "city": ticket.city,
+        "street": ticket.street,
+        "house": ticket.house,
+    }
+    llm_result, geo_result = await asyncio.gather(
+        _guarded(limits.llm, llm_analyze(t_dict)),
+        _guarded(limits.geo, geocode_ticket(dict(t_dict))),
+        return_exceptions=True,
+    )
+    llm_data = {}
+    if isinstance(llm_result, Exception):
+        log.warning("LLM failed for ticket %s: %s", ticket.id, llm_result)
+        llm_data = {"error": str(llm_result), "type": "Консультация", "sentiment": "Нейтральный"}
+    else:
+        type_str = (llm_result.get("type") or "Консультация").strip().lower()
+        sentiment_str = (llm_result.get("sentiment") or "Нейтральный").strip().lower()
+        llm_data = {
+            "type": llm_result.get("type") or "Консультация",
+            "sentiment": llm_result.get("sentiment") or "Нейтральный",
+            "summary": llm_result.get("summary"),
+            "sentiment_confidence": float(llm_result.get("sentiment_confidence", 0.5)),
+        }
+        ai = AIAnalysis(
+            ticket_id=ticket.id,
+            detected_type=_LLM_TYPE_TO_ENUM.get(type_str, TicketTypeEnum.консультация),
+            summary=llm_result.get("summary"),
+            sentiment=_SENTIMENT_TO_ENUM.get(sentiment_str, SentimentEnum.нейтральный),
+            sentiment_confidence=float(llm_result.get("sentiment_confidence", 0.5)),
+            language_label=llm_result.get("language_label", "RU"),
+        )
+        writes.add(ai)
     await sse_manager.send_update(
-        ticket_id=uuid.UUID(int=0),
+        ticket_id=ticket.id,
         batch_id=batch_id,
-        stage="pipeline",
+        stage="llm_analysis",
+        status="completed",
+        message="Анализ выполнен",
+        data=llm_data,
+    )
+
+    geo_data = {}
+    if isinstance(geo_result, Exception):
+        log.warning("Geocode failed for ticket %s: %s", ticket.id, geo_result)
+        geo_data = {"error": str(geo_result)}
+    else:
+        ticket.latitude = geo_result.get("latitude")
+        ticket.longitude = geo_result.get("longitude")
+        ticket.geo_point = geo_point(ticket.latitude, ticket.longitude)
+        ticket.geo_explanation = geo_result.get("geo_explanation")
+        geo_data = {
+            "latitude": geo_result.get("latitude"),
+            "longitude": geo_result.get("longitude"),
+            "geo_explanation": geo_result.get("geo_explanation"),
+        }
+    await sse_manager.send_update(
+        ticket_id=ticket.id,
+        batch_id=batch_id,
+        stage="geocoding",
         status="completed",
-        message=f"Обработано {processed} из {len(tickets)}",
-        data={"total": len(tickets), "processed": processed, "spam": spam_count, "enriched": processed - spam_count},
+        message="Геокодирование выполнено" if not isinstance(geo_result, Exception) else "Ошибка геокодирования",
+        data=geo_data,
+    )
+
+    ticket.status = TicketStatusEnum.enriched
+    segment_name = getattr(ticket.segment, "name", None) or "Mass"
+    ticket_type_str = llm_data.get("type") or "Консультация"
+    language_label = llm_result.get("language_label", "RU") if not isinstance(llm_result, Exception) else "RU"
+    async with limits.routing:
+        _, geo_info, skills_info = await assign_ticket_to_nearest(
+            ticket, db, batch_id_str,
+            segment=segment_name,
+            ticket_type=ticket_type_str,
+            language_label=language_label,
+            sink=writes,
+            candidate_cache=ctx.candidate_cache,
+        )
+    priority_breakdown = compute_priority(
+        segment=segment_name,
+        ticket_type=ticket_type_str,
+        sentiment=llm_data.get("sentiment") or "Нейтральный",
+        age=ticket.age,
+        country=ticket.country,
+        csv_row_index=ticket.csv_row_index or idx,
+        total_rows=ctx.total,
+        guid_counts=ctx.guid_counts,
+        guid=ticket.guid or "",
     )
-    return {"processed": processed, "total": len(tickets)}
+
+    async def _announce_enriched():
+        await sse_manager.send_update(
+            ticket_id=ticket.id,
+            batch_id=batch_id,
+            stage="enrichment",
+            status="completed",
+            message="Обогащение завершено",
+            data={
+                "type": llm_data.get("type"),
+                "sentiment": llm_data.get("sentiment"),
+                "summary": llm_data.get("summary"),
+                "latitude": geo_data.get("latitude"),
+                "longitude": geo_data.get("longitude"),
+            },
+        )
+        add_result(
+            batch_id_str,
+            str(ticket.id),
+            getattr(ticket, "csv_row_index", None),
+            llm_data.get("type"),
+            llm_data.get("sentiment"),
+            llm_data.get("summary"),
+            geo_data.get("latitude"),
+            geo_data.get("longitude"),
+            is_spam=False,
+            geo_filter=geo_info,
+            skills_filter=skills_info,
+            priority=priority_breakdown,
+        )
+
+    # Announced as done only once the writer has committed the ticket's rows.
+    writes.on_commit(_announce_enriched)
+    return False
 
 
 async def process_ticket(ticket: dict, uploads_dir: str = "/app/uploads") -> dict:
     ticket_start = time.time()
     row = ticket.get("csv_row_index", "?")
 
-    anonymize_ticket(ticket)
+    anonymize_ticket_dict(ticket)
 
-    check_spam_ticket(ticket)
+    await check_spam_ticket(ticket)
     if ticket.get("is_spam"):
         ticket["total_latency_ms"] = int((time.time() - ticket_start) * 1000)
         log.info("row=%s SPAM (%dms): %s", row, ticket["total_latency_ms"], ticket.get("spam_reason"))
@@ -328,7 +456,7 @@ async def run_pipeline(
     managers_path: str,
     business_units_path: str,
     uploads_dir: str = "/app/uploads",
-    llm_concurrency: int = 5,
+    llm_concurrency: int | None = None,
 ) -> dict:
     pipeline_start = time.time()
 
@@ -336,78 +464,45 @@ async def run_pipeline(
     log.info("PIPELINE START")
     log.info("=" * 60)
 
-    tickets = parse_tickets(tickets_path)
-    managers = parse_managers(managers_path)
-    business_units = parse_business_units(business_units_path)
-    log.info("Parsed: %d tickets, %d managers, %d offices", len(tickets), len(managers), len(business_units))
+    store = TicketStore(await asyncio.to_thread(parse_tickets, tickets_path))
+    tickets = store.tickets()
+    # Managers and offices are parsed in worker threads while the spam stage runs.
+    reference_data = asyncio.gather(
+        asyncio.to_thread(parse_managers, managers_path),
+        asyncio.to_thread(parse_business_units, business_units_path),
+    )
 
-    for t in tickets:
-        anonymize_ticket(t)
+    # PII masking runs per ticket right before its spam check, so the spam LLM only
+    # ever sees anonymized text and masking overlaps with the calls in flight.
+    await check_spam_batch(tickets, before_check=anonymize_ticket_dict)
+    spam_count = store.count(lambda t: t.get("is_spam"))
 
-    spam_count = 0
-    for t in tickets:
-        check_spam_ticket(t)
-        if t.get("is_spam"):
-            spam_count += 1
+    managers, business_units = await reference_data
+    log.info("Parsed: %d tickets, %d managers, %d offices", len(store), len(managers), len(business_units))
 
-    non_spam = [t for t in tickets if not t.get("is_spam")]
+    # LLM, geocoding and rehydration write straight into the store's dicts.
+    non_spam = store.select(lambda t: not t.get("is_spam"))
     log.info("Spam filtered: %d spam, %d to process", spam_count, len(non_spam))
 
     if non_spam:
-        sem = asyncio.Semaphore(llm_concurrency)
-
-        async def _llm_with_sem(t: dict) -> dict:
-            async with sem:
-                try:
-                    return await llm_analyze(t, uploads_dir)
-                except Exception as e:
-                    log.error("row=%s LLM failed: %s", t.get("csv_row_index"), e)
-                    t["type"] = t.get("type") or "Консультация"
-                    t["sentiment"] = "Нейтральный"
-                    t["explanation"] = f"Ошибка LLM: {e}"
-                    return t
-
-        async def _geo_with_sem(t: dict) -> dict:
-            async with sem:
-                try:
-                    return await geocode_ticket(t)
-                except Exception as e:
-                    log.error("row=%s GEO failed: %s", t.get("csv_row_index"), e)
-                    t["latitude"] = None
-                    t["longitude"] = None
-                    t["geo_explanation"] = f"Ошибка: {e}"
-                    return t
-
-        llm_tasks = [_llm_with_sem(t) for t in non_spam]
-        geo_tasks = [_geo_with_sem(t) for t in non_spam]
-
-        await asyncio.gather(*llm_tasks, *geo_tasks)
+        await asyncio.gather(
+            llm_batch(non_spam, concurrency=llm_concurrency, uploads_dir=uploads_dir),
+            geocode_batch(non_spam),
+        )
 
         for t in non_spam:
             rehydrate_ticket(t)
 
     log.info("LLM + geocoding done for %d tickets", len(non_spam))
 
-    scored = score_batch(tickets)
-    for s in scored:
-        idx = s["csv_row_index"]
-        for t in tickets:
-            if t["csv_row_index"] == idx:
-                t["priority"] = s["priority"]
-                break
-
+    # CPU-bound stages run in the process pool so the event loop keeps serving requests.
+    # Only the scored columns go to the pool and come back; breakdown dicts are built here, as they are stored.
+    scores = await run_cpu(score_batch, *scoring_input(tickets))
+    store.apply(scores.results(), _PRIORITY_FIELDS)
     log.info("Priority scoring done")
 
-    assignments = route_batch(tickets, managers)
-    assignment_map = {a["csv_row_index"]: a for a in assignments}
-    for t in tickets:
-        a = assignment_map.get(t["csv_row_index"])
-        if a:
-            t["assigned_manager_id"] = a.get("manager_id")
-            t["assigned_manager_name"] = a.get("manager_name")
-            t["assigned_office"] = a.get("office")
-            t["routing_explanation"] = a.get("explanation")
-            t["routing_skipped"] = a.get("skipped", False)
+    assignments = await route_batch_parallel(tickets, managers)
+    store.apply(assignments, _ROUTING_FIELDS)
 
     routed_count = sum(1 for a in assignments if a.get("manager_id"))
     unrouted_count = sum(1 for a in assignments if not a.get("manager_id") and not a.get("skipped"))
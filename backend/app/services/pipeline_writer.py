@@ -0,0 +1,204 @@
+"""
+Write-behind persistence for process_batch (DB mode).
+
+A ticket's outputs (PII mappings, processing state, AI analysis, assignment and its
+own column updates) are collected in a TicketWrites while it is processed and handed
+to the batch's writer in one piece when it is done. The writer stores many tickets
+per transaction: one multi-row INSERT per table, one executemany UPDATE of tickets
+and the batch checkpoint. A checkpoint therefore only ever counts tickets whose rows
+are committed; tickets lost to a crash or a failed flush keep status "ingested" and
+are picked up by the next run. Likewise a ticket is announced as done (its on_commit
+callbacks: final SSE event, progress result) only once its rows are committed, and
+reported as failed when its flush fails. A failed batch is retried ticket by ticket,
+so one bad ticket does not cost the others their checkpoint.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import bindparam, insert, update
+
+from app.core.cache import WriteBehindQueue
+from app.core.config import get_settings
+from app.core.database import async_session_factory
+from app.core.sse_manager import sse_manager
+from app.models.models import (
+    AIAnalysis,
+    Assignment,
+    BatchUpload,
+    PIIMapping,
+    ProcessingState,
+    Ticket,
+)
+from app.services.geo_filtering import geo_point
+
+log = logging.getLogger("fire.pipeline")
+
+# Insert order: every table here only references tickets / managers / business units.
+_INSERT_MODELS = (ProcessingState, PIIMapping, AIAnalysis, Assignment)
+
+# Ticket columns process_batch may change; written back together for every ticket.
+_TICKET_COLUMNS = (
+    "is_spam", "spam_probability", "description_anonymized", "latitude", "longitude",
+    "geo_explanation", "assigned_manager_id", "status",
+)
+
+
+def _row(obj) -> dict:
+    """Column values of a transient ORM object, with Python-side column defaults filled in."""
+    row = {}
+    for col in obj.__table__.columns:
+        value = getattr(obj, col.key)
+        if value is None and col.default is not None:
+            value = col.default.arg(None) if col.default.is_callable else col.default.arg
+        row[col.key] = value
+    return row
+
+
+class TicketWrites:
+    """Everything one ticket writes; has add() so it can stand in for a session."""
+
+    def __init__(self, ticket: Ticket):
+        self.ticket = ticket
+        self.objects: list = []
+        self.announcements: list[Callable[[], Awaitable[None]]] = []
+
+    def add(self, obj):
+        self.objects.append(obj)
+
+    def on_commit(self, announce: Callable[[], Awaitable[None]]):
+        """Run `announce()` once this ticket's rows are committed."""
+        self.announcements.append(announce)
+
+    def ticket_update(self) -> dict:
+        t = self.ticket
+        values = {c: getattr(t, c) for c in _TICKET_COLUMNS}
+        values["geo_point"] = geo_point(t.latitude, t.longitude)
+        values["updated_at"] = datetime.utcnow()
+        values["ticket_pk"] = t.id
+        return values
+
+
+class PipelineWriter:
+    """Per-batch writer: a WriteBehindQueue of TicketWrites plus the checkpoint counters."""
+
+    def __init__(self, batch_id: uuid.UUID):
+        settings = get_settings()
+        self.batch_id = batch_id
+        self.committed = 0
+        self.spam = 0
+        self.flushes = 0
+        self.last_ticket_id: uuid.UUID | None = None
+        self._lost = 0  # tickets dropped from batches that were otherwise stored
+        self._queue = WriteBehindQueue(
+            f"pipeline:{batch_id}",
+            self._persist,
+            batch_size=settings.PIPELINE_FLUSH_TICKETS,
+            interval_s=settings.PIPELINE_FLUSH_INTERVAL_S,
+        )
+
+    def put(self, writes: TicketWrites):
+        self._queue.put(writes)
+
+    def start(self):
+        self._queue.start()
+
+    async def stop(self):
+        await self._queue.stop()
+
+    @property
+    def failed(self) -> int:
+        return self._queue.failed + self._lost
+
+    def checkpoint(self, status: str) -> dict:
+        return {
+            "status": status,
+            "committed": self.committed,
+            "spam": self.spam,
+            "last_ticket_id": str(self.last_ticket_id) if self.last_ticket_id else None,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    async def _persist(self, batch: list[TicketWrites]):
+        """
+        One transaction for the batch; if it fails, ticket by ticket so one bad ticket
+        does not take the others down. Raises only when no ticket could be stored.
+        """
+        try:
+            await self._store(batch)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                await self._report_failed(batch)
+                raise
+            log.warning("pipeline batch of %d tickets failed (%s), storing them one by one", len(batch), e)
+        lost = []
+        for writes in batch:
+            try:
+                await self._store([writes])
+            except Exception as e:
+                log.warning("ticket %s not stored: %s", writes.ticket.id, e)
+                lost.append(writes)
+        await self._report_failed(lost)
+        if len(lost) == len(batch):
+            raise RuntimeError(f"none of {len(batch)} tickets could be stored")
+        self._lost += len(lost)
+
+    async def _store(self, batch: list[TicketWrites]):
+        rows: dict[type, list[dict]] = {}
+        for writes in batch:
+            for obj in writes.objects:
+                rows.setdefault(type(obj), []).append(_row(obj))
+        checkpoint = self.checkpoint("processing")
+        checkpoint["committed"] += len(batch)
+        checkpoint["spam"] += sum(1 for w in batch if w.ticket.is_spam)
+        checkpoint["last_ticket_id"] = str(batch[-1].ticket.id)
+
+        tickets = Ticket.__table__
+        async with async_session_factory() as session:
+            for model in _INSERT_MODELS:
+                if rows.get(model):
+                    await session.execute(insert(model), rows[model])
+            await session.execute(
+                update(tickets).where(tickets.c.id == bindparam("ticket_pk")),
+                [w.ticket_update() for w in batch],
+            )
+            await session.execute(
+                update(BatchUpload).where(BatchUpload.id == self.batch_id).values(checkpoint=checkpoint)
+            )
+            await session.commit()
+        self.committed = checkpoint["committed"]
+        self.spam = checkpoint["spam"]
+        self.last_ticket_id = batch[-1].ticket.id
+        self.flushes += 1
+        for writes in batch:
+            for announce in writes.announcements:
+                try:
+                    await announce()
+                except Exception as e:  # the rows are stored; a lost notification must not fail the flush
+                    log.warning("announcing ticket %s failed: %s", writes.ticket.id, e)
+
+    async def _report_failed(self, batch: list[TicketWrites]):
+        for writes in batch:
+            await sse_manager.send_update(
+                ticket_id=writes.ticket.id,
+                batch_id=self.batch_id,
+                stage="enrichment",
+                status="failed",
+                message="Результат не сохранён — обращение будет обработано при следующем запуске",
+                data={"csv_row_index": writes.ticket.csv_row_index},
+            )
+
+    async def finish(self) -> dict:
+        """Store what is left and mark the checkpoint completed."""
+        await self.stop()
+        checkpoint = self.checkpoint("completed")
+        checkpoint["failed"] = self.failed
+        async with async_session_factory() as session:
+            await session.execute(
+                update(BatchUpload).where(BatchUpload.id == self.batch_id).values(checkpoint=checkpoint)
+            )
+            await session.commit()
+        return checkpoint
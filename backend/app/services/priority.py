@@ -1,6 +1,10 @@
 import math
 from datetime import date, datetime
 from collections import Counter
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
 
 from app.core.config import get_settings
 
@@ -208,38 +212,194 @@ def compute_priority(
     }
 
 
-def score_batch(tickets: list[dict]) -> list[dict]:
-    guids = [t["guid"] for t in tickets]
-    guid_counts = build_repeat_counter(guids)
-    total_rows = len(tickets)
+def _round_exact(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    np.round, except that values sitting on a rounding tie are re-rounded with the
+    builtin round() (which rounds the exact binary value), so results match
+    compute_priority bit for bit.
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10.0 ** ndigits
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    if ties.size:
+        rounded[ties] = [round(v, ndigits) for v in values[ties].tolist()]
+    return rounded
+
+
+def _per_value(values: list, *fns) -> list[np.ndarray]:
+    """Each fn evaluated once per distinct value, then broadcast back over the column."""
+    distinct = list(set(values))
+    codes = np.fromiter(map({v: i for i, v in enumerate(distinct)}.__getitem__, values), dtype=np.intp, count=len(values))
+    return [np.array([fn(v) for v in distinct], dtype=np.float64)[codes] for fn in fns]
+
+
+def _repeat_counts(guids: list) -> np.ndarray:
+    """How often each ticket's guid occurs in the batch (build_repeat_counter, per row)."""
+    # use_na_sentinel=False: blank guids count as one value, like Counter counts None
+    codes, _ = pd.factorize(np.asarray(guids, dtype=object), use_na_sentinel=False)
+    return np.bincount(codes)[codes]
+
+
+def _bracket_scores(values: np.ndarray, brackets: list[tuple[int, int]]) -> np.ndarray:
+    """First bracket whose threshold the value reaches; DEFAULT_SCORE for NaN / below all."""
+    out = np.full(values.shape, float(DEFAULT_SCORE))
+    assigned = np.zeros(values.shape, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        for threshold, score in brackets:
+            hit = ~assigned & (values >= threshold)
+            out[hit] = score
+            assigned |= hit
+    return out
+
+
+def score_arrays(
+    segments: list,
+    types: list,
+    sentiments: list,
+    ages: list,
+    countries: list,
+    row_indices: np.ndarray,
+    repeat_counts: np.ndarray,
+    total_rows: int,
+) -> dict[str, np.ndarray]:
+    """
+    compute_priority over whole columns at once: one NumPy array per breakdown field,
+    already rounded the way compute_priority rounds it. Every input holds one entry
+    per ticket.
+    """
+    n = len(segments)
+    seg_raw, is_vip = _per_value(segments, lambda v: SEGMENT_PRIORITY_SCORE.get(v, 3), lambda v: v == "VIP")
+    type_raw, is_fraud = _per_value(types, lambda v: TYPE_PRIORITY_SCORE.get(v, 3), lambda v: v == "Мошеннические действия")
+    (sent_raw,) = _per_value(sentiments, lambda v: SENTIMENT_PRIORITY_SCORE.get(v, 4))
+    seg_w = seg_raw * WEIGHTS["segment"]
+    type_w = type_raw * WEIGHTS["type"]
+    sent_w = sent_raw * WEIGHTS["sentiment"]
+    age = np.array(ages, dtype=np.float64)  # None -> NaN
+    age_w = _bracket_scores(age, AGE_BRACKETS) * WEIGHTS["age"]
+    repeat_w = _bracket_scores(np.asarray(repeat_counts, dtype=np.float64), REPEAT_SCORES) * WEIGHTS["repeat_client"]
+    base_total = seg_w + type_w + sent_w + age_w + repeat_w
 
-    results = []
-    for t in tickets:
-        if t.get("is_spam") and t.get("priority_breakdown"):
-            results.append({
-                "csv_row_index": t["csv_row_index"],
-                "priority": t["priority_breakdown"],
-            })
-            continue
+    expansion = set(get_settings().EXPANSION_COUNTRIES)
+    (extra_expansion,) = _per_value(countries, lambda c: EXPANSION_EXTRA if (c and c.strip() in expansion) else 0.0)
+    with np.errstate(invalid="ignore"):
+        extra_young_vip = np.where(is_vip.astype(bool) & (age < YOUNG_VIP_AGE_THRESHOLD), YOUNG_VIP_EXTRA, 0.0)
+    if total_rows <= 1:
+        extra_fifo = np.full(n, float(FIFO_EXTRA))
+    else:
+        extra_fifo = FIFO_EXTRA * (1.0 - np.asarray(row_indices, dtype=np.float64) / (total_rows - 1))
+    extra_total = extra_expansion + extra_young_vip + extra_fifo
+
+    final = base_total + extra_total
+    fraud_floor = is_fraud.astype(bool) & (final < FRAUD_SOFT_FLOOR)
+    final = np.minimum(10.0, np.maximum(1.0, _round_exact(final, 2)))
 
-        ticket_type = t.get("type") or "Консультация"
-        sentiment = t.get("sentiment") or "Нейтральный"
-
-        priority = compute_priority(
-            segment=t["segment"],
-            ticket_type=ticket_type,
-            sentiment=sentiment,
-            age=t.get("age"),
-            country=t.get("country"),
-            csv_row_index=t["csv_row_index"],
-            total_rows=total_rows,
-            guid_counts=guid_counts,
-            guid=t["guid"],
-        )
-
-        results.append({
-            "csv_row_index": t["csv_row_index"],
-            "priority": priority,
-        })
-
-    return results
\ No newline at end of file
+    return {
+        "segment": _round_exact(seg_w, 3),
+        "type": _round_exact(type_w, 3),
+        "sentiment": _round_exact(sent_w, 3),
+        "age": _round_exact(age_w, 3),
+        "repeat_client": _round_exact(repeat_w, 3),
+        "base_total": _round_exact(base_total, 2),
+        "extra_expansion": extra_expansion,
+        "extra_young_vip": extra_young_vip,
+        "extra_fifo": _round_exact(extra_fifo, 3),
+        "extra_total": _round_exact(extra_total, 3),
+        "fraud_floor_applied": fraud_floor,
+        "final": final,
+    }
+
+
+_BREAKDOWN_FIELDS = (
+    "segment", "type", "sentiment", "age", "repeat_client", "base_total", "extra_expansion",
+    "extra_young_vip", "extra_fifo", "extra_total", "fraud_floor_applied", "final",
+)
+
+
+class PriorityScores:
+    """
+    score_batch result: score_arrays' columns for a whole batch, aligned with `rows`
+    (csv_row_index). Arrays pickle cheaply back from the process pool; the breakdown
+    dicts compute_priority would return are only built by results(), for storing.
+    """
+
+    def __init__(self, rows: np.ndarray, arrays: dict[str, np.ndarray], total_rows: int, kept: dict[int, dict]):
+        self.rows = rows
+        self.arrays = arrays
+        self.total_rows = total_rows
+        self.kept = kept
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def final(self) -> np.ndarray:
+        return self.arrays["final"]
+
+    def breakdowns(self) -> Iterator[dict]:
+        """Per-row dicts identical to compute_priority's, in row order."""
+        columns = [self.arrays[f].tolist() for f in _BREAKDOWN_FIELDS]
+        # compute_priority keeps these as ints when the single-row FIFO bonus or the fraud floor apply
+        if self.total_rows <= 1:
+            columns[_BREAKDOWN_FIELDS.index("extra_fifo")] = [FIFO_EXTRA] * len(self)
+        for seg, typ, sent, age, rep, base, exp, yv, fifo, extra, floor, final in zip(*columns):
+            yield {
+                "segment": seg,
+                "type": typ,
+                "sentiment": sent,
+                "age": age,
+                "repeat_client": rep,
+                "base_total": base,
+                "extra_expansion": exp,
+                "extra_young_vip": yv,
+                "extra_fifo": fifo,
+                "extra_total": extra,
+                "fraud_floor_applied": floor,
+                "final": FRAUD_SOFT_FLOOR if floor else final,
+            }
+
+    def results(self) -> Iterator[dict]:
+        """Stage results for TicketStore.apply; kept breakdowns stand in for computed ones."""
+        kept = self.kept
+        for row, breakdown in zip(self.rows.tolist(), self.breakdowns()):
+            yield {"csv_row_index": row, "priority": kept.get(row, breakdown)}
+
+
+def scoring_input(tickets: list[dict]) -> tuple[dict[str, list], dict[int, dict]]:
+    """
+    score_batch arguments for a batch: one list per ticket field scoring reads, and the
+    breakdowns of spam tickets that already carry one (they keep it as is).
+    """
+    columns = {
+        "rows": [t["csv_row_index"] for t in tickets],
+        "guids": [t.get("guid") for t in tickets],
+        "segments": [t["segment"] for t in tickets],
+        "types": [t.get("type") or "Консультация" for t in tickets],
+        "sentiments": [t.get("sentiment") or "Нейтральный" for t in tickets],
+        "ages": [t.get("age") for t in tickets],
+        "countries": [t.get("country") for t in tickets],
+    }
+    kept = {
+        t["csv_row_index"]: t["priority_breakdown"]
+        for t in tickets
+        if t.get("is_spam") and t.get("priority_breakdown")
+    }
+    return columns, kept
+
+
+def score_batch(columns: dict[str, list], kept: dict[int, dict] | None = None) -> PriorityScores:
+    """compute_priority for a whole batch, from scoring_input(tickets)."""
+    rows = np.fromiter(columns["rows"], dtype=np.int64, count=len(columns["rows"]))
+    total_rows = len(rows)
+    if not total_rows:
+        return PriorityScores(rows, {f: np.empty(0) for f in _BREAKDOWN_FIELDS}, 0, kept or {})
+    arrays = score_arrays(
+        segments=columns["segments"],
+        types=columns["types"],
+        sentiments=columns["sentiments"],
+        ages=columns["ages"],
+        countries=columns["countries"],
+        row_indices=rows,
+        repeat_counts=_repeat_counts(columns["guids"]),
+        total_rows=total_rows,
+    )
+    return PriorityScores(rows, arrays, total_rows, kept or {})
@@ -1,5 +1,8 @@
-from app.services.geo_filtering import filter_by_geo
-from app.services.skills import filter_by_skill
+import heapq
+import math
+
+from app.services.geo_filtering import OfficeIndex, geo_scope
+from app.services.skills import manager_caps, presence, resolve_requirements, ticket_requirements
 
 DIFFICULTY = {
     "Жалоба": 1.2,
@@ -22,51 +25,172 @@ def init_manager_loads(managers: list[dict]) -> dict[int, float]:
     return loads
 
 
-def route_batch(
-    tickets: list[dict],
-    managers: list[dict],
-) -> list[dict]:
-    sorted_tickets = sorted(
-        tickets,
-        key=lambda t: (t.get("priority") or {}).get("final", 0) if isinstance(t.get("priority"), dict) else (t.get("priority") or 0),
-        reverse=True,
-    )
+def _coord(value) -> float:
+    """Coordinate for distance_matrix; missing and non-finite values become NaN."""
+    value = math.nan if value is None else float(value)
+    return value if math.isfinite(value) else math.nan
+
+
+_ALL = -1  # group key for "every manager", used when geo filtering does not apply
+
+
+class _LoadBalancer:
+    """
+    Least-loaded manager lookup for Router. Managers are bucketed by group
+    (an office, or _ALL) and required skill mask; each bucket is a min-heap of
+    (load, position) built on first use. A load change pushes a fresh entry into
+    every heap the manager sits in and older entries are dropped lazily, so a pick
+    costs O(groups x log managers) instead of a scan over all eligible managers.
+    A heap holding more than twice as many entries as managers is rebuilt, which
+    keeps a long-lived Router's memory bounded by its rarely picked buckets.
+    """
+
+    def __init__(self, managers: list[dict], loads: dict, caps: list[int]):
+        self.managers = managers
+        self.loads = loads
+        self.caps = caps
+        self._version = [0] * len(managers)
+        self._heaps: dict[tuple[int, int], list] = {}
+        self._members: dict[tuple[int, int], list[int]] = {}
+        self._member_of: list[list[tuple[int, int]]] = [[] for _ in managers]
+
+    def _load(self, pos: int) -> float:
+        return self.loads.get(self.managers[pos]["id"], 0)
+
+    def _rebuild(self, key: tuple[int, int]):
+        heap = self._heaps[key]
+        heap[:] = [(self._load(pos), pos, self._version[pos]) for pos in self._members[key]]
+        heapq.heapify(heap)
+
+    def _heap(self, group: int, members: list[int], required: int) -> list:
+        key = (group, required)
+        heap = self._heaps.get(key)
+        if heap is None:
+            heap = self._heaps[key] = []
+            self._members[key] = [pos for pos in members if self.caps[pos] & required == required]
+            for pos in self._members[key]:
+                self._member_of[pos].append(key)
+            self._rebuild(key)
+        while heap and heap[0][2] != self._version[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap
+
+    def pick(self, groups: list[tuple[int, list[int], float]], required: int) -> int | None:
+        """
+        Position of the manager with the lowest load across `groups` (key, members,
+        distance); ties go to the nearer group, then to the earlier manager, which is
+        what min() over the distance-ranked eligible list returned.
+        """
+        best = None
+        for group, members, rank in groups:
+            heap = self._heap(group, members, required)
+            if heap:
+                load, pos, _ = heap[0]
+                if best is None or (load, rank, pos) < best:
+                    best = (load, rank, pos)
+        return best[2] if best else None
+
+    def add_load(self, pos: int, amount: float):
+        manager_id = self.managers[pos]["id"]
+        self.loads[manager_id] = self.loads.get(manager_id, 0) + amount
+        self._version[pos] += 1
+        entry = (self.loads[manager_id], pos, self._version[pos])
+        for key in self._member_of[pos]:
+            heap = self._heaps[key]
+            if len(heap) >= 2 * len(self._members[key]):
+                self._rebuild(key)
+            else:
+                heapq.heappush(heap, entry)
 
-    loads = init_manager_loads(managers)
-    assignments = []
 
-    for ticket in sorted_tickets:
+class Router:
+    """
+    Routing state for one roster of managers: the office index, capability masks and
+    load heaps. route_batch builds one per run; RoutingEngine keeps one alive and
+    feeds it tickets as they arrive. `loads` (manager id -> load) defaults to
+    init_manager_loads and is updated in place as tickets are assigned.
+    """
+
+    def __init__(
+        self,
+        managers: list[dict],
+        loads: dict | None = None,
+        office_index: OfficeIndex | None = None,
+    ):
+        self.managers = managers
+        self.loads = init_manager_loads(managers) if loads is None else loads
+        self.office_index = office_index if office_index is not None else OfficeIndex(managers)
+        caps = [manager_caps(m) for m in managers]
+        self._balancer = _LoadBalancer(managers, self.loads, caps)
+        self._everyone = [(_ALL, list(range(len(managers))), 0.0)]
+        self._everyone_present = presence(caps)
+        self._office_members = [[pos for pos, _ in group] for group in self.office_index.groups]
+
+    def distance_matrix(self, tickets: list[dict]):
+        """Ticket -> office distances for a whole batch, or None without known offices."""
+        if not len(self.office_index):
+            return None
+        return self.office_index.distance_matrix(
+            [_coord(t.get("latitude")) for t in tickets],
+            [_coord(t.get("longitude")) for t in tickets],
+        )
+
+    def assign(self, ticket: dict, distances=None, book: bool = True) -> dict:
+        """
+        Route one ticket and book its difficulty on the chosen manager. `distances` is
+        the ticket's row of distance_matrix; without it the office KD-tree is used.
+        With book=False (a preview) loads stay as they are; load_after is what the
+        manager would carry.
+        """
         ticket_type = ticket.get("type", "Консультация")
         difficulty = DIFFICULTY.get(ticket_type)
 
         if difficulty is None:
-            assignments.append({
-                "csv_row_index": ticket["csv_row_index"],
+            return {
+                "csv_row_index": ticket.get("csv_row_index"),
                 "manager_id": None,
                 "manager_name": None,
                 "office": None,
                 "explanation": f"Тикет типа '{ticket_type}' пропущен при маршрутизации (спам).",
                 "skipped": True,
-            })
-            continue
+            }
+
+        # Geo filter -> skill filter -> least loaded, on office groups instead of manager lists.
+        offices = geo_scope(ticket, self.office_index, distances)
+        if offices is None:
+            groups, present = self._everyone, self._everyone_present
+        else:
+            groups = [(i, self._office_members[i], d) for i, d in offices]
+            present = 0
+            for i, _ in offices:
+                present |= self.office_index.presence[i]
 
-        eligible = filter_by_geo(ticket, managers)
-        eligible = filter_by_skill(ticket, eligible)
+        requirements, language_label = ticket_requirements(ticket)
+        required, note = resolve_requirements(requirements, language_label, present)
+        if required is None:
+            # nothing can be served even fully relaxed: keep every geo-eligible manager
+            ticket["_skill_relaxation"] = "Все требования сняты, подходящих менеджеров нет"
+            required = 0
+        else:
+            ticket["_skill_relaxation"] = note
+        best_pos = self._balancer.pick(groups, required)
 
-        if not eligible:
-            assignments.append({
-                "csv_row_index": ticket["csv_row_index"],
+        if best_pos is None:
+            return {
+                "csv_row_index": ticket.get("csv_row_index"),
                 "manager_id": None,
                 "manager_name": None,
                 "office": None,
                 "explanation": "Не найден подходящий менеджер после фильтрации по гео и навыкам.",
                 "skipped": False,
-            })
-            continue
+            }
 
-        best = min(eligible, key=lambda m: loads.get(m["id"], 0))
-
-        loads[best["id"]] = loads.get(best["id"], 0) + difficulty
+        best = self.managers[best_pos]
+        if book:
+            self._balancer.add_load(best_pos, difficulty)
+            load_after = self.loads[best["id"]]
+        else:
+            load_after = self.loads.get(best["id"], 0) + difficulty
 
         priority = ticket.get("priority") or {}
         p_final = priority.get("final", 0) if isinstance(priority, dict) else priority
@@ -75,23 +199,44 @@ def route_batch(
             f"Назначен менеджеру {best['full_name']} ({best['position']}, {best.get('office', '?')}). "
             f"Приоритет тикета: {p_final}. "
             f"Тип: {ticket_type} (сложность {difficulty}). "
-            f"Нагрузка менеджера после назначения: {loads[best['id']]:.2f}."
+            f"Нагрузка менеджера после назначения: {load_after:.2f}."
         )
 
-        assignments.append({
-            "csv_row_index": ticket["csv_row_index"],
+        return {
+            "csv_row_index": ticket.get("csv_row_index"),
             "manager_id": best["id"],
             "manager_name": best["full_name"],
             "office": best.get("office"),
             "difficulty": difficulty,
-            "manager_load_after": loads[best["id"]],
+            "manager_load_after": load_after,
             "priority_final": p_final,
             "priority_breakdown": priority if isinstance(priority, dict) else {"final": priority},
             "explanation": explanation,
             "skipped": False,
-        })
+        }
+
 
-    return assignments
+def sort_by_priority(tickets: list[dict]) -> list[dict]:
+    """Routing order: highest final priority first, csv order among equals."""
+    return sorted(
+        tickets,
+        key=lambda t: (t.get("priority") or {}).get("final", 0) if isinstance(t.get("priority"), dict) else (t.get("priority") or 0),
+        reverse=True,
+    )
+
+
+def route_batch(
+    tickets: list[dict],
+    managers: list[dict],
+) -> list[dict]:
+    sorted_tickets = sort_by_priority(tickets)
+    router = Router(managers)
+    # All ticket -> office distances in one vectorised call; rows follow sorted_tickets.
+    distances = router.distance_matrix(sorted_tickets)
+    return [
+        router.assign(ticket, distances[row] if distances is not None else None)
+        for row, ticket in enumerate(sorted_tickets)
+    ]
 
 
 def get_manager_loads(managers: list[dict], assignments: list[dict]) -> list[dict]:
@@ -0,0 +1,255 @@
+"""
+Online routing: a long-lived Router for tickets that arrive one at a time.
+
+The roster (active managers, their offices and coordinates) and the manager loads are
+read from the database once and kept warm; each ticket is then routed in memory with
+the same geo -> skills -> least-loaded rules as route_batch. Assignment rows are
+persisted by a write-behind queue that retries failed batches. Uploading managers or
+business units marks the roster stale and the next ticket reloads it.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Double, bindparam, cast, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+
+from app.core.cache import WriteBehindQueue
+from app.core.config import get_settings
+from app.core.database import async_session_factory
+from app.models.models import Assignment, Manager, Ticket, TicketStatusEnum
+from app.services.geo_filtering import _POSITION_DISPLAY, OfficeIndex, office_location
+from app.services.routing import DEFAULT_DIFFICULTY, Router, init_manager_loads
+
+log = logging.getLogger("fire.routing_engine")
+
+
+async def _load_roster(db: AsyncSession) -> tuple[list[dict], dict[str, tuple[float, float]]]:
+    """Active managers as route_batch-style dicts, plus office name -> coordinates."""
+    result = await db.execute(
+        select(Manager)
+        .outerjoin(Manager.business_unit)
+        .options(contains_eager(Manager.business_unit))
+        .where(Manager.is_active == True)
+        .order_by(Manager.created_at, Manager.id)
+    )
+    managers: list[dict] = []
+    coords: dict[str, tuple[float, float]] = {}
+    for m in result.scalars().all():
+        bu = m.business_unit
+        office = bu.name if bu else ""
+        if bu and office not in coords:
+            located = (bu.latitude, bu.longitude) if bu.latitude is not None and bu.longitude is not None else office_location(office)
+            if located:
+                coords[office] = located
+        managers.append({
+            "id": m.id,
+            "full_name": m.full_name,
+            "position": _POSITION_DISPLAY.get(m.position, "Специалист"),
+            "office": office,
+            "skills": list(m.skills or []),
+            "csv_load": m.csv_load or 0,
+            "business_unit_id": bu.id if bu else None,
+        })
+    return managers, coords
+
+
+async def _booked_loads(db: AsyncSession, managers: list[dict]) -> dict:
+    """CSV load plus the difficulty of every assignment already stored per manager."""
+    loads = init_manager_loads(managers)
+    difficulty = cast(Assignment.routing_details["difficulty"].astext, Double)
+    result = await db.execute(
+        select(Assignment.manager_id, func.sum(func.coalesce(difficulty, DEFAULT_DIFFICULTY)))
+        .group_by(Assignment.manager_id)
+    )
+    for manager_id, booked in result.all():
+        if manager_id in loads:
+            loads[manager_id] += float(booked or 0)
+    return loads
+
+
+async def _store_assignments(rows: list[dict]):
+    """
+    Insert the rows, skipping tickets that already have an assignment (unique
+    assignments.ticket_id), and point each ticket at its manager if its row went in.
+    """
+    tickets = Ticket.__table__
+    stored = select(Assignment.id).where(Assignment.id == bindparam("a")).exists()
+    async with async_session_factory() as session:
+        await session.execute(pg_insert(Assignment).on_conflict_do_nothing(index_elements=["ticket_id"]), rows)
+        await session.execute(
+            update(tickets)
+            .where(tickets.c.id == bindparam("t"), stored)
+            .values(assigned_manager_id=bindparam("m"), status=TicketStatusEnum.routed),
+            [{"t": r["ticket_id"], "m": r["manager_id"], "a": r["id"]} for r in rows],
+        )
+        await session.commit()
+
+
+async def _persist_assignments(rows: list[dict]):
+    """
+    One transaction for the batch; if it fails, row by row so one bad row (a ticket
+    deleted since it was routed) does not take the others down. Raises, and the queue
+    retries, only when no row could be stored.
+    """
+    try:
+        await _store_assignments(rows)
+        return
+    except Exception as e:
+        if len(rows) == 1:
+            raise
+        log.warning("assignment batch of %d failed (%s), storing rows one by one", len(rows), e)
+    stored = 0
+    for row in rows:
+        try:
+            await _store_assignments([row])
+            stored += 1
+        except Exception as e:
+            log.warning("assignment of ticket %s not stored: %s", row["ticket_id"], e)
+    if not stored:
+        raise RuntimeError(f"none of {len(rows)} assignments could be stored")
+
+
+class RoutingEngine:
+    def __init__(self):
+        settings = get_settings()
+        self._router: Router | None = None
+        self._business_units: dict = {}
+        self._stale = True
+        self._lock = asyncio.Lock()
+        # tickets routed here whose Assignment row is not stored (or given up) yet
+        self._unsaved: set[uuid.UUID] = set()
+        self._writer = WriteBehindQueue(
+            "assignments",
+            self._persist,
+            batch_size=settings.ROUTING_FLUSH_SIZE,
+            interval_s=settings.ROUTING_FLUSH_INTERVAL_S,
+            retries=settings.ROUTING_FLUSH_RETRIES,
+        )
+        self.loaded_at: datetime | None = None
+        self.reloads = 0
+        self.routed = 0
+        self._route_time_s = 0.0
+
+    async def _persist(self, rows: list[dict]):
+        await _persist_assignments(rows)
+        for row in rows:
+            self._unsaved.discard(row["ticket_id"])
+
+    def invalidate(self):
+        """Roster changed: reload before the next ticket is routed."""
+        self._stale = True
+
+    async def reload(self):
+        async with self._lock:
+            await self._reload()
+
+    async def _reload(self):
+        t0 = time.perf_counter()
+        self._stale = False
+        # Loads are re-read from assignments, so queued ones must be stored first.
+        await self._writer.flush()
+        self._unsaved.clear()
+        try:
+            async with async_session_factory() as session:
+                managers, coords = await _load_roster(session)
+                loads = await _booked_loads(session, managers)
+        except Exception:
+            self._stale = True
+            raise
+        self._router = Router(managers, loads, OfficeIndex(managers, locate=coords.get))
+        self._business_units = {m["id"]: m["business_unit_id"] for m in managers}
+        self.loaded_at = datetime.now(timezone.utc)
+        self.reloads += 1
+        log.info(
+            "routing engine loaded: %d managers, %d offices in %.0fms",
+            len(managers), len(self._router.office_index), (time.perf_counter() - t0) * 1000,
+        )
+
+    async def _current(self) -> Router:
+        if self._router is None or self._stale or self._lock.locked():
+            async with self._lock:
+                if self._router is None or self._stale:
+                    await self._reload()
+        return self._router
+
+    def is_unsaved(self, ticket_id: uuid.UUID) -> bool:
+        """Routed here, but its Assignment row is not stored yet."""
+        return ticket_id in self._unsaved
+
+    async def route(self, ticket: dict, ticket_id: uuid.UUID | None = None) -> dict | None:
+        """
+        Assign one ticket (route_batch ticket dict). With `ticket_id` the load is booked
+        and the Assignment row and tickets.assigned_manager_id are written in the
+        background; returns None if that ticket is already routed and waiting for its
+        row. Without `ticket_id` it is a preview and no load is booked.
+        """
+        router = await self._current()
+        if ticket_id is not None and ticket_id in self._unsaved:
+            return None
+        t0 = time.perf_counter()
+        assignment = router.assign(ticket, book=ticket_id is not None)
+        self._route_time_s += time.perf_counter() - t0
+        self.routed += 1
+
+        manager_id = assignment.get("manager_id")
+        if ticket_id is not None and manager_id is not None:
+            self._unsaved.add(ticket_id)
+            self._writer.put({
+                "id": uuid.uuid4(),
+                "ticket_id": ticket_id,
+                "manager_id": manager_id,
+                "business_unit_id": self._business_units.get(manager_id),
+                "explanation": assignment["explanation"],
+                "routing_details": {
+                    "difficulty": assignment["difficulty"],
+                    "manager_load_after": assignment["manager_load_after"],
+                    "priority_final": assignment["priority_final"],
+                    "office_name": assignment["office"],
+                    "geo_note": ticket.get("_geo_filter_note"),
+                    "skill_relaxation": ticket.get("_skill_relaxation"),
+                },
+                "assigned_at": datetime.now(timezone.utc),
+            })
+        return assignment
+
+    def start(self):
+        self._writer.start()
+
+    async def stop(self):
+        await self._writer.stop()
+
+    def stats(self) -> dict:
+        router = self._router
+        return {
+            "loaded": router is not None,
+            "stale": self._stale,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "reloads": self.reloads,
+            "managers": len(router.managers) if router else 0,
+            "offices": len(router.office_index) if router else 0,
+            "routed": self.routed,
+            "avg_route_ms": round(self._route_time_s / self.routed * 1000, 4) if self.routed else None,
+            "write_back": self._writer.stats(),
+        }
+
+
+routing_engine = RoutingEngine()
+
+
+async def start_routing_engine():
+    """App startup: start the write-back task and warm the roster if the database allows."""
+    routing_engine.start()
+    try:
+        await routing_engine.reload()
+    except Exception as e:
+        log.warning("routing engine not loaded at startup (%s)", e)
+
+
+async def stop_routing_engine():
+    await routing_engine.stop()
@@ -14,10 +14,11 @@ import time
 import uuid
 from datetime import datetime
 
-import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
+from app.core.http_clients import http_clients
+from app.core.rate_limiter import rate_limiters
 from app.core.sse_manager import sse_manager
 from app.models.models import (
     AIAnalysis, ProcessingState, ProcessingStageEnum,
@@ -92,7 +93,8 @@ async def _analyze_sentiment_openrouter(ticket_text: str) -> SentimentResult:
     prompt = SENTIMENT_PROMPT_OPENROUTER.format(
         ticket_text=ticket_text or "(empty ticket body)"
     )
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    client = http_clients.get("openrouter")
+    async with rate_limiters.get("openrouter").slot("sentiment") as slot:
         response = await client.post(
             f"{settings.OPENROUTER_BASE_URL}/chat/completions",
             headers={
@@ -109,9 +111,11 @@ async def _analyze_sentiment_openrouter(ticket_text: str) -> SentimentResult:
                 "max_tokens": 100,
                 "response_format": {"type": "json_object"},
             },
+            timeout=30.0,
         )
-        response.raise_for_status()
-        data= response.json()
+        slot.observe(response)
+    response.raise_for_status()
+    data= response.json()
 
     content = data["choices"][0]["message"]["content"]
     result = json.loads(content)
@@ -0,0 +1,193 @@
+"""
+route_batch split across processes by office cluster.
+
+Offices are joined into clusters whenever one ticket may go to either of them (see
+geo_scope), so clusters share no managers and each one is routed on its own, in
+priority order, exactly as route_batch would route it. Clusters are packed into one
+shard per worker. Tickets that fit no cluster go to a spill list routed in the parent
+once the shard loads are merged: tickets without coordinates (every manager is
+eligible), spam, and tickets whose offices would grow a cluster past an even share
+of the batch (left to merge freely, a few tickets between cities fuse every office
+into one cluster).
+
+Spill tickets are therefore the one place where priority order is not strict: each one
+sees the loads of every shard ticket, lower-priority ones included, so it may land on a
+different manager than under route_batch, and the shard tickets do not see its load.
+Interleaving them would take a pool round trip per priority level; the drift this leaves
+in per-manager load is bounded in tests/test_sharded_routing.py.
+"""
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.process_pool import cpu_workers, run_cpu_many
+from app.services.geo_filtering import OfficeIndex
+from app.services.routing import DIFFICULTY, Router, route_batch, sort_by_priority
+
+log = logging.getLogger("fire.routing")
+
+# Ticket keys route_batch reads; workers get only these.
+_ROUTING_KEYS = ("csv_row_index", "latitude", "longitude", "type", "segment", "language_label", "priority")
+
+
+def _office_clusters(
+    eligible: np.ndarray,
+    nearest: np.ndarray,
+    candidates: np.ndarray,
+    cap: int,
+) -> tuple[list[int], np.ndarray]:
+    """
+    Union-find over offices. A ticket eligible for several offices joins them into one
+    cluster unless that cluster would then hold more than `cap` tickets; such tickets
+    are left out. Returns (cluster root per office, mask of tickets kept in a cluster).
+    """
+    n_offices = eligible.shape[1]
+    parent = list(range(n_offices))
+    span = eligible.sum(axis=1)
+    single = candidates & (span == 1)
+    weight = np.bincount(nearest[single], minlength=n_offices).tolist()
+    kept = single.copy()
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for row in np.flatnonzero(candidates & (span > 1)).tolist():
+        roots = {find(i) for i in np.flatnonzero(eligible[row]).tolist()}
+        if sum(weight[r] for r in roots) + 1 > cap and len(roots) > 1:
+            continue
+        first = roots.pop()
+        for r in roots:
+            parent[r] = first
+            weight[first] += weight[r]
+        weight[first] += 1
+        kept[row] = True
+    return [find(i) for i in range(n_offices)], kept
+
+
+def plan_shards(
+    sorted_tickets: list[dict],
+    index: OfficeIndex,
+    distances: np.ndarray | None,
+    n_shards: int,
+) -> tuple[list[tuple[list[int], list[int]]], list[int]]:
+    """
+    Returns ([(ticket rows, manager positions)] per shard, spill rows). Rows index
+    sorted_tickets and stay in priority order; positions index the manager list.
+    """
+    n = len(sorted_tickets)
+    if distances is None:
+        return [], list(range(n))
+
+    eligible = index.eligible_mask(distances)
+    routable = np.array([DIFFICULTY.get(t.get("type", "Консультация")) is not None for t in sorted_tickets], dtype=bool)
+    candidates = routable & eligible.any(axis=1)
+    n_shards = max(1, n_shards)
+    cap = -(-int(candidates.sum()) // n_shards)
+    nearest = np.argmin(np.where(np.isnan(distances), np.inf, distances), axis=1)
+    roots, kept = _office_clusters(eligible, nearest, candidates, cap)
+
+    # A kept ticket's offices all share one cluster: the one of its nearest office.
+    rows_by_cluster: dict[int, list[int]] = {}
+    for row in np.flatnonzero(kept).tolist():
+        rows_by_cluster.setdefault(roots[nearest[row]], []).append(row)
+
+    # Largest clusters first, each into the shard with the fewest tickets so far.
+    shards: list[tuple[list[int], list[int]]] = [([], []) for _ in range(n_shards)]
+    for root, rows in sorted(rows_by_cluster.items(), key=lambda kv: -len(kv[1])):
+        shard_rows, positions = min(shards, key=lambda s: len(s[0]))
+        shard_rows.extend(rows)
+        for i, office_root in enumerate(roots):
+            if office_root == root:
+                positions.extend(pos for pos, _ in index.groups[i])
+    shards = [(sorted(rows), sorted(positions)) for rows, positions in shards if rows]
+    return shards, np.flatnonzero(~kept).tolist()
+
+
+def _route_shard(tickets: list[dict], managers: list[dict], loads: dict, manager_count: int):
+    """Worker: route one shard. Returns ([(assignment, geo note, skill note)], final loads)."""
+    router = Router(managers, loads)
+    router.office_index.manager_count = manager_count  # geo notes count the whole roster
+    distances = router.distance_matrix(tickets)
+    out = []
+    for row, ticket in enumerate(tickets):
+        assignment = router.assign(ticket, distances[row] if distances is not None else None)
+        out.append((assignment, ticket.get("_geo_filter_note"), ticket.get("_skill_relaxation")))
+    return out, router.loads
+
+
+def _prepare(tickets: list[dict], managers: list[dict], n_shards: int):
+    """Sort, build the parent Router, plan the shards and their worker arguments."""
+    sorted_tickets = sort_by_priority(tickets)
+    router = Router(managers)
+    distances = router.distance_matrix(sorted_tickets)
+    shards, spill = plan_shards(sorted_tickets, router.office_index, distances, n_shards)
+
+    jobs = []
+    for rows, positions in shards:
+        shard_managers = [managers[pos] for pos in positions]
+        jobs.append((
+            [{k: sorted_tickets[row].get(k) for k in _ROUTING_KEYS} for row in rows],
+            shard_managers,
+            {m["id"]: router.loads[m["id"]] for m in shard_managers},
+            router.office_index.manager_count,
+        ))
+    return sorted_tickets, router, distances, shards, spill, jobs
+
+
+async def route_batch_sharded(
+    tickets: list[dict],
+    managers: list[dict],
+    n_shards: int,
+    run_many=run_cpu_many,
+) -> list[dict]:
+    """
+    Same contract as route_batch (assignments in routing order, notes set on tickets),
+    except that spilled tickets are routed after all shards (see the module docstring).
+    """
+    t0 = time.perf_counter()
+    # Planning is O(tickets x offices) on its own, so it stays off the event loop too.
+    sorted_tickets, router, distances, shards, spill, jobs = await asyncio.to_thread(
+        _prepare, tickets, managers, n_shards,
+    )
+    results = await run_many(_route_shard, jobs) if jobs else []
+
+    assignments: list[dict | None] = [None] * len(sorted_tickets)
+
+    def _merge_and_route_spill():
+        # Shards own disjoint managers, so their final loads merge by plain update.
+        for (rows, _), (out, loads) in zip(shards, results):
+            router.loads.update(loads)
+            for row, (assignment, geo_note, skill_note) in zip(rows, out):
+                ticket = sorted_tickets[row]
+                ticket["_geo_filter_note"] = geo_note
+                ticket["_skill_relaxation"] = skill_note
+                assignments[row] = assignment
+        # router has not assigned anything yet, so its heaps are built from the merged loads.
+        for row in spill:
+            assignments[row] = router.assign(
+                sorted_tickets[row], distances[row] if distances is not None else None,
+            )
+
+    await asyncio.to_thread(_merge_and_route_spill)
+    log.info(
+        "sharded routing: %d tickets, %d shards %s, %d spilled, %.0fms",
+        len(sorted_tickets), len(shards), [len(rows) for rows, _ in shards], len(spill),
+        (time.perf_counter() - t0) * 1000,
+    )
+    return assignments
+
+
+async def route_batch_parallel(tickets: list[dict], managers: list[dict]) -> list[dict]:
+    """route_batch off the event loop; large batches are sharded across the process pool."""
+    settings = get_settings()
+    workers = cpu_workers()
+    if workers <= 1 or len(tickets) < settings.ROUTING_PARALLEL_MIN_TICKETS:
+        return await asyncio.to_thread(route_batch, tickets, managers)
+    return await route_batch_sharded(tickets, managers, workers)
@@ -1,72 +1,118 @@
+from functools import lru_cache
+from typing import Iterable
+
 RELAXATION_ORDER = ["language", "position", "vip"]
 
+# Manager capability bits; a requirement set is encoded the same way.
+CAP_VIP = 1
+CAP_CHIEF = 2
+CAP_LANGUAGE = {"KZ": 4, "ENG": 8}
+_CAP_SPACE = 16  # every combination of the four bits above
 
-def filter_by_skill(ticket: dict, managers: list[dict]) -> list[dict]:
-    segment = ticket.get("segment", "Mass")
-    ticket_type = ticket.get("type", "Консультация")
-    language_label = ticket.get("language_label", "RU")
+CHIEF_POSITION = "Главный специалист"
 
-    requirements = []
 
-    if segment in ("VIP", "Priority"):
-        requirements.append("vip")
+def capability_mask(skills: Iterable[str] | None, position: str | None) -> int:
+    skills = set(skills or ())
+    mask = CAP_VIP if "VIP" in skills else 0
+    if position == CHIEF_POSITION:
+        mask |= CAP_CHIEF
+    for lang, bit in CAP_LANGUAGE.items():
+        if lang in skills:
+            mask |= bit
+    return mask
 
-    if ticket_type == "Смена данных":
-        requirements.append("position")
 
-    if language_label in ("KZ", "ENG"):
-        requirements.append("language")
+def manager_caps(m: dict) -> int:
+    return capability_mask(m.get("skills"), m.get("position"))
+
+
+def requirement_mask(requirements: Iterable[str], language_label: str) -> int:
+    mask = 0
+    for r in requirements:
+        if r == "vip":
+            mask |= CAP_VIP
+        elif r == "position":
+            mask |= CAP_CHIEF
+        elif r == "language":
+            mask |= CAP_LANGUAGE.get(language_label, 0)
+    return mask
+
+
+# _SATISFIES[r]: bitset over capability masks c (bit c) with c covering requirement r
+_SATISFIES = [
+    sum(1 << c for c in range(_CAP_SPACE) if c & r == r)
+    for r in range(_CAP_SPACE)
+]
+
+
+def presence(caps: Iterable[int]) -> int:
+    """Bitset of the capability masks present among a group of managers."""
+    present = 0
+    for c in caps:
+        present |= 1 << c
+    return present
+
 
-    eligible = _apply_filters(managers, requirements, segment, ticket_type, language_label)
+def can_serve(present: int, required: int) -> bool:
+    return bool(present & _SATISFIES[required])
 
-    if eligible:
-        ticket["_skill_relaxation"] = None
-        return eligible
 
-    relaxed = []
+@lru_cache(maxsize=64)
+def _relaxation_ladder(requirements: tuple[str, ...]) -> tuple[tuple[tuple[str, ...], str | None], ...]:
+    """
+    Requirement sets to try in order, each with the note recorded when it is the one
+    that matches: all requirements, then single drops, then pairwise drops.
+    """
+    steps: list[tuple[tuple[str, ...], str | None]] = [(requirements, None)]
     for drop in RELAXATION_ORDER:
         if drop not in requirements:
             continue
-        reduced = [r for r in requirements if r != drop]
-        eligible = _apply_filters(managers, reduced, segment, ticket_type, language_label)
-        if eligible:
-            relaxed.append(drop)
-            ticket["_skill_relaxation"] = f"Снято требование: {_relaxation_label(drop)}"
-            return eligible
+        reduced = tuple(r for r in requirements if r != drop)
+        steps.append((reduced, f"Снято требование: {_relaxation_label(drop)}"))
 
     for i in range(len(RELAXATION_ORDER)):
         for j in range(i + 1, len(RELAXATION_ORDER)):
             drops = {RELAXATION_ORDER[i], RELAXATION_ORDER[j]}
-            reduced = [r for r in requirements if r not in drops]
-            eligible = _apply_filters(managers, reduced, segment, ticket_type, language_label)
-            if eligible:
-                labels = ", ".join(_relaxation_label(d) for d in drops)
-                ticket["_skill_relaxation"] = f"Сняты требования: {labels}"
-                return eligible
-
-    ticket["_skill_relaxation"] = "Все требования сняты, подходящих менеджеров нет"
-    return managers if managers else []
-
-
-def _apply_filters(
-    managers: list[dict],
-    requirements: list[str],
-    segment: str,
-    ticket_type: str,
-    language_label: str,
-) -> list[dict]:
-    result = managers
+            reduced = tuple(r for r in requirements if r not in drops)
+            labels = ", ".join(_relaxation_label(d) for d in drops)
+            steps.append((reduced, f"Сняты требования: {labels}"))
+    return tuple(steps)
 
-    if "vip" in requirements:
-        result = [m for m in result if "VIP" in (m.get("skills") or [])]
 
-    if "position" in requirements:
-        result = [m for m in result if m.get("position") == "Главный специалист"]
+def ticket_requirements(ticket: dict) -> tuple[tuple[str, ...], str]:
+    segment = ticket.get("segment", "Mass")
+    ticket_type = ticket.get("type", "Консультация")
+    language_label = ticket.get("language_label", "RU")
 
-    if "language" in requirements:
-        result = [m for m in result if language_label in (m.get("skills") or [])]
+    requirements = []
 
-    return result
+    if segment in ("VIP", "Priority"):
+        requirements.append("vip")
+
+    if ticket_type == "Смена данных":
+        requirements.append("position")
+
+    if language_label in ("KZ", "ENG"):
+        requirements.append("language")
+
+    return tuple(requirements), language_label
+
+
+def resolve_requirements(
+    requirements: tuple[str, ...],
+    language_label: str,
+    present: int,
+) -> tuple[int | None, str | None]:
+    """
+    Walk the relaxation ladder against a presence bitset. Returns the requirement mask
+    to filter with and its note, or (None, None) when no step can be served.
+    """
+    for reduced, note in _relaxation_ladder(requirements):
+        required = requirement_mask(reduced, language_label)
+        if can_serve(present, required):
+            return required, note
+    return None, None
 
 
 def _relaxation_label(req: str) -> str:
@@ -74,4 +120,4 @@ def _relaxation_label(req: str) -> str:
         "language": "язык (KZ/ENG)",
         "position": "должность (Главный специалист)",
         "vip": "навык VIP",
-    }.get(req, req)
\ No newline at end of file
+    }.get(req, req)
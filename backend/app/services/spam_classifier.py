@@ -0,0 +1,190 @@
+"""
+Local spam classifier: logistic regression over hashed n-grams plus a few dense features.
+
+- Word unigrams/bigrams and in-word character trigrams are hashed (crc32, stable across
+  processes) into 2^dim_bits buckets; only non-zero weights are stored.
+- Dense features (promo keyword / URL / invisible-char counts...) come from the caller,
+  see spam_prefiltering._dense_features.
+- Weights are trained from labelled history and saved as JSON; without a trained file
+  the model starts from seed weights on the dense features only.
+
+Training: python -m app.services.spam_classifier <labelled.csv|results.json> [out.json]
+"""
+
+import json
+import logging
+import math
+import random
+import re
+import zlib
+from pathlib import Path
+
+log = logging.getLogger("fire.spam")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_URL_TOKEN_RE = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d")
+
+MAX_TEXT_CHARS = 1000
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class HashedLinearModel:
+    def __init__(
+        self,
+        dim_bits: int = 20,
+        bias: float = 0.0,
+        dense: dict[str, float] | None = None,
+        weights: dict[int, float] | None = None,
+    ):
+        self.dim_bits = dim_bits
+        self._mask = (1 << dim_bits) - 1
+        self.bias = bias
+        self.dense = dict(dense or {})
+        self.weights = dict(weights or {})
+
+    def features(self, text: str) -> list[int]:
+        """Distinct hashed n-gram buckets of `text`."""
+        text = _URL_TOKEN_RE.sub(" urltoken ", text[:MAX_TEXT_CHARS].lower())
+        text = _DIGITS_RE.sub("0", text)
+        tokens = _TOKEN_RE.findall(text)
+        grams: set[str] = set()
+        prev = None
+        for tok in tokens:
+            grams.add("w:" + tok)
+            if prev is not None:
+                grams.add("b:" + prev + " " + tok)
+            prev = tok
+            padded = f"#{tok}#"
+            for i in range(len(padded) - 2):
+                grams.add("c:" + padded[i:i + 3])
+        mask = self._mask
+        return list({zlib.crc32(g.encode("utf-8")) & mask for g in grams})
+
+    def _logit(self, buckets: list[int], dense: dict[str, float]) -> float:
+        z = self.bias
+        for name, value in dense.items():
+            z += self.dense.get(name, 0.0) * value
+        if buckets:
+            w = self.weights
+            # Hashed buckets are averaged so long texts do not dominate by sheer length.
+            z += sum(w.get(b, 0.0) for b in buckets) / math.sqrt(len(buckets))
+        return z
+
+    def predict_proba(self, text: str, dense: dict[str, float]) -> float:
+        return _sigmoid(self._logit(self.features(text), dense))
+
+    def fit(
+        self,
+        samples: list[tuple[str, dict[str, float], int]],
+        epochs: int = 8,
+        lr: float = 0.2,
+        l2: float = 1e-4,
+        seed: int = 13,
+    ) -> "HashedLinearModel":
+        """Plain SGD on log-loss; the minority class is up-weighted to the majority's size."""
+        data = [(self.features(text), dense, label) for text, dense, label in samples]
+        positives = sum(1 for *_, y in data if y)
+        negatives = len(data) - positives
+        if not positives or not negatives:
+            raise ValueError("Need both spam and non-spam examples to train")
+        class_weight = {1: len(data) / (2 * positives), 0: len(data) / (2 * negatives)}
+
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for buckets, dense, y in data:
+                grad = (_sigmoid(self._logit(buckets, dense)) - y) * class_weight[y]
+                self.bias -= lr * grad
+                for name, value in dense.items():
+                    cur = self.dense.get(name, 0.0)
+                    self.dense[name] = cur - lr * (grad * value + l2 * cur)
+                if buckets:
+                    step = lr * grad / math.sqrt(len(buckets))
+                    for b in buckets:
+                        cur = self.weights.get(b, 0.0)
+                        self.weights[b] = cur - step - lr * l2 * cur
+        self.weights = {b: w for b, w in self.weights.items() if abs(w) > 1e-6}
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "version": 1,
+            "dim_bits": self.dim_bits,
+            "bias": self.bias,
+            "dense": self.dense,
+            "weights": {str(b): round(w, 6) for b, w in self.weights.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HashedLinearModel":
+        return cls(
+            dim_bits=int(data.get("dim_bits", 20)),
+            bias=float(data.get("bias", 0.0)),
+            dense={k: float(v) for k, v in (data.get("dense") or {}).items()},
+            weights={int(b): float(w) for b, w in (data.get("weights") or {}).items()},
+        )
+
+    def save(self, path: str | Path):
+        Path(path).write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str | Path) -> "HashedLinearModel":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def _load_labelled(path: str) -> list[tuple[str, int]]:
+    """
+    Pipeline results JSON (text / is_spam) or a CSV with description + is_spam columns.
+    Blank texts are skipped: the structural check answers those before the classifier.
+    """
+    if path.endswith(".json"):
+        rows = json.loads(Path(path).read_text(encoding="utf-8"))
+        if isinstance(rows, dict):
+            rows = rows.get("tickets", [])
+        labelled = [
+            (r.get("text") or r.get("description") or "", int(bool(r.get("is_spam"))))
+            for r in rows
+        ]
+    else:
+        import pandas as pd
+
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        text_col = next(c for c in df.columns if c.strip().lower() in ("description", "text", "описание"))
+        labelled = [
+            (text, int(label.strip().lower() in ("1", "true", "yes", "spam")))
+            for text, label in zip(df[text_col], df["is_spam"])
+        ]
+    return [(text, y) for text, y in labelled if text.strip()]
+
+
+if __name__ == "__main__":
+    import sys
+
+    from app.core.config import get_settings
+    from app.services.spam_prefiltering import DEFAULT_MODEL_PATH, _dense_features, _seed_model
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if len(sys.argv) < 2:
+        print("usage: python -m app.services.spam_classifier <labelled.csv|results.json> [out.json]")
+        sys.exit(2)
+    out = sys.argv[2] if len(sys.argv) > 2 else (get_settings().SPAM_MODEL_PATH or str(DEFAULT_MODEL_PATH))
+
+    labelled = _load_labelled(sys.argv[1])
+    model = _seed_model().fit([(text, _dense_features(text), y) for text, y in labelled])
+    model.save(out)
+
+    threshold = get_settings().SPAM_THRESHOLD
+    correct = sum(
+        (model.predict_proba(text, _dense_features(text)) >= threshold) == bool(y)
+        for text, y in labelled
+    )
+    print(f"trained on {len(labelled)} tickets, {len(model.weights)} weights, "
+          f"train accuracy {correct / len(labelled):.3f} -> {out}")
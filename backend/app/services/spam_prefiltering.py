@@ -2,17 +2,25 @@
 Step 3: SPAM prefiltering
 Identifies spam and marks it to make sure that we save the time and compute and not label spam tickets in the later steps
 
-- Uses a lightweight, fast LLM to preprocess each row to detect SPAM tickets
+- Structural rules catch obvious spam (invisible chars, promo keywords + URLs)
+- A trained local hashed n-gram classifier decides the clear cases in-process
+- A lightweight, fast LLM is asked when the classifier is unsure (between SPAM_LOCAL_LOW
+  and SPAM_LOCAL_HIGH) or when no trained weights are loaded
 """
+import asyncio
 import re
-import httpx
 import logging
 from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
 from typing import Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
+from app.core.http_clients import http_clients
+from app.core.rate_limiter import rate_limiters
+from app.services.spam_classifier import HashedLinearModel
 
 log = logging.getLogger("fire.spam")
 
@@ -74,6 +82,55 @@ def _structural_check(text: str) -> SpamResult | None:
     return None
 
 
+# Shipped weights: python -m app.services.spam_classifier results_new.json (the labelled
+# pipeline run in the repo root). Retrain on a larger history and point SPAM_MODEL_PATH at it.
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent.parent / "data" / "spam_model.json"
+
+
+def _dense_features(text: str) -> dict[str, float]:
+    return {
+        "promo": float(min(len(_PROMO_RE.findall(text)), 5)),
+        "url": float(min(len(_URL_RE.findall(text)), 3)),
+        "invisible": min(len(_INVISIBLE_RE.findall(text)), 30) / 10,
+    }
+
+
+def _seed_model() -> HashedLinearModel:
+    # Starting point for training: the dense features only, leaning towards not spam
+    # (clients paste links and ask about "акции").
+    return HashedLinearModel(bias=-3.0, dense={"promo": 2.0, "url": 2.4, "invisible": 1.0})
+
+
+@lru_cache(maxsize=1)
+def get_spam_model() -> HashedLinearModel | None:
+    """Trained classifier from SPAM_MODEL_PATH, or None when there is none to load."""
+    path = Path(get_settings().SPAM_MODEL_PATH or DEFAULT_MODEL_PATH)
+    if path.is_file():
+        try:
+            model = HashedLinearModel.load(path)
+            log.info("Spam classifier loaded from %s (%d weights)", path, len(model.weights))
+            return model
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Spam classifier at %s unreadable (%s) — every ticket goes to the LLM", path, e)
+    return None
+
+
+def _local_check(text: str) -> SpamResult | None:
+    """
+    Classifier verdict when it is confident: not spam below SPAM_LOCAL_LOW, spam from
+    SPAM_LOCAL_HIGH up. None (ask the LLM) in between, and always without trained weights:
+    the seed weights only see promo/URL counts and would wave ordinary tickets through.
+    """
+    model = get_spam_model()
+    if model is None:
+        return None
+    settings = get_settings()
+    p = model.predict_proba(text, _dense_features(text))
+    if settings.SPAM_LOCAL_LOW <= p < settings.SPAM_LOCAL_HIGH:
+        return None
+    return SpamResult(p >= settings.SPAM_LOCAL_HIGH, round(p, 4), f"Local classifier: p={p:.2f}")
+
+
 async def _llm_check(text: str) -> SpamResult:
     settings = get_settings()
     cleaned = _URL_RE.sub('[URL]', text)
@@ -81,7 +138,8 @@ async def _llm_check(text: str) -> SpamResult:
     cleaned = re.sub(r'\s+', ' ', cleaned).strip()[:500]
 
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
+        client = http_clients.get("openrouter")
+        async with rate_limiters.get("openrouter").slot("spam") as slot:
             resp = await client.post(
                 f"{settings.OPENROUTER_BASE_URL}/chat/completions",
                 headers={
@@ -94,51 +152,12 @@ async def _llm_check(text: str) -> SpamResult:
                     "max_tokens": 5,
                     "temperature": 0,
                 },
+                timeout=5.0,
             )
-            resp.raise_for_status()
-            answer = resp.json()["choices"][0]["message"]["content"].strip().upper()
-
-            is_spam = "SPAM" in answer and "NOT" not in answer
-            return SpamResult(
-                is_spam=is_spam,
-                probability=0.85 if is_spam else 0.15,
-                reason=f"LLM ({SPAM_MODEL}): {answer}",
-            )
-    except Exception as e:
-        log.warning("Spam LLM call failed: %s — passing ticket through", e)
-        return SpamResult(False, 0.0, f"LLM error: {e} — defaulting to not spam")
-
-
-def detect_spam_sync(text: str) -> SpamResult:
-    structural = _structural_check(text)
-    if structural:
-        return structural
-
-    settings = get_settings()
-    cleaned = _URL_RE.sub('[URL]', text)
-    cleaned = _INVISIBLE_RE.sub('', cleaned)
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()[:500]
-
-    if len(cleaned) < 5:
-        return SpamResult(False, 0.0, "Too short for LLM — not spam")
-
-    try:
-        resp = httpx.post(
-            f"{settings.OPENROUTER_BASE_URL}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": SPAM_MODEL,
-                "messages": [{"role": "user", "content": SPAM_PROMPT.format(text=cleaned)}],
-                "max_tokens": 5,
-                "temperature": 0,
-            },
-            timeout=5.0,
-        )
+            slot.observe(resp)
         resp.raise_for_status()
         answer = resp.json()["choices"][0]["message"]["content"].strip().upper()
+
         is_spam = "SPAM" in answer and "NOT" not in answer
         return SpamResult(
             is_spam=is_spam,
@@ -146,8 +165,8 @@ def detect_spam_sync(text: str) -> SpamResult:
             reason=f"LLM ({SPAM_MODEL}): {answer}",
         )
     except Exception as e:
-        log.warning("Spam LLM call failed: %s", e)
-        return SpamResult(False, 0.0, f"LLM error — defaulting to not spam")
+        log.warning("Spam LLM call failed: %s — passing ticket through", e)
+        return SpamResult(False, 0.0, f"LLM error: {e} — defaulting to not spam")
 
 
 async def detect_spam(text: str) -> SpamResult:
@@ -162,6 +181,10 @@ async def detect_spam(text: str) -> SpamResult:
     if len(cleaned) < 5:
         return SpamResult(False, 0.0, "Too short for LLM — not spam")
 
+    local = _local_check(text)
+    if local:
+        return local
+
     return await _llm_check(text)
 
 
@@ -207,14 +230,34 @@ def fill_spam_ticket(ticket: dict, result: SpamResult) -> dict:
     return ticket
 
 
-def check_spam_ticket(ticket: dict) -> dict:
-    text = ticket.get("description") or ""
-    result = _structural_check(text)
-    if result is None:
-        result = detect_spam_sync(text)
+async def check_spam_ticket(ticket: dict) -> dict:
+    """File-mode spam check on a ticket dict; uses the anonymized text when masking already ran."""
+    text = ticket.get("description_anonymized") or ticket.get("description") or ""
+    result = await detect_spam(text)
     ticket["is_spam"] = result.is_spam
     ticket["spam_probability"] = result.probability
     ticket["spam_reason"] = result.reason
     if result.is_spam:
         fill_spam_ticket(ticket, result)
-    return ticket
\ No newline at end of file
+    return ticket
+
+
+async def check_spam_batch(
+    tickets: list[dict],
+    concurrency: int | None = None,
+    before_check=None,
+) -> list[dict]:
+    """
+    Spam-check many tickets concurrently, at most `concurrency` (PIPELINE_SPAM_CONCURRENCY)
+    at a time. `before_check(ticket)` runs right before each ticket's check (e.g. PII
+    masking), so cheap CPU work overlaps with the LLM calls already in flight.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency or get_settings().PIPELINE_SPAM_CONCURRENCY))
+
+    async def _one(t: dict) -> dict:
+        async with sem:
+            if before_check is not None:
+                before_check(t)
+            return await check_spam_ticket(t)
+
+    return list(await asyncio.gather(*[_one(t) for t in tickets]))
@@ -0,0 +1,61 @@
+"""
+In-memory ticket store for the file-mode pipeline.
+
+Tickets are the dicts produced by csv_parser.parse_tickets, indexed once by
+csv_row_index. Stages either mutate those dicts directly (spam, LLM, geocoding)
+or return per-row results that apply() writes back in O(1) per ticket
+(priority, routing).
+"""
+
+from typing import Callable, Iterable, Iterator
+
+ROW_KEY = "csv_row_index"
+
+
+class TicketStore:
+    def __init__(self, tickets: Iterable[dict]):
+        self._by_row: dict[int, dict] = {}
+        for ticket in tickets:
+            row = ticket[ROW_KEY]
+            if row in self._by_row:
+                raise ValueError(f"Duplicate {ROW_KEY}: {row}")
+            self._by_row[row] = ticket
+
+    def __len__(self) -> int:
+        return len(self._by_row)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._by_row.values())
+
+    def __getitem__(self, row: int) -> dict:
+        return self._by_row[row]
+
+    def get(self, row: int) -> dict | None:
+        return self._by_row.get(row)
+
+    def tickets(self) -> list[dict]:
+        """All tickets in csv order (the same dict objects, not copies)."""
+        return list(self._by_row.values())
+
+    def select(self, predicate: Callable[[dict], bool]) -> list[dict]:
+        return [t for t in self._by_row.values() if predicate(t)]
+
+    def count(self, predicate: Callable[[dict], bool]) -> int:
+        return sum(1 for t in self._by_row.values() if predicate(t))
+
+    def apply(self, results: Iterable[dict], fields: dict[str, str]) -> int:
+        """
+        Write stage results into their tickets. Each result carries csv_row_index;
+        `fields` maps result keys to ticket keys. Results for unknown rows are ignored.
+        Returns the number of tickets updated.
+        """
+        by_row = self._by_row
+        updated = 0
+        for result in results:
+            ticket = by_row.get(result[ROW_KEY])
+            if ticket is None:
+                continue
+            for src, dst in fields.items():
+                ticket[dst] = result.get(src)
+            updated += 1
+        return updated
@@ -0,0 +1,20 @@
+"""
+Timing helpers for the @pytest.mark.benchmark tests, which are skipped by default:
+python -m pytest -s -m benchmark (or FIRE_BENCH=1) runs them and shows the numbers.
+"""
+
+import time
+
+
+def best_of(fn, *args, repeat: int = 3) -> float:
+    """Fastest wall time of `repeat` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def report(name: str, **timings: float):
+    print(f"\n[bench] {name}: " + ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in timings.items()))
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: timing test; skipped unless FIRE_BENCH=1 or selected with -m benchmark",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    # Wall-clock assertions depend on the machine and its load, so they stay out of the default run.
+    if os.environ.get("FIRE_BENCH") or "benchmark" in (config.getoption("markexpr") or ""):
+        return
+    skip = pytest.mark.skip(reason="benchmark: set FIRE_BENCH=1 or run with -m benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,47 @@
+"""Synthetic rosters and tickets for routing tests, deterministic per seed."""
+
+import random
+
+from app.services.geo_filtering import KNOWN_CITY_COORDS
+from app.services.routing import DIFFICULTY
+
+CITIES = sorted(KNOWN_CITY_COORDS)
+POSITIONS = ["Специалист", "Ведущий специалист", "Главный специалист"]
+SKILLS = ["VIP", "ENG", "KZ"]
+
+
+def make_managers(n: int, seed: int = 0, offices: list[str] | None = None) -> list[dict]:
+    rng = random.Random(seed)
+    offices = offices or CITIES
+    return [
+        {
+            "id": i + 1,
+            "full_name": f"Менеджер {i + 1}",
+            "position": rng.choice(POSITIONS),
+            "office": rng.choice(offices),
+            "skills": [s for s in SKILLS if rng.random() < 0.4],
+            "csv_load": rng.randint(0, 5),
+        }
+        for i in range(n)
+    ]
+
+
+def make_tickets(n: int, seed: int = 0, located: float = 0.8) -> list[dict]:
+    """Tickets near a known city (share `located`) or without coordinates."""
+    rng = random.Random(seed)
+    tickets = []
+    for i in range(n):
+        lat = lon = None
+        if rng.random() < located:
+            lat, lon = KNOWN_CITY_COORDS[rng.choice(CITIES)]
+            lat, lon = lat + rng.uniform(-1.5, 1.5), lon + rng.uniform(-1.5, 1.5)
+        tickets.append({
+            "csv_row_index": i,
+            "type": rng.choice(list(DIFFICULTY)),
+            "segment": rng.choice(["Mass", "Mass", "VIP", "Priority"]),
+            "language_label": rng.choice(["RU", "RU", "KZ", "ENG"]),
+            "latitude": lat,
+            "longitude": lon,
+            "priority": {"final": rng.randint(1, 10)},
+        })
+    return tickets
@@ -0,0 +1,40 @@
+"""Frozen copy of the original row-by-row ticket parser (df.iterrows + scalar helpers)."""
+
+from collections import Counter
+
+from app.services.csv_parser import (
+    _clean,
+    _compute_age,
+    _normalize_country,
+    _parse_attachments,
+    _parse_date,
+    _read_csv_from_bytes,
+    _rename_ticket_columns,
+)
+
+
+def parse_tickets(data: bytes) -> list[dict]:
+    df = _rename_ticket_columns(_read_csv_from_bytes(data))
+    guid_counts = dict(Counter(df["guid"].str.strip())) if "guid" in df.columns else {}
+    tickets = []
+    for idx, row in df.iterrows():
+        guid = _clean(row.get("guid"))
+        birth_date = _parse_date(row.get("birth_date"))
+        tickets.append({
+            "ticket_id": idx + 1,
+            "csv_row_index": idx,
+            "guid": guid,
+            "gender": _clean(row.get("gender")),
+            "birth_date": str(birth_date) if birth_date else None,
+            "age": _compute_age(birth_date),
+            "description": _clean(row.get("description")),
+            "attachments": _parse_attachments(row.get("attachments")),
+            "segment": _clean(row.get("segment")) or "Mass",
+            "country": _normalize_country(row.get("country")),
+            "region": _clean(row.get("region")),
+            "city": _clean(row.get("city")),
+            "street": _clean(row.get("street")),
+            "house": _clean(row.get("house")),
+            "guid_count": guid_counts.get(guid, 0) if guid else 0,
+        })
+    return tickets
@@ -0,0 +1,146 @@
+"""
+Frozen copy of the original linear routing (geo filter -> skill filter -> least
+loaded, one scan over the managers per ticket). Routing optimisations are checked
+against it; do not change it along with them.
+"""
+
+from app.services.geo_filtering import _POSITION_DISPLAY, _haversine, get_office_coords
+from app.services.routing import DIFFICULTY, init_manager_loads
+
+RELAXATION_ORDER = ["language", "position", "vip"]
+_LABELS = {
+    "language": "язык (KZ/ENG)",
+    "position": "должность (Главный специалист)",
+    "vip": "навык VIP",
+}
+_DB_LABELS = {"language": "язык (KZ/ENG)", "position": "должность", "vip": "VIP"}
+
+
+def filter_by_geo(ticket: dict, managers: list[dict]) -> list[dict]:
+    ticket_lat = ticket.get("latitude")
+    ticket_lon = ticket.get("longitude")
+    if ticket_lat is None or ticket_lon is None:
+        ticket["_geo_filter_note"] = "Координаты тикета отсутствуют — гео-фильтрация пропущена"
+        return managers
+
+    distances = []
+    for m in managers:
+        coords = get_office_coords(m.get("office", "").strip())
+        if coords is not None:
+            distances.append((m, _haversine(ticket_lat, ticket_lon, coords[0], coords[1])))
+    if not distances:
+        ticket["_geo_filter_note"] = "Координаты офисов не найдены — гео-фильтрация пропущена"
+        return managers
+
+    distances.sort(key=lambda x: x[1])
+    min_dist = distances[0][1]
+    max_allowed = max(50, min_dist * 1.5)
+    eligible = [m for m, d in distances if d <= max_allowed]
+    ticket["_geo_filter_note"] = (
+        f"Ближайший офис: {distances[0][0].get('office')} ({min_dist:.0f} км). "
+        f"Порог: {max_allowed:.0f} км. "
+        f"Прошли: {len(eligible)}/{len(distances)} менеджеров."
+    )
+    return eligible
+
+
+def apply_filters(managers: list[dict], requirements: list[str], language_label: str) -> list[dict]:
+    result = managers
+    if "vip" in requirements:
+        result = [m for m in result if "VIP" in (m.get("skills") or [])]
+    if "position" in requirements:
+        result = [m for m in result if m.get("position") == "Главный специалист"]
+    if "language" in requirements:
+        result = [m for m in result if language_label in (m.get("skills") or [])]
+    return result
+
+
+def filter_by_skill(ticket: dict, managers: list[dict]) -> list[dict]:
+    language_label = ticket.get("language_label", "RU")
+    requirements = []
+    if ticket.get("segment", "Mass") in ("VIP", "Priority"):
+        requirements.append("vip")
+    if ticket.get("type", "Консультация") == "Смена данных":
+        requirements.append("position")
+    if language_label in ("KZ", "ENG"):
+        requirements.append("language")
+
+    eligible = apply_filters(managers, requirements, language_label)
+    if eligible:
+        ticket["_skill_relaxation"] = None
+        return eligible
+    for drop in RELAXATION_ORDER:
+        if drop not in requirements:
+            continue
+        eligible = apply_filters(managers, [r for r in requirements if r != drop], language_label)
+        if eligible:
+            ticket["_skill_relaxation"] = f"Снято требование: {_LABELS[drop]}"
+            return eligible
+    for i in range(len(RELAXATION_ORDER)):
+        for j in range(i + 1, len(RELAXATION_ORDER)):
+            drops = {RELAXATION_ORDER[i], RELAXATION_ORDER[j]}
+            eligible = apply_filters(managers, [r for r in requirements if r not in drops], language_label)
+            if eligible:
+                ticket["_skill_relaxation"] = f"Сняты требования: {', '.join(_LABELS[d] for d in drops)}"
+                return eligible
+    ticket["_skill_relaxation"] = "Все требования сняты, подходящих менеджеров нет"
+    return managers
+
+
+def route_batch(tickets: list[dict], managers: list[dict]) -> list[dict]:
+    """(csv_row_index, manager id or None, load after) per ticket, in routing order."""
+    sorted_tickets = sorted(tickets, key=lambda t: t["priority"]["final"], reverse=True)
+    loads = init_manager_loads(managers)
+    out = []
+    for ticket in sorted_tickets:
+        difficulty = DIFFICULTY.get(ticket.get("type", "Консультация"))
+        if difficulty is None:
+            out.append((ticket["csv_row_index"], None, None))
+            continue
+        eligible = filter_by_skill(ticket, filter_by_geo(ticket, managers))
+        if not eligible:
+            out.append((ticket["csv_row_index"], None, None))
+            continue
+        best = min(eligible, key=lambda m: loads.get(m["id"], 0))
+        loads[best["id"]] += difficulty
+        out.append((ticket["csv_row_index"], best["id"], loads[best["id"]]))
+    return out
+
+
+def filter_candidates_by_skills(candidates, segment, ticket_type, language_label):
+    """DB-mode skill filter as it was before capability masks: (kept candidates, note)."""
+    if not candidates:
+        return [], None
+    language_label = language_label or "RU"
+    requirements = []
+    if (segment or "Mass") in ("VIP", "Priority"):
+        requirements.append("vip")
+    if (ticket_type or "Консультация") == "Смена данных":
+        requirements.append("position")
+    if language_label in ("KZ", "ENG"):
+        requirements.append("language")
+
+    def keep(reduced):
+        out = []
+        for c in candidates:
+            skills = list(c.manager.skills or [])
+            pos = _POSITION_DISPLAY.get(c.manager.position, "Специалист")
+            if "vip" in reduced and "VIP" not in skills:
+                continue
+            if "position" in reduced and pos != "Главный специалист":
+                continue
+            if "language" in reduced and language_label not in skills:
+                continue
+            out.append(c)
+        return out
+
+    eligible = keep(requirements)
+    if eligible:
+        return eligible, None
+    for drop in ["language", "position", "vip"]:
+        if drop not in requirements:
+            continue
+        eligible = keep([r for r in requirements if r != drop])
+        if eligible:
+            return eligible, f"Снято: {_DB_LABELS[drop]}"
+    return candidates, "Все требования сняты"
@@ -0,0 +1,46 @@
+import asyncio
+
+from app.core.cache import WriteBehindQueue
+
+
+def _flaky(failures: int):
+    stored: list = []
+    calls = {"n": 0}
+
+    async def flush(batch):
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise RuntimeError("database unavailable")
+        stored.extend(batch)
+
+    return flush, stored
+
+
+def test_failed_batch_is_retried_on_the_next_flush():
+    flush, stored = _flaky(failures=2)
+    queue = WriteBehindQueue("test", flush, batch_size=2, retries=3)
+
+    async def run():
+        for i in range(3):
+            queue.put(i)
+        for _ in range(3):
+            await queue.flush()
+
+    asyncio.run(run())
+    assert stored == [0, 1, 2]
+    assert queue.failed == 0
+    assert queue.retried == 4
+
+
+def test_rows_are_dropped_once_retries_run_out():
+    flush, stored = _flaky(failures=10)
+    queue = WriteBehindQueue("test", flush, batch_size=5, retries=2)
+
+    async def run():
+        queue.put("a")
+        await queue.stop()
+
+    asyncio.run(run())
+    assert stored == []
+    assert queue.failed == 1
+    assert queue.stats()["pending"] == 0
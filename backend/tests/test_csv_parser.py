@@ -0,0 +1,117 @@
+import asyncio
+import io
+import random
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from app.services import csv_parser
+from app.services.csv_parser import parse_tickets
+
+from tests import reference_ingest
+from tests.bench import best_of, report
+
+REPO = Path(__file__).resolve().parents[2]
+BUNDLED = [REPO / "tickets.csv", REPO / "tickets_augmented.csv"]
+ODD_DATES = [
+    "", "  ", "31/02/1990", "1/1/1800 0:00", "12/31/2999 0:00", "1990-05-17", "17.05.1990", "вчера",
+    "2000-02-29 10:30", "2/29/2204 0:00", "2100-05-17", "May 5 1990",
+]
+
+
+def _synthetic(rows: int, seed: int = 0) -> bytes:
+    """Bundled rows resampled with shuffled birth dates, odd date strings and country spellings."""
+    rng = random.Random(seed)
+    source = pd.read_csv(BUNDLED[0], dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    df = source.sample(n=rows, replace=True, random_state=seed).reset_index(drop=True)
+    date_col, country_col = source.columns[2], source.columns[6]
+    df[date_col] = [
+        rng.choice(ODD_DATES) if rng.random() < 0.1 else f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/{rng.randint(1940, 2010)} 0:00"
+        for _ in range(rows)
+    ]
+    df[country_col] = [rng.choice(["Казахстан", "kazakhstan", " KZ ", "Россия", ""]) for _ in range(rows)]
+    out = io.StringIO()
+    df.to_csv(out, index=False)
+    return out.getvalue().encode("utf-8")
+
+
+# Fields the parser fills; the rest of a ticket dict is None until later stages.
+_PARSED_KEYS = (
+    "ticket_id", "csv_row_index", "guid", "gender", "birth_date", "age", "description",
+    "attachments", "segment", "country", "region", "city", "street", "house", "guid_count",
+)
+
+
+def _comparable(tickets: list[dict]) -> list[dict]:
+    return [{k: t[k] for k in _PARSED_KEYS} for t in tickets]
+
+
+@pytest.mark.parametrize("path", BUNDLED, ids=lambda p: p.name)
+def test_bundled_csvs_parse_like_the_row_parser(path):
+    data = path.read_bytes()
+    assert _comparable(parse_tickets(data=data)) == reference_ingest.parse_tickets(data)
+
+
+def test_synthetic_csv_parses_like_the_row_parser():
+    data = _synthetic(3000)
+    assert _comparable(parse_tickets(data=data)) == reference_ingest.parse_tickets(data)
+
+
+@pytest.mark.benchmark
+def test_columnar_parse_is_faster_than_the_row_parser():
+    data = _synthetic(20_000, seed=1)
+    old = best_of(reference_ingest.parse_tickets, data, repeat=1)
+    new = best_of(lambda d: parse_tickets(data=d), data)
+    # Both include reading the CSV, which is now most of the columnar time.
+    report("parse_tickets 20k rows", row_parser=old, columnar=new)
+    assert new * 3 < old
+
+
+class _IngestSession:
+    """Records the statements ingest_tickets_stream runs; flush() gives new rows their id."""
+
+    def __init__(self):
+        self.added, self.executed = [], []
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def flush(self):
+        for obj in self.added:
+            if obj.id is None:
+                obj.id = uuid.uuid4()
+
+    async def execute(self, stmt, params=None):
+        self.executed.append((stmt, params))
+
+    def begin_nested(self):
+        return _Nested()
+
+
+class _Nested:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_stream_guid_fix_up_only_touches_its_own_upload(monkeypatch):
+    async def send_update(**event):
+        pass
+
+    monkeypatch.setattr(csv_parser.sse_manager, "send_update", send_update)
+    data = "GUID клиента,Сегмент клиента\na,Mass\nb,VIP\na,Mass\nc,Mass\n".encode("utf-8")
+    db = _IngestSession()
+
+    result = asyncio.run(csv_parser.ingest_tickets_stream(db, io.BytesIO(data), "t.csv", chunk_rows=2))
+    inserted = [row for stmt, params in db.executed if stmt.is_insert for row in params]
+    assert {row["batch_id"] for row in inserted} == {uuid.UUID(result["batch_id"])}
+
+    fix_up, params = db.executed[-1]
+    assert fix_up.is_update
+    assert "tickets.batch_id = " in str(fix_up) and "created_at" not in str(fix_up)
+    assert fix_up.compile().params["batch_id_1"] == uuid.UUID(result["batch_id"])
+    assert params == [{"g": "a", "n": 2}]
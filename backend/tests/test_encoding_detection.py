@@ -0,0 +1,42 @@
+import codecs
+from pathlib import Path
+
+import chardet
+import pytest
+
+from app.services.csv_parser import _detect_encoding
+
+from tests.bench import best_of, report
+
+REPO = Path(__file__).resolve().parents[2]
+
+
+def _variants():
+    """Each bundled CSV as shipped, without its BOM (about 300 KB) and re-encoded to cp1251."""
+    for name in ("tickets.csv", "tickets_augmented.csv"):
+        raw = (REPO / name).read_bytes()
+        body = raw[len(codecs.BOM_UTF8):] if raw.startswith(codecs.BOM_UTF8) else raw
+        big = body * max(1, 300_000 // len(body))
+        cp1251 = big.decode("utf-8").encode("cp1251", errors="replace")
+        yield pytest.param(name, raw, "bom", id=name)
+        yield pytest.param(f"{name}/no-bom", big, "utf8-strict", id=f"{name}/no-bom")
+        yield pytest.param(f"{name}/cp1251", cp1251, "prefix", id=f"{name}/cp1251")
+
+
+@pytest.mark.parametrize("label, data, path", list(_variants()))
+def test_detection_path_agrees_with_a_full_chardet_scan(label, data, path):
+    enc, how = _detect_encoding(data)
+    assert how == path
+    # Same text as the old full scan would have produced.
+    full = chardet.detect(data)["encoding"]
+    assert data.decode(enc) == data.decode(full)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("label, data, path", list(_variants()))
+def test_detection_is_faster_than_a_full_chardet_scan(label, data, path):
+    old = best_of(chardet.detect, data, repeat=1)
+    new = best_of(_detect_encoding, data)
+    report(f"encoding {label} ({len(data) // 1024} KB)", chardet_full=old, detect=new)
+    if path != "bom":  # chardet stops at a BOM too
+        assert new * 2 < old
@@ -0,0 +1,99 @@
+import asyncio
+import math
+import random
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.models.models import ManagerPositionEnum, Ticket
+from app.services import geo_filtering
+from app.services.geo_filtering import KNOWN_CITY_COORDS, ManagerCandidate, OfficeIndex, _haversine, geo_scope, haversine_matrix
+from app.services.routing import Router
+
+from tests.factories import make_managers
+
+
+@pytest.mark.parametrize("lat, lon", [(math.nan, 71.4), (51.1, math.nan), (math.inf, 71.4)])
+def test_non_finite_coordinates_skip_geo_filtering(lat, lon):
+    managers = make_managers(20, seed=2)
+    index = OfficeIndex(managers)
+    ticket = {"latitude": lat, "longitude": lon}
+
+    assert geo_scope(ticket, index) is None
+    assert "отсутствуют" in ticket["_geo_filter_note"]
+    assert index.distances_within(lat, lon)[2] == []
+
+    router = Router(managers, office_index=index)
+    row = router.distance_matrix([ticket])[0]
+    assert geo_scope(dict(ticket), index, row) is None
+    assert router.assign({**ticket, "type": "Жалоба"})["manager_id"] is not None
+
+
+def _points(n: int, seed: int) -> tuple[list[float], list[float]]:
+    rng = random.Random(seed)
+    return [rng.uniform(-90, 90) for _ in range(n)], [rng.uniform(-180, 180) for _ in range(n)]
+
+
+def test_haversine_matrix_matches_the_scalar_reference():
+    lat1, lon1 = _points(300, seed=1)
+    # Offices plus edge cases: the same point, antipodes, the poles and the date line.
+    lat2 = [c[0] for c in KNOWN_CITY_COORDS.values()] + [lat1[0], -lat1[0], 90.0, -90.0, 0.0]
+    lon2 = [c[1] for c in KNOWN_CITY_COORDS.values()] + [lon1[0], lon1[0] - 180, 0.0, 0.0, 180.0]
+
+    matrix = haversine_matrix(lat1, lon1, lat2, lon2)
+    expected = np.array([[_haversine(a, b, c, d) for c, d in zip(lat2, lon2)] for a, b in zip(lat1, lon1)])
+    assert matrix.shape == (300, len(lat2))
+    np.testing.assert_allclose(matrix, expected, rtol=0, atol=1e-6)
+
+    narrow = haversine_matrix(lat1, lon1, lat2, lon2, dtype=np.float32)
+    assert narrow.dtype == np.float32
+    np.testing.assert_allclose(narrow, expected, rtol=0, atol=1e-3)  # within a metre
+
+
+def test_distance_rows_select_the_same_offices_as_the_kd_tree():
+    index = OfficeIndex(make_managers(40, seed=5))
+    lats, lons = _points(200, seed=2)
+    rows = index.distance_matrix(lats, lons)
+    for lat, lon, row in zip(lats, lons, rows):
+        by_tree = index.distances_within(lat, lon)
+        by_row = index.distances_within(lat, lon, row=row)
+        assert sorted(i for i, _ in by_tree[2]) == sorted(i for i, _ in by_row[2])
+        assert by_tree[0] == pytest.approx(by_row[0], abs=1e-6)
+
+
+class _Expiring:
+    """Stands in for an ORM instance: attribute access fails once its session rolled back."""
+
+    def __init__(self, **columns):
+        self.__dict__.update(columns, expired=False)
+
+    def __getattribute__(self, name):
+        if name != "__dict__" and self.__dict__["expired"]:
+            raise RuntimeError("MissingGreenlet: instance expired by another session")
+        return object.__getattribute__(self, name)
+
+
+def test_candidate_cache_survives_a_rollback_in_the_loading_session(monkeypatch):
+    office = _Expiring(id=uuid.uuid4(), name="Астана")
+    manager = _Expiring(id=uuid.uuid4(), skills=["VIP"], position=ManagerPositionEnum.главный_специалист)
+
+    async def get_candidate_managers(ticket, db, max_km):
+        return [ManagerCandidate(manager=manager, business_unit=office, distance_km=3.0, office_name="Астана")]
+
+    monkeypatch.setattr(geo_filtering, "get_candidate_managers", get_candidate_managers)
+    cache, sink = {}, SimpleNamespace(add=lambda obj: None)
+
+    def assign():
+        ticket = Ticket(id=uuid.uuid4(), latitude=51.1, longitude=71.4)
+        return asyncio.run(geo_filtering.assign_ticket_to_nearest(
+            ticket, db=None, segment="VIP", sink=sink, candidate_cache=cache,
+        ))
+
+    first = assign()[0]
+    manager.expired = office.expired = True  # the loading worker's session rolled back
+    second, _, skills_info = assign()
+    assert second.manager_id == first.manager_id
+    assert second.business_unit_id == first.business_unit_id
+    assert skills_info["relaxation"] is None
@@ -0,0 +1,142 @@
+import asyncio
+from collections import Counter
+
+import httpx
+import pytest
+
+from app.core.rate_limiter import AdaptiveLimiter
+from app.services import geocoder
+
+WINNER = "Бишкек, Кыргызстан"
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """Fake provider lookups: WINNER answers at once, every other query hangs."""
+    started, cancelled = [], []
+
+    async def lookup(query):
+        started.append(query)
+        if query == WINNER:
+            return (42.87, 74.59), "nominatim"
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+
+    monkeypatch.setattr(geocoder, "_geocode_providers", lookup)
+    monkeypatch.setattr(geocoder, "lookup_city", lambda *a, **kw: None)
+    monkeypatch.setattr(geocoder, "_cache", geocoder.LRUCache(maxsize=100))
+    return started, cancelled
+
+
+def test_cis_fanout_cancels_the_losing_lookups(providers, monkeypatch):
+    started, cancelled = providers
+    # The losers never answer, so every country has to be in flight at once.
+    monkeypatch.setattr(geocoder.get_settings(), "GEOCODE_CIS_FANOUT", len(geocoder.CIS_COUNTRIES))
+
+    async def run():
+        result = await geocoder._search_city_in_cis("Бишкек")
+        await asyncio.sleep(0)  # let the cancellations land
+        return result
+
+    coords, provider, _ = asyncio.run(run())
+    assert coords == (42.87, 74.59)
+    assert provider == "nominatim_cis"
+    assert sorted(cancelled) == sorted(q for q in started if q != WINNER)
+    assert not geocoder._inflight
+    assert not geocoder._inflight_waiters
+
+
+def test_shared_lookup_survives_one_cancelled_waiter(providers):
+    started, cancelled = providers
+
+    async def run():
+        first = asyncio.ensure_future(geocoder._geocode("Ош, Кыргызстан"))
+        second = asyncio.ensure_future(geocoder._geocode("Ош, Кыргызстан"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        alive = not cancelled
+        second.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return alive
+
+    assert asyncio.run(run()) is True
+    assert started == ["Ош, Кыргызстан"]
+    assert cancelled == ["Ош, Кыргызстан"]
+
+
+def test_cis_fanout_queues_on_the_nominatim_limiter(monkeypatch):
+    monkeypatch.setattr(geocoder, "lookup_city", lambda *a, **kw: None)
+    monkeypatch.setattr(geocoder, "_cache", geocoder.LRUCache(maxsize=100))
+
+    async def no_2gis(query):
+        return None
+
+    monkeypatch.setattr(geocoder, "_geocode_2gis", no_2gis)
+    limiter = AdaptiveLimiter("nominatim", initial=1, max_limit=1, max_rps=500)
+    monkeypatch.setattr(geocoder.rate_limiters, "get", lambda name: limiter)
+
+    queries, in_flight = [], []
+
+    class Client:
+        async def get(self, path, params):
+            in_flight.append(limiter.in_flight)
+            queries.append(params["q"])
+            await asyncio.sleep(0.001)
+            return httpx.Response(200, json=[], request=httpx.Request("GET", "https://nominatim.test" + path))
+
+    monkeypatch.setattr(geocoder.http_clients, "get", lambda name: Client())
+
+    coords, provider, _ = asyncio.run(geocoder._search_city_in_cis("Нигдеград"))
+    assert coords is None and provider == "cis_failed"
+    assert sorted(queries) == sorted(f"Нигдеград, {c}" for c in geocoder.CIS_COUNTRIES)
+    assert set(in_flight) == {1}
+
+
+def test_cis_search_order_is_restored_from_the_persisted_cache(monkeypatch):
+    rows = [
+        geocoder.GeocodingCache(address_query=q, latitude=lat, longitude=lon, provider="nominatim")
+        for q, lat, lon in [
+            ("Ош, Кыргызстан", 40.5, 72.8),
+            ("Минск, Беларусь", 53.9, 27.6),
+            ("Бишкек, Кыргызстан", 42.9, 74.6),
+            ("Нигдеград, Армения", None, None),
+            ("Казахстан, Алматинская область, Алматы", 43.2, 76.9),
+        ]
+    ]
+
+    class Result:
+        def scalars(self):
+            return self
+
+        def all(self):
+            return rows
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, stmt):
+            return Result()
+
+    class Writer:
+        def start(self):
+            pass
+
+    monkeypatch.setattr(geocoder, "get_gazetteer", lambda: None)
+    monkeypatch.setattr(geocoder, "async_session_factory", Session)
+    monkeypatch.setattr(geocoder, "_cache", geocoder.LRUCache(maxsize=100))
+    monkeypatch.setattr(geocoder, "_cache_writer", Writer())
+    monkeypatch.setattr(geocoder, "_db_tier", dict(geocoder._db_tier))
+    monkeypatch.setattr(geocoder, "_cis_match_counts", Counter())
+
+    asyncio.run(geocoder.start_geocode_cache())
+    assert geocoder._cis_search_order()[:3] == ["Кыргызстан", "Беларусь", "Казахстан"]
+    assert sum(geocoder._cis_match_counts.values()) == 3
@@ -0,0 +1,112 @@
+import asyncio
+import copy
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.cache import LRUCache
+from app.services import llm_processing
+from app.services.llm_processing import _CACHED_FIELDS, VALID_TYPES, analyze_batch, analyze_ticket
+
+_TEXT_RE = re.compile(r"TICKET TEXT:\n(.*)")
+_BLOCK_RE = re.compile(r"### TICKET (t\d+)\n")
+
+TEXTS = [
+    "Не могу войти в приложение, пишет ошибку",
+    "Прошу сменить паспортные данные в профиле",
+    "С моего счёта списали деньги без моего ведома!!!",
+    "Сәлеметсіз бе, комиссия туралы сұрақ бар",
+    "Спасибо за быструю помощь с выводом средств",
+    "Когда зачислят дивиденды по акциям?",
+    "Верните комиссию за прошлый месяц, это претензия",
+]
+
+
+def _answer(text: str) -> dict:
+    """What the fake model says about one ticket; depends on the ticket text only."""
+    return {
+        "type": VALID_TYPES[len(text) % 6],
+        "sentiment": "Негативный" if "!" in text else "Нейтральный",
+        "sentiment_confidence": 0.5 + (len(text) % 5) / 10,
+        "language_label": "KZ" if "Сәлем" in text else "RU",
+        "language_actual": "kazakh" if "Сәлем" in text else "russian",
+        "language_is_mixed": False,
+        "language_note": None,
+        "summary": text[:30],
+        "explanation": f"Длина {len(text)}",
+        "attachment_analysis": None,
+        "needs_data_change": 1 if "паспорт" in text else 0,
+    }
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Fake _call_openrouter plus an empty result cache. `calls` lists the request kinds
+    made; answers for texts in `drop` are left out of packed responses."""
+    fake = SimpleNamespace(calls=[], drop=set())
+
+    async def fake_call(messages, model=None, max_tokens=1000, kind="analysis"):
+        prompt = messages[-1]["content"]
+        fake.calls.append(kind)
+        if kind != "analysis_packed":
+            return _answer(_TEXT_RE.search(prompt).group(1))
+        parts = _BLOCK_RE.split(prompt)
+        results = []
+        for ticket_id, block in zip(parts[1::2], parts[2::2]):
+            text = _TEXT_RE.search(block).group(1)
+            if text not in fake.drop:
+                results.append({"id": ticket_id, **_answer(text)})
+        return {"results": results}
+
+    monkeypatch.setattr(llm_processing, "_call_openrouter", fake_call)
+    monkeypatch.setattr(llm_processing, "_cache", LRUCache(maxsize=1000))
+    return fake
+
+
+def _tickets():
+    tickets = [
+        {"csv_row_index": i, "description_anonymized": text, "age": 30 + i, "segment": "Mass"}
+        for i, text in enumerate(TEXTS)
+    ]
+    tickets.append({**tickets[0], "csv_row_index": len(tickets)})  # duplicate body
+    tickets.append({"csv_row_index": len(tickets), "description_anonymized": "Купите слона", "is_spam": True, "type": "Спам"})
+    return tickets
+
+
+def _fields(tickets):
+    return [{f: t.get(f) for f in _CACHED_FIELDS} for t in tickets]
+
+
+def _single_path(tickets):
+    async def run():
+        for t in tickets:
+            if not t.get("is_spam"):
+                await analyze_ticket(t, uploads_dir="/nonexistent")
+        return tickets
+
+    return asyncio.run(run())
+
+
+def test_packed_batch_matches_single_ticket_calls(llm, monkeypatch):
+    expected = _single_path(_tickets())
+    single_calls = len(llm.calls)
+    monkeypatch.setattr(llm_processing, "_cache", LRUCache(maxsize=1000))
+    llm.calls.clear()
+
+    got = asyncio.run(analyze_batch(_tickets(), uploads_dir="/nonexistent", batch_size=4))
+    assert _fields(got) == _fields(expected)
+    # 7 distinct bodies: one group of 4 and one of 3; the duplicate and the spam ticket cost nothing.
+    assert llm.calls == ["analysis_packed"] * 2
+    assert single_calls == 7  # the duplicate body is a cache hit on the single path too
+
+
+def test_items_missing_from_a_packed_answer_fall_back_to_single_calls(llm, monkeypatch):
+    expected = _single_path(_tickets())
+    monkeypatch.setattr(llm_processing, "_cache", LRUCache(maxsize=1000))
+    llm.calls.clear()
+    llm.drop.add(TEXTS[2])
+
+    got = asyncio.run(analyze_batch(_tickets(), uploads_dir="/nonexistent", batch_size=4))
+    assert _fields(got) == _fields(expected)
+    assert llm.calls.count("analysis") == 1
@@ -0,0 +1,102 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.models.models import Ticket
+from app.services import pipeline_writer
+from app.services.pipeline_writer import PipelineWriter, TicketWrites
+
+
+class _Session:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, *args, **kwargs):
+        pass
+
+    async def commit(self):
+        if self.fail:
+            raise RuntimeError("deadlock detected")
+        self.committed = True
+
+
+@pytest.fixture
+def db(monkeypatch):
+    sessions, events = [], []
+
+    def use(fail=False):
+        def factory():
+            sessions.append(_Session(fail))
+            return sessions[-1]
+
+        monkeypatch.setattr(pipeline_writer, "async_session_factory", factory)
+
+    async def send_update(**event):
+        events.append(event)
+
+    monkeypatch.setattr(pipeline_writer.sse_manager, "send_update", send_update)
+    return use, sessions, events
+
+
+def _writes(announced: list) -> TicketWrites:
+    writes = TicketWrites(Ticket(id=uuid.uuid4(), csv_row_index=7, is_spam=False))
+
+    async def announce():
+        announced.append(writes.ticket.id)
+
+    writes.on_commit(announce)
+    return writes
+
+
+def test_tickets_are_announced_after_commit(db):
+    use, sessions, events = db
+    use()
+    announced = []
+    batch = [_writes(announced), _writes(announced)]
+
+    asyncio.run(PipelineWriter(uuid.uuid4())._persist(batch))
+    assert sessions[0].committed
+    assert announced == [w.ticket.id for w in batch]
+    assert events == []
+
+
+def test_failed_flush_reports_tickets_instead_of_announcing_them(db):
+    use, sessions, events = db
+    use(fail=True)
+    announced = []
+    writer = PipelineWriter(uuid.uuid4())
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(writer._persist([_writes(announced)]))
+    assert announced == []
+    assert [(e["stage"], e["status"]) for e in events] == [("enrichment", "failed")]
+    assert writer.committed == 0
+
+
+def test_one_bad_ticket_does_not_lose_the_rest_of_the_batch(db, monkeypatch):
+    _, _, events = db
+    announced = []
+    batch = [_writes(announced) for _ in range(4)]
+    bad = batch[2].ticket.id
+
+    class _Picky(_Session):
+        async def execute(self, stmt, params=None):
+            if isinstance(params, list) and any(p.get("ticket_pk") == bad for p in params):
+                self.fail = True
+
+    monkeypatch.setattr(pipeline_writer, "async_session_factory", lambda: _Picky(False))
+    writer = PipelineWriter(uuid.uuid4())
+
+    asyncio.run(writer._persist(batch))
+    assert announced == [w.ticket.id for w in batch if w.ticket.id != bad]
+    assert [e["ticket_id"] for e in events] == [bad]
+    assert writer.committed == 3
+    assert writer.failed == 1
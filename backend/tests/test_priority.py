@@ -0,0 +1,109 @@
+import os
+import random
+
+import pytest
+
+from app.services.priority import (
+    FRAUD_SOFT_FLOOR,
+    SEGMENT_PRIORITY_SCORE,
+    TYPE_PRIORITY_SCORE,
+    build_repeat_counter,
+    compute_priority,
+    score_batch,
+    scoring_input,
+)
+
+from app.services.pipeline import _PRIORITY_FIELDS
+from app.services.ticket_store import TicketStore
+
+from tests.bench import best_of, report
+
+# FIRE_BENCH_MAX_ROWS=1000000 runs the benchmark at the 1M rows of the original request.
+BENCH_ROWS = int(os.environ.get("FIRE_BENCH_MAX_ROWS", "100000"))
+
+
+def _tickets(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "csv_row_index": i,
+            "guid": f"g{rng.randint(0, max(1, n // 3))}",
+            "segment": rng.choice(list(SEGMENT_PRIORITY_SCORE) + ["Неизвестно"]),
+            "type": rng.choice(list(TYPE_PRIORITY_SCORE) + [None]),
+            "sentiment": rng.choice(["Негативный", "Нейтральный", "Позитивный", None]),
+            "age": rng.choice([None, 18, 29, 30, 41, 52, 70]),
+            "country": rng.choice([None, "Казахстан", " Узбекистан ", "Россия"]),
+            "is_spam": rng.random() < 0.05,
+            "priority_breakdown": None,
+        }
+        for i in range(n)
+    ]
+
+
+def _expected(tickets: list[dict]) -> list[dict]:
+    guid_counts = build_repeat_counter([t.get("guid") for t in tickets])
+    return [
+        compute_priority(
+            segment=t["segment"],
+            ticket_type=t["type"] or "Консультация",
+            sentiment=t["sentiment"] or "Нейтральный",
+            age=t["age"],
+            country=t["country"],
+            csv_row_index=t["csv_row_index"],
+            total_rows=len(tickets),
+            guid_counts=guid_counts,
+            guid=t.get("guid"),
+        )
+        for t in tickets
+    ]
+
+
+def _scored(tickets: list[dict]) -> list[dict]:
+    return [r["priority"] for r in score_batch(*scoring_input(tickets)).results()]
+
+
+def test_score_batch_matches_compute_priority():
+    for seed, n in ((0, 2_000), (1, 37), (2, 2)):
+        tickets = _tickets(n, seed)
+        scored = _scored(tickets)
+        expected = _expected(tickets)
+        assert scored == expected
+        # bit for bit, including the int fraud floor
+        assert [type(s["final"]) for s in scored] == [type(e["final"]) for e in expected]
+    assert any(s["final"] == FRAUD_SOFT_FLOOR and s["fraud_floor_applied"] for s in _scored(_tickets(2_000)))
+
+
+def test_single_row_keeps_the_int_fifo_bonus():
+    tickets = _tickets(1)
+    assert _scored(tickets) == _expected(tickets)
+    assert type(_scored(tickets)[0]["extra_fifo"]) is int
+
+
+def test_spam_tickets_keep_their_breakdown():
+    tickets = _tickets(10)
+    tickets[3].update(is_spam=True, priority_breakdown={"final": 1.0})
+    scored = _scored(tickets)
+    assert scored[3] == {"final": 1.0}
+    assert scored[:3] + scored[4:] == (_expected(tickets)[:3] + _expected(tickets)[4:])
+    assert _scored([]) == []
+
+
+@pytest.mark.benchmark
+def test_score_batch_benchmark():
+    tickets = _tickets(BENCH_ROWS)
+    columns, kept = scoring_input(tickets)
+    scoring = best_of(score_batch, columns, kept, repeat=2)
+    scores = score_batch(columns, kept)
+    store = TicketStore(tickets)
+    storing = best_of(lambda: store.apply(scores.results(), _PRIORITY_FIELDS), repeat=1)
+    report(f"score_batch {BENCH_ROWS} rows", scoring=scoring, storing=storing)
+    # about 1 us per row for the vectorised part; the per-row dicts cost more and are paid only when stored
+    assert scoring < BENCH_ROWS * 3e-6
+
+
+def test_blank_and_missing_guids_are_counted_like_build_repeat_counter():
+    tickets = _tickets(5)
+    for t, guid in zip(tickets, ["a", None, None, "a", "b"]):
+        t["guid"] = guid
+    del tickets[4]["guid"]  # no guid column at all
+    assert _scored(tickets) == _expected(tickets)
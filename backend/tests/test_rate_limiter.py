@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core import rate_limiter
+from app.core.rate_limiter import AdaptiveLimiter
+
+
+def test_latency_baseline_forgets_an_old_fast_response():
+    limiter = AdaptiveLimiter("test", initial=10, max_limit=64)
+    now = 0.0
+    limiter._on_success(now, "analysis", 100.0)  # one lucky response
+    for _ in range(rate_limiter._BASELINE_SAMPLES):
+        now += 10
+        limiter._on_success(now, "analysis", 400.0)
+    before = limiter.limit
+    for _ in range(20):
+        now += 10
+        limiter._on_success(now, "analysis", 400.0)
+    # Steady 400 ms is the new normal: the window grows again instead of shrinking.
+    assert limiter.limit > before
+
+
+def test_slow_drift_still_shrinks_the_window():
+    limiter = AdaptiveLimiter("test", initial=10, latency_tolerance=2.0)
+    now = 0.0
+    for _ in range(10):
+        now += 10
+        limiter._on_success(now, "analysis", 100.0)
+    grown = limiter.limit
+    for _ in range(10):
+        now += 10
+        limiter._on_success(now, "analysis", 1000.0)
+    assert limiter.limit < grown
+
+
+def _run_slot(limiter, body):
+    async def run():
+        async with limiter.slot("spam") as slot:
+            await body(slot)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("error", [asyncio.CancelledError, KeyError])
+def test_abandoned_requests_are_not_successes(error):
+    limiter = AdaptiveLimiter("test")
+
+    async def body(slot):
+        raise error()
+
+    with pytest.raises(error):
+        _run_slot(limiter, body)
+    assert (limiter.successes, limiter.errors, limiter.in_flight) == (0, 0, 0)
+
+
+def test_transport_failures_and_observed_responses_are_recorded():
+    limiter = AdaptiveLimiter("test")
+
+    async def timeout(slot):
+        raise httpx.ReadTimeout("slow")
+
+    async def bad_body(slot):
+        slot.observe(httpx.Response(200))
+        raise ValueError("unparseable JSON")
+
+    with pytest.raises(httpx.ReadTimeout):
+        _run_slot(limiter, timeout)
+    with pytest.raises(ValueError):
+        _run_slot(limiter, bad_body)
+    assert (limiter.successes, limiter.errors) == (1, 1)
+
+
+def test_nominatim_limiter_follows_the_usage_policy():
+    limiter = rate_limiter.RateLimiterRegistry().get("nominatim")
+    assert limiter.max_rps == 1.0
+    assert limiter.limit == limiter.max_limit == 1
@@ -0,0 +1,34 @@
+import copy
+
+import pytest
+
+from app.services.routing import Router, route_batch
+
+from tests import reference_routing as reference
+from tests.factories import CITIES, make_managers, make_tickets
+
+
+def test_load_heaps_stay_bounded_in_a_long_lived_router():
+    managers = make_managers(40, seed=1)
+    router = Router(managers)
+    for round_ in range(10):
+        for ticket in make_tickets(500, seed=round_):
+            router.assign(ticket)
+    balancer = router._balancer
+    for key, heap in balancer._heaps.items():
+        assert len(heap) <= 2 * len(balancer._members[key])
+
+
+def _notes(tickets):
+    return {t["csv_row_index"]: (t.get("_geo_filter_note"), t.get("_skill_relaxation")) for t in tickets}
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_route_batch_matches_the_linear_reference(seed):
+    managers = make_managers(50, seed=seed, offices=CITIES + ["Офис без координат"])
+    tickets = make_tickets(1500, seed=seed)
+    fast, slow = copy.deepcopy(tickets), copy.deepcopy(tickets)
+
+    got = [(a["csv_row_index"], a["manager_id"], a.get("manager_load_after")) for a in route_batch(fast, managers)]
+    assert got == reference.route_batch(slow, managers)
+    assert _notes(fast) == _notes(slow)
@@ -0,0 +1,80 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.services import routing_engine
+from app.services.routing import Router
+
+from tests.factories import make_managers, make_tickets
+
+
+def _rows(n):
+    return [{"ticket_id": uuid.uuid4(), "manager_id": uuid.uuid4()} for _ in range(n)]
+
+
+def test_bad_row_does_not_lose_the_rest_of_the_batch(monkeypatch):
+    rows = _rows(4)
+    bad = rows[2]["ticket_id"]
+    stored = []
+
+    async def store(batch):
+        if any(r["ticket_id"] == bad for r in batch):
+            raise RuntimeError("violates foreign key constraint")
+        stored.extend(batch)
+
+    monkeypatch.setattr(routing_engine, "_store_assignments", store)
+    asyncio.run(routing_engine._persist_assignments(rows))
+    assert stored == [rows[0], rows[1], rows[3]]
+
+
+def test_batch_is_raised_for_retry_when_nothing_is_stored(monkeypatch):
+    async def store(batch):
+        raise RuntimeError("connection refused")
+
+    monkeypatch.setattr(routing_engine, "_store_assignments", store)
+    with pytest.raises(RuntimeError):
+        asyncio.run(routing_engine._persist_assignments(_rows(3)))
+
+
+def _engine(managers):
+    engine = routing_engine.RoutingEngine()
+    engine._router = Router(managers)
+    engine._stale = False
+    return engine
+
+
+def test_previews_do_not_book_load():
+    engine = _engine(make_managers(10, seed=3))
+    ticket = make_tickets(1, seed=3)[0] | {"type": "Жалоба"}
+    loads = dict(engine._router.loads)
+
+    preview = asyncio.run(engine.route(dict(ticket)))
+    assert engine._router.loads == loads
+    assert preview["manager_load_after"] == loads[preview["manager_id"]] + preview["difficulty"]
+
+    booked = asyncio.run(engine.route(dict(ticket), ticket_id=uuid.uuid4()))
+    assert booked["manager_id"] == preview["manager_id"]
+    assert engine._router.loads[booked["manager_id"]] == preview["manager_load_after"]
+
+
+def test_a_ticket_is_routed_once_until_its_row_is_stored(monkeypatch):
+    stored = []
+
+    async def persist(rows):
+        stored.extend(rows)
+
+    monkeypatch.setattr(routing_engine, "_persist_assignments", persist)
+    engine = _engine(make_managers(10, seed=4))
+    ticket, ticket_id = make_tickets(1, seed=4)[0] | {"type": "Жалоба"}, uuid.uuid4()
+
+    async def run():
+        first = await engine.route(dict(ticket), ticket_id=ticket_id)
+        loads = dict(engine._router.loads)
+        assert await engine.route(dict(ticket), ticket_id=ticket_id) is None
+        assert engine._router.loads == loads
+        await engine._writer.flush()
+        return first
+
+    assert asyncio.run(run())["manager_id"] == stored[0]["manager_id"]
+    assert len(stored) == 1 and not engine.is_unsaved(ticket_id)
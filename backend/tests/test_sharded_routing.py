@@ -0,0 +1,64 @@
+import asyncio
+import copy
+from collections import Counter
+
+from app.services.routing import DIFFICULTY, route_batch
+from app.services.sharded_routing import route_batch_sharded
+
+from tests.factories import CITIES, make_managers, make_tickets
+
+# One office without coordinates: its managers are outside the geo roster count.
+MANAGERS = make_managers(60, seed=3, offices=CITIES + ["Офис без координат"])
+
+
+async def _in_process(fn, arg_lists):
+    return [fn(*args) for args in arg_lists]
+
+
+def _route_both(tickets, n_shards):
+    serial, sharded = copy.deepcopy(tickets), copy.deepcopy(tickets)
+    expected = route_batch(serial, MANAGERS)
+    got = asyncio.run(route_batch_sharded(sharded, MANAGERS, n_shards, run_many=_in_process))
+    return serial, expected, sharded, got
+
+
+def _notes(tickets):
+    return {t["csv_row_index"]: (t.get("_geo_filter_note"), t.get("_skill_relaxation")) for t in tickets}
+
+
+def test_sharded_notes_match_route_batch():
+    # Spilled tickets are routed after the shards, so only the load-independent notes
+    # are expected to match on a batch with tickets lacking coordinates.
+    serial, expected, sharded, got = _route_both(make_tickets(2000, seed=3), n_shards=4)
+    assert _notes(sharded) == _notes(serial)
+    assert [a["csv_row_index"] for a in got] == [a["csv_row_index"] for a in expected]
+
+
+def test_single_shard_without_spill_matches_route_batch():
+    serial, expected, sharded, got = _route_both(make_tickets(2000, seed=4, located=1.0), n_shards=1)
+    assert got == expected
+    assert _notes(sharded) == _notes(serial)
+
+
+def _batch_loads(tickets, assignments):
+    difficulty = {t["csv_row_index"]: DIFFICULTY[t["type"]] for t in tickets}
+    loads = Counter()
+    for a in assignments:
+        if a.get("manager_id") is not None:
+            loads[a["manager_id"]] += difficulty[a["csv_row_index"]]
+    return loads
+
+
+def test_spill_routed_after_the_shards_stays_close_to_route_batch():
+    # ~30% of this batch spills (no coordinates, or offices past the cluster cap).
+    tickets = make_tickets(2000, seed=5)
+    serial, expected, sharded, got = _route_both(tickets, n_shards=4)
+    assert sum(a["manager_id"] is None for a in got) == sum(a["manager_id"] is None for a in expected)
+
+    # No manager ends more than a handful of tickets away from route_batch, and the
+    # busiest one by at most one ticket.
+    heaviest = max(d for d in DIFFICULTY.values() if d)
+    serial_loads, sharded_loads = _batch_loads(tickets, expected), _batch_loads(tickets, got)
+    drift = max(abs(serial_loads[m] - sharded_loads[m]) for m in serial_loads | sharded_loads)
+    assert drift <= 8 * heaviest
+    assert max(sharded_loads.values()) <= max(serial_loads.values()) + heaviest
@@ -0,0 +1,57 @@
+import copy
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.models import ManagerPositionEnum
+from app.services.geo_filtering import filter_candidates_by_skills
+from app.services.skills import manager_caps, presence, resolve_requirements, ticket_requirements
+
+from tests import reference_routing as reference
+from tests.factories import make_managers, make_tickets
+
+_POSITIONS = {
+    "Специалист": ManagerPositionEnum.специалист,
+    "Ведущий специалист": ManagerPositionEnum.ведущий_специалист,
+    "Главный специалист": ManagerPositionEnum.главный_специалист,
+}
+
+
+def _rosters(seed: int, count: int):
+    """Small random rosters, so that every relaxation step (and none) gets hit."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield make_managers(rng.randint(0, 6), seed=seed * 1000 + i)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_bitmask_skill_filter_matches_the_list_filters(seed):
+    tickets = make_tickets(40, seed=seed)
+    for managers in _rosters(seed, 150):
+        caps = [manager_caps(m) for m in managers]
+        present = presence(caps)
+        for ticket in tickets:
+            slow = copy.copy(ticket)
+            expected = reference.filter_by_skill(slow, managers)
+            required, note = resolve_requirements(*ticket_requirements(ticket), present)
+            if required is None:
+                # Router keeps everyone then; the list filter did the same
+                assert expected == managers
+                assert slow["_skill_relaxation"] == "Все требования сняты, подходящих менеджеров нет"
+            else:
+                assert [m for m, c in zip(managers, caps) if c & required == required] == expected
+                assert note == slow["_skill_relaxation"]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_db_candidate_filter_matches_the_list_filter(seed):
+    tickets = make_tickets(40, seed=seed)
+    for managers in _rosters(seed, 150):
+        candidates = [
+            SimpleNamespace(manager=SimpleNamespace(skills=m["skills"], position=_POSITIONS[m["position"]]))
+            for m in managers
+        ]
+        for t in tickets:
+            args = (t["segment"], t["type"], t["language_label"])
+            assert filter_candidates_by_skills(candidates, *args) == reference.filter_candidates_by_skills(candidates, *args)
@@ -0,0 +1,79 @@
+import asyncio
+import math
+
+import pytest
+
+from app.services import spam_prefiltering
+from app.services.spam_classifier import HashedLinearModel
+from app.services.spam_prefiltering import SpamResult, _local_check, detect_spam
+
+ORDINARY = "Здравствуйте, не могу войти в приложение после обновления, помогите пожалуйста"
+
+
+def _constant_model(p: float) -> HashedLinearModel:
+    """A 'trained' model that gives every text probability p."""
+    return HashedLinearModel(bias=math.log(p / (1 - p)), weights={1: 0.0})
+
+
+@pytest.fixture
+def model(monkeypatch):
+    def use(value):
+        monkeypatch.setattr(spam_prefiltering, "get_spam_model", lambda: value)
+
+    return use
+
+
+def test_without_trained_model_the_llm_decides(model, monkeypatch):
+    model(None)
+    assert _local_check(ORDINARY) is None
+
+    asked = []
+
+    async def fake_llm(text):
+        asked.append(text)
+        return SpamResult(False, 0.15, "LLM")
+
+    monkeypatch.setattr(spam_prefiltering, "_llm_check", fake_llm)
+    assert asyncio.run(detect_spam(ORDINARY)).reason == "LLM"
+    assert asked == [ORDINARY]
+
+
+@pytest.mark.parametrize("p, expected", [(0.02, False), (0.97, True), (0.905, True)])
+def test_trained_model_decides_outside_the_band(model, p, expected):
+    model(_constant_model(p))
+    result = _local_check(ORDINARY)
+    assert result is not None
+    assert result.is_spam is expected
+
+
+@pytest.mark.parametrize("p", [0.10, 0.5, 0.89])
+def test_trained_model_defers_inside_the_band(model, p):
+    model(_constant_model(p))
+    assert _local_check(ORDINARY) is None
+
+
+def test_seed_weights_are_not_used_for_verdicts(monkeypatch, tmp_path):
+    monkeypatch.setattr(spam_prefiltering, "DEFAULT_MODEL_PATH", tmp_path / "missing.json")
+    spam_prefiltering.get_spam_model.cache_clear()
+    try:
+        assert spam_prefiltering.get_spam_model() is None
+    finally:
+        spam_prefiltering.get_spam_model.cache_clear()
+
+
+def test_shipped_weights_decide_without_the_llm():
+    spam_prefiltering.get_spam_model.cache_clear()
+    try:
+        assert spam_prefiltering.get_spam_model() is not None
+
+        ordinary = _local_check(ORDINARY)
+        assert ordinary is not None and ordinary.is_spam is False
+
+        # Unlike a plain request, an advert is never waved through: spam or ask the LLM.
+        promo = _local_check(
+            "Выгодное предложение на сварочные агрегаты ET-Welding. Поможем подобрать "
+            "оборудование, в наличии на складе.\n⠀⠀⠀⠀⠀⠀⠀⠀\nhttps://et-welding.example.com/catalog"
+        )
+        assert promo is None or promo.is_spam is True
+    finally:
+        spam_prefiltering.get_spam_model.cache_clear()
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from app.services.pipeline import _PRIORITY_FIELDS, _ROUTING_FIELDS
+from app.services.ticket_store import TicketStore
+
+from tests.bench import best_of, report
+
+# FIRE_BENCH_MAX_ROWS=1000000 extends the scaling run to the 1M rows of the original request.
+MAX_ROWS = int(os.environ.get("FIRE_BENCH_MAX_ROWS", "100000"))
+
+
+def _tickets(n: int) -> list[dict]:
+    return [{"csv_row_index": i, "priority": None, "assigned_manager_id": None} for i in range(n)]
+
+
+def _stage_results(n: int):
+    priorities = [{"csv_row_index": i, "priority": {"final": i % 10}} for i in range(n - 1, -1, -1)]
+    routing = [
+        {"csv_row_index": i, "manager_id": i % 50, "manager_name": "М", "office": "Алматы", "explanation": ""}
+        for i in range(n)
+    ]
+    return priorities, routing
+
+
+def _merge(tickets, priorities, routing):
+    store = TicketStore(tickets)
+    store.apply(priorities, _PRIORITY_FIELDS)
+    store.apply(routing, _ROUTING_FIELDS)
+    return store
+
+
+def test_apply_writes_results_by_row_and_skips_unknown_rows():
+    store = TicketStore(_tickets(3))
+    updated = store.apply([{"csv_row_index": 2, "priority": 7}, {"csv_row_index": 99, "priority": 1}], _PRIORITY_FIELDS)
+    assert updated == 1
+    assert [t["priority"] for t in store] == [None, None, 7]
+
+
+def test_duplicate_rows_are_rejected():
+    with pytest.raises(ValueError):
+        TicketStore([{"csv_row_index": 1}, {"csv_row_index": 1}])
+
+
+def test_stage_results_are_merged_by_row():
+    store = _merge(_tickets(10), *_stage_results(10))
+    assert [t["priority"]["final"] for t in store] == [i % 10 for i in range(10)]
+    assert [t["assigned_manager_id"] for t in store] == [i % 50 for i in range(10)]
+
+
+@pytest.mark.benchmark
+def test_stage_merge_time_grows_linearly():
+    sizes = [n for n in (1_000, 10_000, 100_000, 1_000_000) if n <= MAX_ROWS]
+    per_row = {}
+    for n in sizes:
+        priorities, routing = _stage_results(n)
+        seconds = best_of(lambda: _merge(_tickets(n), priorities, routing), repeat=2)
+        per_row[n] = seconds / n
+        report(f"TicketStore merge {n} rows ({per_row[n] * 1e6:.2f} us/row)", total=seconds)
+    # Quadratic merging would make the per-row cost grow 10x per size step.
+    assert per_row[sizes[-1]] < 4 * per_row[sizes[1]]
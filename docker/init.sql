@@ -105,6 +105,7 @@ CREATE TABLE IF NOT EXISTS tickets (
     text_length_times_age DOUBLE PRECISION,
     id_count_of_user INT DEFAULT 0,
     assigned_manager_id UUID REFERENCES managers(id),
+    batch_id UUID,
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
@@ -193,6 +194,18 @@ CREATE TABLE IF NOT EXISTS geocoding_cache (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- ============================================================
+-- LLM RESULT CACHE TABLE (content-addressed analyze_ticket output)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS llm_result_cache (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    cache_key VARCHAR(64) NOT NULL UNIQUE,
+    model VARCHAR(200),
+    prompt_version VARCHAR(32) NOT NULL,
+    result JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- ============================================================
 -- BATCH UPLOADS TABLE
 -- ============================================================
@@ -204,6 +217,7 @@ CREATE TABLE IF NOT EXISTS batch_uploads (
     failed_rows INT DEFAULT 0,
     status VARCHAR(50) DEFAULT 'pending',
     error_log JSONB DEFAULT '[]',
+    checkpoint JSONB,
     created_at TIMESTAMPTZ DEFAULT NOW(),
     completed_at TIMESTAMPTZ
 );
@@ -294,14 +308,17 @@ CREATE INDEX IF NOT EXISTS idx_tickets_is_spam ON tickets(is_spam);
 CREATE INDEX IF NOT EXISTS idx_tickets_guid ON tickets(guid);
 CREATE INDEX IF NOT EXISTS idx_tickets_csv_row ON tickets(csv_row_index);
 CREATE INDEX IF NOT EXISTS idx_tickets_assigned_manager ON tickets(assigned_manager_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_batch ON tickets(batch_id);
 CREATE INDEX IF NOT EXISTS idx_tickets_geo ON tickets USING GIST(geo_point);
 CREATE INDEX IF NOT EXISTS idx_managers_geo ON business_units USING GIST(geo_point);
 CREATE INDEX IF NOT EXISTS idx_processing_state_ticket ON processing_state(ticket_id);
 CREATE INDEX IF NOT EXISTS idx_processing_state_batch ON processing_state(batch_id);
 CREATE INDEX IF NOT EXISTS idx_ai_analysis_ticket ON ai_analysis(ticket_id);
 CREATE INDEX IF NOT EXISTS idx_pii_mappings_ticket ON pii_mappings(ticket_id);
-CREATE INDEX IF NOT EXISTS idx_assignments_ticket ON assignments(ticket_id);
+-- One assignment per ticket: online routing inserts with ON CONFLICT (ticket_id) DO NOTHING.
+CREATE UNIQUE INDEX IF NOT EXISTS uq_assignments_ticket ON assignments(ticket_id);
 CREATE INDEX IF NOT EXISTS idx_assignments_manager ON assignments(manager_id);
+CREATE INDEX IF NOT EXISTS idx_llm_result_cache_prompt ON llm_result_cache(prompt_version);
 
 -- ============================================================
 -- RESTRICTED ROLE for MCP Server